@@ -0,0 +1,116 @@
+import traceback
+import weakref
+from typing import Set
+
+from django.apps import AppConfig
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+
+# the fields of a lot that the city map depends on
+CITY_FIELD_NAMES = {"location", "location_id", "pool", "pool_id"}
+
+
+class ApiV1Config(AppConfig):
+    name = 'api_v1'
+
+    def ready(self):
+        from locations.models import Location
+        from park_data.models import ParkingPool, ParkingLot
+        from park_data.signals import snapshot_stored
+
+        for model in (ParkingPool, Location):
+            post_save.connect(invalidate_city_map, sender=model)
+            post_delete.connect(invalidate_city_map, sender=model)
+
+        post_save.connect(invalidate_on_lot_change, sender=ParkingLot)
+        post_delete.connect(invalidate_on_lot_delete, sender=ParkingLot)
+
+        snapshot_stored.connect(materialize_city_lots_on_commit)
+
+
+def invalidate_city_map(sender, **kwargs):
+    from .cache import invalidate, CITY_MAP
+
+    invalidate(CITY_MAP)
+
+
+def invalidate_on_lot_change(sender, instance, created: bool, update_fields=None, **kwargs):
+    from .city_lots import invalidate_city_lots
+
+    # the fields as loaded from the database, see `ParkingLot.from_db`
+    previous_fields = getattr(instance, "_loaded_city_fields", (None, None))
+    fields = _lot_city_fields(instance)
+    city_fields_saved = update_fields is None or bool(CITY_FIELD_NAMES & set(update_fields))
+    # lots without location are not part of the city map
+    if city_fields_saved and (created or fields != previous_fields) and (fields[0] or previous_fields[0]):
+        invalidate_city_map(sender)
+    # any field of the lot can be part of the city lots
+    invalidate_city_lots({previous_fields[0], fields[0]})
+    if city_fields_saved:
+        instance._loaded_city_fields = fields
+
+
+def invalidate_on_lot_delete(sender, instance, **kwargs):
+    from .city_lots import invalidate_city_lots
+
+    invalidate_city_map(sender)
+    invalidate_city_lots({instance.__dict__.get("location_id")})
+
+
+def materialize_city_lots_on_commit(sender, pool_id: str, **kwargs):
+    # render from the committed data which also includes
+    #   the snapshots that other processes stored concurrently.
+    #   Each pool is rendered once per transaction.
+    connection = transaction.get_connection()
+    pending = _pending_city_lots.get(connection)
+    # django drops the callback on rollback, the reference is dead then
+    callback = pending() if pending is not None else None
+    if callback is not None:
+        callback.pool_ids.add(pool_id)
+        return
+
+    callback = _MaterializeCityLots(connection, pool_id)
+    _pending_city_lots[connection] = weakref.ref(callback)
+    transaction.on_commit(callback)
+
+
+# the pending callback of each connection, the pool ids are collected in the callback
+_pending_city_lots = weakref.WeakKeyDictionary()
+
+
+class _MaterializeCityLots:
+
+    def __init__(self, connection, pool_id: str):
+        self.connection = connection
+        self.pool_ids = {pool_id}
+
+    def __call__(self):
+        _pending_city_lots.pop(self.connection, None)
+        materialize_pools_city_lots(self.pool_ids)
+
+
+def materialize_pools_city_lots(pool_ids: Set[str]):
+    """
+    Update the v1 city lots of the pools, errors are logged
+    because the snapshots are already committed.
+    """
+    from park_data.models import log_error, ErrorLogSources
+    from .city_lots import materialize_pool_cities
+
+    for pool_id in sorted(pool_ids):
+        try:
+            materialize_pool_cities(pool_id)
+        except Exception as e:
+            log_error(
+                source=ErrorLogSources.store,
+                module_name="city_lots",
+                pool_id=pool_id,
+                text=f"{type(e).__name__}: {e}\n{traceback.format_exc()}",
+            )
+
+
+def _lot_city_fields(instance) -> tuple:
+    # the city map only depends on the location and pool of a lot.
+    #   Reading __dict__ does not load deferred fields
+    return instance.__dict__.get("location_id"), instance.__dict__.get("pool_id")
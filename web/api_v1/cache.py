@@ -0,0 +1,110 @@
+"""
+Precomputed response bodies of the v1 api.
+
+Each body is stored in the django cache under a key that contains
+a generation number. Changes to the underlying models increment the
+generation through the signals connected in `api_v1.apps`, so outdated
+bodies are not read again and expire after `settings.API_CACHE_SECONDS`.
+"""
+import hashlib
+import time
+from typing import Callable, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import renderers
+from rest_framework.response import Response
+
+
+CITY_MAP = "city-map"
+
+
+def get_generation(name: str) -> int:
+    key = f"api_v1:{name}:generation"
+    generation = cache.get(key)
+    if generation is None:
+        # start with a unique number so that bodies of a lost generation are not reused
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def invalidate(name: str):
+    """
+    Start a new generation of the cached body
+    """
+    key = f"api_v1:{name}:generation"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_cached(name: str, build: Callable[[], dict]) -> Tuple[bytes, str]:
+    """
+    Returns the rendered json and the ETag of the current
+    generation of a response, calling `build` if it's not cached.
+    """
+    key = f"api_v1:{name}:{get_generation(name)}"
+    entry = cache.get(key)
+    if entry is None:
+        content = renderers.JSONRenderer().render(build())
+        etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+        entry = (content, etag)
+        cache.set(key, entry, timeout=settings.API_CACHE_SECONDS)
+    return entry
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """
+    Returns True if the ETag is listed in the value of an `If-None-Match` header.
+
+    The header can contain a comma-separated list or `*`,
+    weak tags are compared by their opaque value.
+    """
+    etags = parse_etags(if_none_match or "")
+    if "*" in etags:
+        return True
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in etags)
+
+
+class PrerenderedResponse(Response):
+    """
+    A Response whose data has been rendered to json in advance.
+
+    The precomputed content is used if the json renderer has been
+    negotiated without indentation, otherwise the data is rendered as usual.
+    `data` can also be a callable that is only evaluated when accessed.
+    """
+    def __init__(
+            self,
+            data: Union[dict, Callable[[], dict]],
+            content: bytes,
+            etag: Optional[str] = None,
+            **kwargs,
+    ):
+        super().__init__(data, **kwargs)
+        self.prerendered_content = content
+        if etag:
+            self["ETag"] = etag
+
+    @property
+    def data(self):
+        if callable(self._data):
+            self._data = self._data()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, "accepted_renderer", None)
+        if type(renderer) is renderers.JSONRenderer and not renderer.get_indent(
+                self.accepted_media_type, getattr(self, "renderer_context", None) or {}
+        ):
+            self["Content-Type"] = renderer.media_type
+            return self.prerendered_content
+        return super().rendered_content
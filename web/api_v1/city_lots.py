@@ -0,0 +1,127 @@
+"""
+Materialized v1 responses of the lots of a city.
+
+The response of `CityLotsView` only changes when a snapshot is stored.
+It is rendered once the storing transaction is committed and kept in
+the `CityLots` table, so the view only needs to read one row.
+"""
+from typing import Iterable, Optional
+
+from rest_framework import renderers
+
+from park_data.models import ParkingLot
+from .models import CityLots
+
+
+LOT_TYPE_MAPPING = {
+    "lot": "Parkplatz",
+    "underground": "Tiefgarage",
+    "garage": "Parkhaus",
+    "level": "Parkebene",
+    "bus": "Busparkplatz",
+    "unknown": "unbekannt",
+}
+
+
+def build_city_lots(location_id: int) -> dict:
+    """
+    Build the v1 response of all lots at the location.
+
+    Uses 1 db query.
+    """
+    lot_qset = (
+        ParkingLot.objects
+        .filter(location_id=location_id)
+        .select_related("latest_data")
+        .order_by("lot_id")
+    )
+
+    api_lot_list = []
+    last_downloaded = None
+    last_updated = None
+
+    for lot in lot_qset:
+        if lot.geo_point:
+            lng, lat = lot.geo_point.tuple
+            coords = {"lat": lat, "lng": lng}
+        else:
+            coords = None
+
+        api_lot = {
+            "address": lot.address,
+            "coords": coords,
+            "forecast": False,  # TODO
+            # "free": None, if free is unkown, we don't return it
+            "id": lot.lot_id,
+            "lot_type": LOT_TYPE_MAPPING.get(lot.type, "unbekannt"),
+            "name": lot.name,
+            "region": None,  # TODO
+            "state": None,
+            # ParkAPI v1 requires total, so we return 0 if unknown
+            "total": lot.max_capacity if lot.max_capacity else 0,
+        }
+        if lot.latest_data:
+            api_lot.update({
+                "state": lot.latest_data.status,
+            })
+            if lot.latest_data.num_free is not None:
+                api_lot["free"] = lot.latest_data.num_free
+            if lot.latest_data.capacity is not None:
+                api_lot["total"] = lot.latest_data.capacity
+
+            if last_downloaded is None or lot.latest_data.timestamp > last_downloaded:
+                last_downloaded = lot.latest_data.timestamp
+            if last_updated is None or (
+                    lot.latest_data.lot_timestamp and lot.latest_data.lot_timestamp > last_updated
+            ):
+                last_updated = lot.latest_data.lot_timestamp
+
+        api_lot_list.append(api_lot)
+
+    return {
+        "last_downloaded": last_downloaded,
+        # v1 schema requires last_updated to be set. If it's not available,
+        # we fall back to (somewhat misleading) last_downloaded
+        "last_updated": last_updated if last_updated else last_downloaded,
+        "lots": api_lot_list,
+    }
+
+
+def materialize_city_lots(location_id: int) -> CityLots:
+    """
+    Build, render and store the v1 response of the lots at the location
+    """
+    data = build_city_lots(location_id)
+    city_lots, _ = CityLots.objects.update_or_create(
+        location_id=location_id,
+        defaults={
+            "last_downloaded": data["last_downloaded"],
+            "last_updated": data["last_updated"],
+            "content": renderers.JSONRenderer().render(data),
+        },
+    )
+    return city_lots
+
+
+def materialize_pool_cities(pool_id: str):
+    """
+    Update the v1 responses of all cities that contain lots of the pool
+    """
+    location_ids = (
+        ParkingLot.objects
+        .filter(pool__pool_id=pool_id, location__isnull=False)
+        .order_by("location_id")
+        .values_list("location_id", flat=True)
+        .distinct()
+    )
+    for location_id in location_ids:
+        materialize_city_lots(location_id)
+
+
+def invalidate_city_lots(location_ids: Iterable[Optional[int]]):
+    """
+    Remove the stored responses, they are built again on the next request
+    """
+    location_ids = [location_id for location_id in location_ids if location_id]
+    if location_ids:
+        CityLots.objects.filter(location_id__in=location_ids).delete()
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.9 on 2026-10-17 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('locations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityLots',
+            fields=[
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='v1_city_lots', serialize=False, to='locations.location', verbose_name='Location')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Last update')),
+                ('last_downloaded', models.DateTimeField(blank=True, help_text='Latest snapshot timestamp of the lots', null=True, verbose_name='Last downloaded')),
+                ('last_updated', models.DateTimeField(blank=True, help_text='Latest published timestamp of the lots', null=True, verbose_name='Last updated')),
+                ('content', models.BinaryField(help_text='The json response', verbose_name='Content')),
+            ],
+            options={
+                'verbose_name': 'v1 city lots',
+                'verbose_name_plural': 'v1 city lots',
+            },
+        ),
+    ]
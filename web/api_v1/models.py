@@ -0,0 +1,48 @@
+from django.utils.translation import gettext_lazy as _
+from django.db import models
+
+
+class CityLots(models.Model):
+    """
+    The rendered v1 response of all lots of a city.
+
+    It is updated after each stored snapshot that touches the lots
+    of the city, see `api_v1.city_lots`.
+    """
+
+    class Meta:
+        verbose_name = _("v1 city lots")
+        verbose_name_plural = _("v1 city lots")
+
+    location = models.OneToOneField(
+        verbose_name=_("Location"),
+        to="locations.Location",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="v1_city_lots",
+    )
+
+    date_updated = models.DateTimeField(
+        verbose_name=_("Last update"),
+        auto_now=True, editable=False,
+    )
+
+    last_downloaded = models.DateTimeField(
+        verbose_name=_("Last downloaded"),
+        help_text=_("Latest snapshot timestamp of the lots"),
+        null=True, blank=True,
+    )
+
+    last_updated = models.DateTimeField(
+        verbose_name=_("Last updated"),
+        help_text=_("Latest published timestamp of the lots"),
+        null=True, blank=True,
+    )
+
+    content = models.BinaryField(
+        verbose_name=_("Content"),
+        help_text=_("The json response"),
+    )
+
+    def __str__(self):
+        return str(self.location_id)
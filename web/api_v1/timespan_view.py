@@ -1,22 +1,28 @@
 import datetime
-from typing import Tuple
+import itertools
+import json
+import re
+from typing import Tuple, Iterable, Generator, Optional
 
 from django.utils.encoding import force_str
 from django.utils.translation import gettext_lazy as _
-from django.db.models import QuerySet
+from django.db.models import QuerySet, Q
+from django.http import StreamingHttpResponse
 
 from rest_framework import (
     views, renderers, generics, parsers, fields, serializers, pagination,
     exceptions, versioning
 )
-from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.schemas.openapi import AutoSchema
 import coreapi
 import coreschema
 
 from locations.models import Location
-from park_data.models import ParkingLot, ParkingPool, ParkingData, ParkingLotState
+from park_data.models import (
+    ParkingLot, ParkingPool, ParkingData, ParkingLotState, ParkingDataHourly, partition_start,
+    aggregate_parking_data, merge_rollup_values, rollup_end, ROLLUP_COLUMNS,
+)
 
 
 class ParkingDataV1Serializer(serializers.ModelSerializer):
@@ -38,17 +44,100 @@ class TimestampV1Pagination(pagination.BasePagination):
 
     TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 
-    def paginate_queryset(self, queryset, request, view=None):
-        date_from, date_to = self.get_timestamp_range(request)
-        return (
+    RESOLUTION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+    MIN_RESOLUTION = 60
+    MAX_RESOLUTION = 7 * 86400
+
+    def filter_timespan(
+            self,
+            queryset: QuerySet,
+            date_from: datetime.datetime,
+            date_to: datetime.datetime,
+    ) -> QuerySet:
+        return queryset.filter(
             # Note: original api did timestamp > date_from instead of >=
-            queryset.filter(timestamp__gte=date_from, timestamp__lt=date_to)
+            Q(timestamp__gte=date_from, timestamp__lt=date_to)
+            # rows stored with changes only that started before date_from,
+            #   they never span more than one partition
+            | Q(timestamp__gte=partition_start(date_from), timestamp__lt=date_from, last_seen__gte=date_from)
         )
 
-    def get_paginated_response(self, data):
-        return Response({
-            "data": data
-        })
+    def expand_rows(
+            self,
+            queryset: QuerySet,
+            date_from: datetime.datetime,
+            date_to: datetime.datetime,
+            chunk_size: int,
+    ) -> Generator[Tuple[datetime.datetime, Optional[int], Optional[int]], None, None]:
+        """
+        Yield (timestamp, num_free, capacity) of each row and, for rows
+        stored with changes only, at the end of it's interval (`last_seen`).
+
+        The rows are clipped to the requested time range and read
+        from a server-side cursor, `chunk_size` rows at a time.
+        """
+        rows = (
+            queryset
+            .values_list("timestamp", "last_seen", "num_free", "capacity")
+            .iterator(chunk_size=chunk_size)
+        )
+        for timestamp, last_seen, num_free, capacity in rows:
+            if timestamp < date_from:
+                timestamp = date_from
+            yield timestamp, num_free, capacity
+
+            if last_seen and timestamp < last_seen < date_to:
+                yield last_seen, num_free, capacity
+
+    def bucket_rows(
+            self,
+            lot_id: str,
+            date_from: datetime.datetime,
+            date_to: datetime.datetime,
+            resolution: int,
+    ) -> Generator[Tuple[datetime.datetime, int, float, int, Optional[int]], None, None]:
+        """
+        Yields (bucket start, min, mean, max of num_free, capacity) for each
+        bucket of `resolution` seconds, aligned to the unix epoch, that contains data.
+
+        A row is counted once in every hour that it covers (or every bucket,
+        for resolutions that are not a multiple of an hour), like in the
+        rollup tables. Full hours are read from the hourly rollups if
+        available and the remaining time is aggregated in the database.
+        """
+        lot_pk = ParkingLot.objects.filter(lot_id=lot_id).values_list("pk", flat=True).first()
+        if lot_pk is None:
+            return
+
+        step = 3600 if resolution % 3600 == 0 else resolution
+        rows = []
+        ranges = [(date_from, date_to)]
+        if step == 3600:
+            hours_start = _floor_seconds(date_from + datetime.timedelta(seconds=3599), 3600)
+            hours_end = min(_floor_seconds(date_to, 3600), rollup_end() or hours_start)
+            if hours_start < hours_end:
+                rows += list(
+                    ParkingDataHourly.objects
+                    .filter(lot_id=lot_pk, timestamp__gte=hours_start, timestamp__lt=hours_end)
+                    .values_list("timestamp", *ROLLUP_COLUMNS)
+                )
+                ranges = [(date_from, hours_start), (hours_end, date_to)]
+
+        for start, end in ranges:
+            if start < end:
+                rows += [row[1:] for row in aggregate_parking_data(start, end, step, lot_pk=lot_pk)]
+
+        rows.sort(key=lambda row: row[0])
+        for bucket, bucket_rows in itertools.groupby(rows, key=lambda row: _floor_seconds(row[0], resolution)):
+            values = dict(zip(ROLLUP_COLUMNS, merge_rollup_values([row[1:] for row in bucket_rows])))
+            if values["num_free_count"]:
+                yield (
+                    bucket,
+                    values["num_free_min"],
+                    values["num_free_sum"] / values["num_free_count"],
+                    values["num_free_max"],
+                    values["capacity_max"],
+                )
 
     def get_timestamp_range(self, request: Request) -> Tuple[datetime.datetime, datetime.datetime]:
         try:
@@ -69,6 +158,24 @@ class TimestampV1Pagination(pagination.BasePagination):
 
         return date_from, date_to
 
+    def get_resolution(self, request: Request) -> Optional[int]:
+        """
+        Returns the optional `resolution` parameter in seconds
+        """
+        value = request.query_params.get("resolution")
+        if not value:
+            return None
+
+        match = re.match(r"^(\d+)([smhd]?)$", value.strip())
+        seconds = int(match.group(1)) * self.RESOLUTION_UNITS[match.group(2)] if match else 0
+        if not self.MIN_RESOLUTION <= seconds <= self.MAX_RESOLUTION:
+            raise exceptions.ParseError(_(
+                "Error 400: 'resolution' must be a number of seconds or a duration "
+                "like '15m', '1h' or '1d' between 1 minute and 7 days"
+            ))
+
+        return seconds
+
     def get_paginated_response_schema(self, schema):
         return {
             'type': 'object',
@@ -99,6 +206,19 @@ class TimestampV1Pagination(pagination.BasePagination):
                     pattern=r"\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\d"
                 )
             ),
+            coreapi.Field(
+                name="resolution",
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title=force_str(_("resolution")),
+                    description=force_str(_(
+                        "Return the minimum, mean and maximum of free spaces per time bucket "
+                        "instead of each snapshot, in seconds or e.g. '15m', '1h', '1d'"
+                    )),
+                    pattern=r"\d+[smhd]?",
+                )
+            ),
             # Note: for simplicity attach the version parameter here instead of
             #   overloading the view's Schema class
             coreapi.Field(
@@ -120,26 +240,141 @@ class TimespanView(generics.ListAPIView):
     pagination_class = TimestampV1Pagination
     versioning_class = TimespanVersioning
     queryset: QuerySet = ParkingData.objects.all()
+    # number of rows fetched from the database cursor at once
+    chunk_size = 2000
 
     def get_queryset(self):
-        version, versioning = self.determine_version(self.request)
-
-        if version == "1.0":
-            # TODO: original 1.0 response is hard to implement cleanly
-            #   with the ListApiView. It should actually be another
-            #   View class. But how to dispatch to different views
-            #   by query parameter?
-            return self.queryset.none()
-
-        elif version == "1.1":
-            return (
-                # Note: the <city> url part is ignored
-                self.queryset.filter(lot__lot_id=self.kwargs["lot_id"])
-                # Note: original api response is not sorted
-                .order_by("timestamp")
+        return (
+            # Note: the <city> url part is ignored
+            self.queryset.filter(lot__lot_id=self.kwargs["lot_id"])
+            # Note: original api response is not sorted
+            .order_by("timestamp")
+        )
+
+    def list(self, request: Request, *args, **kwargs):
+        """
+        Streams the json response while reading the rows,
+        so the memory does not grow with the length of the time range.
+        """
+        date_from, date_to = self.paginator.get_timestamp_range(request)
+        resolution = self.paginator.get_resolution(request)
+        queryset = self.paginator.filter_timespan(self.get_queryset(), date_from, date_to)
+
+        if resolution:
+            buckets = self.paginator.bucket_rows(self.kwargs["lot_id"], date_from, date_to, resolution)
+            if request.version == "1.1":
+                content = iter_timespan_buckets_json_v1_1(buckets, chunk_size=self.chunk_size)
+                return StreamingHttpResponse(content, content_type="application/json")
+
+            # the 1.0 response contains the mean of each bucket
+            rows = ((bucket, mean, capacity) for bucket, _min, mean, _max, capacity in buckets)
+        else:
+            rows = self.paginator.expand_rows(queryset, date_from, date_to, chunk_size=self.chunk_size)
+
+        if request.version == "1.0":
+            max_capacity = (
+                ParkingLot.objects
+                .filter(lot_id=self.kwargs["lot_id"])
+                .values_list("max_capacity", flat=True)
+                .first()
             )
+            content = iter_timespan_json_v1_0(rows, max_capacity, chunk_size=self.chunk_size)
+
+        elif request.version == "1.1":
+            content = iter_timespan_json_v1_1(rows, chunk_size=self.chunk_size)
 
         else:
             raise exceptions.ParseError(_(
                 "Error 400: invalid API version, expecting one of '1.0', '1.1'"
             ))
+
+        return StreamingHttpResponse(content, content_type="application/json")
+
+
+def iter_timespan_json_v1_0(
+        rows: Iterable[Tuple[datetime.datetime, Optional[int], Optional[int]]],
+        max_capacity: Optional[int],
+        chunk_size: int,
+) -> Generator[bytes, None, None]:
+    """
+    Yields the original 1.0 response which maps each timestamp
+    to the percentage of occupied spaces, e.g.
+
+        {"version": 1.0, "data": {"2015-06-26T18:00:00": 61}}
+
+    The percentage is null if the number of free spaces
+    or the capacity are unknown.
+    """
+    def _encode(row):
+        timestamp, num_free, capacity = row
+        capacity = capacity or max_capacity
+        percent = None
+        if num_free is not None and capacity:
+            percent = int(100 - num_free / capacity * 100)
+        return '"{}":{}'.format(
+            timestamp.strftime(TimestampV1Pagination.TIMESTAMP_FORMAT), json.dumps(percent)
+        )
+
+    yield b'{"version":1.0,"data":{'
+    yield from _iter_json_items(rows, _encode, chunk_size)
+    yield b'}}'
+
+
+def iter_timespan_json_v1_1(
+        rows: Iterable[Tuple[datetime.datetime, Optional[int], Optional[int]]],
+        chunk_size: int,
+) -> Generator[bytes, None, None]:
+    """
+    Yields the 1.1 response, the same json that
+    `ParkingDataV1Serializer` renders for each row.
+    """
+    def _encode(row):
+        timestamp, num_free, capacity = row
+        return '{{"timestamp":"{}","free":{}}}'.format(timestamp.isoformat(), json.dumps(num_free))
+
+    yield b'{"data":['
+    yield from _iter_json_items(rows, _encode, chunk_size)
+    yield b']}'
+
+
+def iter_timespan_buckets_json_v1_1(
+        buckets: Iterable[Tuple[datetime.datetime, int, float, int, Optional[int]]],
+        chunk_size: int,
+) -> Generator[bytes, None, None]:
+    """
+    Yields the 1.1 response with a `resolution`. The `free` value
+    is the rounded mean so that existing clients can read it.
+    """
+    def _encode(bucket):
+        timestamp, free_min, free_mean, free_max, capacity = bucket
+        return '{{"timestamp":"{}","free":{},"free_min":{},"free_mean":{},"free_max":{}}}'.format(
+            timestamp.isoformat(), round(free_mean), free_min, round(free_mean, 2), free_max,
+        )
+
+    yield b'{"data":['
+    yield from _iter_json_items(buckets, _encode, chunk_size)
+    yield b']}'
+
+
+def _floor_seconds(timestamp: datetime.datetime, seconds: int) -> datetime.datetime:
+    """
+    Floors the timestamp to a multiple of `seconds` since the unix epoch
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+    return epoch + datetime.timedelta(seconds=(timestamp - epoch).total_seconds() // seconds * seconds)
+
+
+def _iter_json_items(rows: Iterable, encode, chunk_size: int) -> Generator[bytes, None, None]:
+    """
+    Yields the comma-separated encoded rows, `chunk_size` rows per bytes object
+    """
+    parts = []
+    separator = ""
+    for row in rows:
+        parts.append(separator + encode(row))
+        separator = ","
+        if len(parts) >= chunk_size:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+    if parts:
+        yield "".join(parts).encode("utf-8")
@@ -1,4 +1,5 @@
 import datetime
+import json
 import posix
 from copy import deepcopy
 from typing import Dict
@@ -11,6 +12,9 @@ from rest_framework.schemas.openapi import AutoSchema
 from park_api.version import get_commit_hash
 from locations.models import Location
 from park_data.models import ParkingLot, ParkingPool, ParkingData, ParkingLotState
+from .cache import get_cached, etag_matches, PrerenderedResponse, CITY_MAP
+from .city_lots import materialize_city_lots
+from .models import CityLots
 
 
 COMMIT_HASH = get_commit_hash()
@@ -39,16 +43,6 @@ CITY_NAME_NOMINATIM_TO_LEGACY = {
 }
 
 
-LOT_TYPE_MAPPING = {
-    "lot": "Parkplatz",
-    "underground": "Tiefgarage",
-    "garage": "Parkhaus",
-    "level": "Parkebene",
-    "bus": "Busparkplatz",
-    "unknown": "unbekannt",
-}
-
-
 class StatusView(views.APIView):
 
     def get(self, request):
@@ -75,13 +69,17 @@ class CoffeeView(views.APIView):
 class CityMapView(views.APIView):
 
     def get(self, request: Request):
-
-        return Response({
+        content, etag = get_cached(CITY_MAP, lambda: {
             "api_version": "1.0",
             "server_version": "0.1.%s" % COMMIT_HASH[:8],
             "reference": "https://github.com/ParkenDD/ParkAPI2",
             "cities": self.city_mapping(),
         })
+        if etag_matches(etag, request.headers.get("If-None-Match")):
+            return Response(status=304, headers={"ETag": etag})
+
+        # the data is only decoded for other renderers
+        return PrerenderedResponse(lambda: json.loads(content), content, etag)
 
     @classmethod
     def city_mapping(cls) -> Dict:
@@ -89,6 +87,8 @@ class CityMapView(views.APIView):
         Return legacy 'meta' data per city.
 
         Uses 3 db queries to build the map of city name to city meta data.
+        The result is cached by the `get` method until a pool, location or
+        the location of a lot changes.
         The first lot location that matches the city name is merged
         with it's pool data to create the v1 city data.
 
@@ -154,65 +154,32 @@ class CityMapView(views.APIView):
 class CityLotsView(views.APIView):
 
     def get(self, request: Request, city: str):
-
+        """
+        Returns the materialized response of `api_v1.city_lots`
+        which is updated after each stored snapshot.
+        """
         location_qset = Location.objects.filter(city__iexact=CITY_NAME_LEGACY_TO_NOMINATIM.get(city, city))
-        if not location_qset.exists():
+
+        location_ids = list(location_qset.values_list("pk", flat=True)[:1])
+        if not location_ids:
             return Response({
                 "detail": f"Error 404: Sorry, '{city}' isn't supported at the current time."
             }, status=404)
 
         # currently there's only city-level locations
-        location_model = location_qset[0]
-
-        lot_qset = ParkingLot.objects.filter(location=location_model).order_by("lot_id")
-
-        api_lot_list = []
-        last_downloaded = None
-        last_updated = None
-
-        for lot in lot_qset:
-            if lot.geo_point:
-                lng, lat = lot.geo_point.tuple
-                coords = {"lat": lat, "lng": lng}
-            else:
-                coords = None
-
-            api_lot = {
-                "address": lot.address,
-                "coords": coords,
-                "forecast": False,  # TODO
-                # "free": None, if free is unkown, we don't return it
-                "id": lot.lot_id,
-                "lot_type": LOT_TYPE_MAPPING.get(lot.type, "unbekannt"),
-                "name": lot.name,
-                "region": None,  # TODO
-                "state": None,
-                # ParkAPI v1 requires total, so we return 0 if unknown
-                "total": lot.max_capacity if lot.max_capacity else 0,
-            }
-            if lot.latest_data:
-                api_lot.update({
-                    "state": lot.latest_data.status,
-                })
-                if lot.latest_data.num_free is not None:
-                    api_lot["free"] = lot.latest_data.num_free
-                if lot.latest_data.capacity is not None:
-                    api_lot["total"] = lot.latest_data.capacity
-
-                if last_downloaded is None or lot.latest_data.timestamp > last_downloaded:
-                    last_downloaded = lot.latest_data.timestamp
-                if last_updated is None or (
-                        lot.latest_data.lot_timestamp and lot.latest_data.lot_timestamp > last_updated
-                ):
-                    last_updated = lot.latest_data.lot_timestamp
-
-            api_lot_list.append(api_lot)
-
-        return Response({
-            "last_downloaded": last_downloaded,
-            # v1 schema requires last_updated to be set. If it's not available, 
-            # we fall back to (somewhat misleading) last_downloaded
-            "last_updated": last_updated if last_updated else last_downloaded,
-            "lots": api_lot_list,
-        })
+        location_id = location_ids[0]
+
+        city_lots = CityLots.objects.filter(location_id=location_id).first()
+        if city_lots is None:
+            city_lots = materialize_city_lots(location_id)
+
+        content = bytes(city_lots.content)
+        return PrerenderedResponse(
+            lambda: {
+                **json.loads(content),
+                "last_downloaded": city_lots.last_downloaded,
+                "last_updated": city_lots.last_updated,
+            },
+            content,
+        )
 
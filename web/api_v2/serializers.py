@@ -7,7 +7,7 @@ from .fields import *
 class ParkingPoolSerializer(serializers.ModelSerializer):
     class Meta:
         model = ParkingPool
-        exclude = ["id"]
+        exclude = ["id", "snapshot_hash", "snapshot_timestamp"]
 
     date_created = DateTimeField()
     date_updated = DateTimeField()
@@ -0,0 +1,272 @@
+import datetime
+import math
+import random
+import time
+import json
+from typing import List, Optional, Dict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from park_data.models import (
+    StoreMethod, StoreTransaction, TransactionMode, ParkingLotState, ParkingData, ErrorLog,
+)
+from park_api.management.commands.pa_scrape import store_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the store methods with synthetic snapshots in the test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-m", "--methods", nargs="+", type=str, choices=StoreMethod.choices,
+            default=list(StoreMethod.choices),
+            help="The store methods to compare"
+        )
+        parser.add_argument(
+            "-p", "--pools", type=int, default=1,
+            help="Number of pools, each pool creates one snapshot per cycle"
+        )
+        parser.add_argument(
+            "-l", "--lots", type=int, default=100,
+            help="Number of lots per snapshot"
+        )
+        parser.add_argument(
+            "-n", "--cycles", type=int, default=20,
+            help="Number of scrape cycles to store per method"
+        )
+        parser.add_argument(
+            "--change-rate", type=float, default=1.,
+            help="Fraction of lots whose number of free spaces changes in each cycle"
+        )
+        parser.add_argument(
+            "--changes-only", type=bool, nargs="?", default=False, const=True,
+            help="Store the snapshots with the changes-only mode"
+        )
+        parser.add_argument(
+            "--skip-unchanged", type=bool, nargs="?", default=False, const=True,
+            help="Skip snapshots that are equal to the previous snapshot of the pool"
+        )
+        parser.add_argument(
+            "-t", "--transaction", dest="transaction_mode", type=str,
+            choices=TransactionMode.choices, default=TransactionMode.snapshot,
+            help="Transaction mode, 'module' commits once per cycle and pool"
+        )
+        parser.add_argument(
+            "--json", dest="as_json", type=bool, nargs="?", default=False, const=True,
+            help="Print the results as json"
+        )
+        parser.add_argument(
+            "--keepdb", type=bool, nargs="?", default=False, const=True,
+            help="Keep the test database after benchmarking"
+        )
+
+    def handle(
+            self, *args, methods: List[str], pools: int, lots: int, cycles: int, change_rate: float,
+            changes_only: bool, skip_unchanged: bool, transaction_mode: str, as_json: bool, keepdb: bool, verbosity: int,
+            **options
+    ):
+        parameters = {
+            "pools": pools,
+            "lots": lots,
+            "cycles": cycles,
+            "change_rate": change_rate,
+            "changes_only": changes_only,
+            "skip_unchanged": skip_unchanged,
+            "transaction": transaction_mode,
+        }
+        results = []
+
+        if as_json:
+            verbosity = 0
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=verbosity, autoclobber=True, serialize=False, keepdb=keepdb,
+        )
+        try:
+            for method in methods:
+                result = benchmark_store_method(
+                    method=method, num_pools=pools, num_lots=lots, num_cycles=cycles,
+                    change_rate=change_rate, changes_only=changes_only, skip_unchanged=skip_unchanged,
+                    transaction_mode=transaction_mode,
+                )
+                results.append(result)
+                if not as_json:
+                    print(
+                        "{method:8} {lots:9,d} lots {rows:9,d} rows {seconds:8.3f} sec"
+                        " {lots_per_second:12,.1f} lots/sec"
+                        " {queries_per_snapshot:7.1f} queries/snapshot"
+                        " p50 {p50_ms:8.2f} ms p99 {p99_ms:8.2f} ms"
+                        " {errors:d} errors".format(**result)
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+
+        if as_json:
+            print(json.dumps({
+                "parameters": parameters,
+                "results": results,
+            }, indent=2))
+
+        num_errors = sum(result["errors"] for result in results)
+        if num_errors:
+            raise CommandError(f"{num_errors} errors while storing the snapshots, the timings are not valid")
+
+
+def benchmark_store_method(
+        method: str,
+        num_lots: int,
+        num_cycles: int,
+        num_pools: int = 1,
+        change_rate: float = 1.,
+        changes_only: bool = False,
+        skip_unchanged: bool = False,
+        transaction_mode: str = TransactionMode.snapshot,
+        seed: int = 23,
+) -> dict:
+    """
+    Store synthetic snapshots with the given method through
+    `pa_scrape.store_snapshots` and return number of lots,
+    written rows, timing, number of queries and number of errors.
+
+    `store_snapshots` logs errors instead of raising them, they
+    are counted in the `ErrorLog` table.
+
+    :param change_rate: float, fraction of lots that change
+        their number of free spaces between two cycles
+    """
+    rnd = random.Random(seed)
+    start_time = datetime.datetime(2022, 1, 1)
+    pool_ids = [f"benchmark-{method}-{i}" for i in range(num_pools)]
+    num_free_map = dict()
+
+    num_queries = 0
+
+    def _count_queries(execute, sql, params, many, context):
+        nonlocal num_queries
+        num_queries += 1
+        return execute(sql, params, many, context)
+
+    num_rows_before = _count_rows(pool_ids)
+    num_errors_before = _count_errors()
+
+    latencies = []
+    num_skipped = 0
+    store_transaction = StoreTransaction(transaction_mode)
+    with connection.execute_wrapper(_count_queries), store_transaction:
+        for i in range(num_cycles):
+            for pool_id in pool_ids:
+                snapshot = create_synthetic_snapshot(
+                    pool_id=pool_id,
+                    num_lots=num_lots,
+                    timestamp=start_time + datetime.timedelta(minutes=5 * i),
+                    rnd=rnd,
+                    num_free_map=num_free_map,
+                    change_rate=change_rate,
+                )
+                start = time.perf_counter()
+                num_skipped += store_snapshots(
+                    pool_id, [snapshot], store_transaction=store_transaction,
+                    method=method, changes_only=changes_only, skip_unchanged=skip_unchanged,
+                )
+                store_transaction.end_module()
+                latencies.append(time.perf_counter() - start)
+
+    seconds = sum(latencies)
+    lots = num_lots * len(latencies)
+    return {
+        "method": method,
+        "snapshots": len(latencies),
+        "skipped": num_skipped,
+        "lots": lots,
+        "rows": _count_rows(pool_ids) - num_rows_before,
+        "errors": _count_errors() - num_errors_before,
+        "seconds": seconds,
+        "lots_per_second": lots / seconds if seconds else 0.,
+        "queries": num_queries,
+        "queries_per_snapshot": num_queries / len(latencies) if latencies else 0.,
+        "commits": store_transaction.num_commits,
+        "p50_ms": percentile(latencies, 50) * 1000.,
+        "p99_ms": percentile(latencies, 99) * 1000.,
+    }
+
+
+def _count_rows(pool_ids: List[str]) -> int:
+    return ParkingData.objects.filter(lot__pool__pool_id__in=pool_ids).count()
+
+
+def _count_errors() -> int:
+    return ErrorLog.objects.aggregate(count=Sum("count"))["count"] or 0
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of the values, 0. for an empty list
+    """
+    if not values:
+        return 0.
+    values = sorted(values)
+    rank = math.ceil(percent / 100. * len(values))
+    return values[max(0, min(len(values), rank) - 1)]
+
+
+def create_synthetic_snapshot(
+        pool_id: str,
+        num_lots: int,
+        timestamp: datetime.datetime,
+        rnd: Optional[random.Random] = None,
+        num_free_map: Optional[Dict[str, int]] = None,
+        change_rate: float = 1.,
+) -> dict:
+    """
+    Create a snapshot in the shape of the scraper output
+    with random values.
+
+    :param num_free_map: optional dict, lot id -> previous number of free spaces.
+        If defined, only a fraction of `change_rate` lots get a new value.
+    """
+    rnd = rnd or random.Random()
+    timestamp = timestamp.isoformat()
+    lots = []
+    for i in range(num_lots):
+        lot_id = f"{pool_id}-lot-{i}"
+        capacity = 50 + (i * 37) % 500
+
+        if num_free_map is not None and lot_id in num_free_map and rnd.random() >= change_rate:
+            num_free = num_free_map[lot_id]
+        else:
+            num_free = rnd.randrange(capacity + 1)
+        if num_free_map is not None:
+            num_free_map[lot_id] = num_free
+
+        lots.append({
+            "id": lot_id,
+            "name": f"Lot {i}",
+            "type": "garage",
+            "public_url": None,
+            "source_url": None,
+            "address": None,
+            "capacity": capacity,
+            "has_live_capacity": False,
+            "latitude": 50. + i / 1000.,
+            "longitude": 10. + i / 1000.,
+            "timestamp": timestamp,
+            "lot_timestamp": None,
+            "status": ParkingLotState.OPEN,
+            "num_free": num_free,
+            "num_occupied": None,
+        })
+
+    return {
+        "pool": {
+            "id": pool_id,
+            "name": f"Pool {pool_id}",
+            "public_url": f"https://{pool_id}.example.com",
+            "source_url": None,
+            "attribution_license": None,
+            "attribution_url": None,
+            "attribution_contributor": None,
+        },
+        "lots": lots,
+    }
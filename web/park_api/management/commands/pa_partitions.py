@@ -0,0 +1,55 @@
+import datetime
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+
+from park_data.models import (
+    get_partitions, ensure_partitions, remove_partitions, partition_start,
+)
+
+
+class Command(BaseCommand):
+    help = 'Manage the monthly partitions of the parking data table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "command", type=str,
+            choices=["list", "create", "remove"],
+            help="'create' creates the partitions of the current and the next months"
+                 ", 'remove' removes the partitions older than --retention-months"
+        )
+        parser.add_argument(
+            "--months-ahead", type=int, default=2,
+            help="Number of future months to create partitions for"
+        )
+        parser.add_argument(
+            "--retention-months", type=int, default=None,
+            help="Keep the partitions of the current and the last N months"
+        )
+        parser.add_argument(
+            "--detach", type=bool, nargs="?", default=False, const=True,
+            help="Only detach the removed partitions instead of dropping them"
+        )
+
+    def handle(
+            self, *args, command: str, months_ahead: int, retention_months: Optional[int], detach: bool,
+            **options
+    ):
+        if command == "list":
+            for name, start, end in get_partitions():
+                print(f"{name} {start} - {end}")
+
+        elif command == "create":
+            for name in ensure_partitions(months_ahead=months_ahead):
+                print(f"created {name}")
+
+        elif command == "remove":
+            if retention_months is None:
+                raise CommandError("Need to specify --retention-months")
+
+            before = partition_start(datetime.datetime.utcnow())
+            for i in range(retention_months):
+                before = partition_start(before - datetime.timedelta(days=1))
+
+            for name in remove_partitions(before=before, detach_only=detach):
+                print(f"{'detached' if detach else 'dropped'} {name}")
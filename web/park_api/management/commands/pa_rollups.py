@@ -0,0 +1,58 @@
+import datetime
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min, Max, Count
+
+from park_data.models import (
+    ParkingDataHourly, ParkingDataDaily, update_rollups, rebuild_rollups, ROLLUP_DELAY,
+)
+
+
+class Command(BaseCommand):
+    help = 'Manage the hourly and daily rollups of the parking data table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "command", type=str,
+            choices=["list", "update", "rebuild"],
+            help="'update' aggregates all hours and days that completed since the last update"
+                 ", 'rebuild' aggregates everything since --since again."
+                 " Rows that are stored later for an already aggregated hour, e.g. by"
+                 " 'pa_scrape replay' or a scraper that delivers old timestamps, are"
+                 " not included by 'update', they require a 'rebuild --since'"
+        )
+        parser.add_argument(
+            "--since", type=str, default=None,
+            help="Date in iso-format, e.g. 2022-03-01, from which to rebuild the rollups"
+        )
+        parser.add_argument(
+            "--delay", type=float, default=ROLLUP_DELAY.total_seconds() / 60,
+            help="Minutes after the end of an hour until it is aggregated"
+        )
+
+    def handle(self, *args, command: str, since: Optional[str], delay: float, **options):
+        delay = datetime.timedelta(minutes=delay)
+
+        if command == "list":
+            for model in (ParkingDataHourly, ParkingDataDaily):
+                stats = model.objects.aggregate(count=Count("*"), first=Min("timestamp"), last=Max("timestamp"))
+                print(f"{model._meta.verbose_name}: {stats['count']:,d} rows", end="")
+                if stats["count"]:
+                    print(f", {stats['first']} - {stats['last']}", end="")
+                print()
+
+        elif command == "update":
+            num_hourly, num_daily = update_rollups(delay=delay)
+            print(f"created {num_hourly} hourly and {num_daily} daily rows")
+
+        elif command == "rebuild":
+            if since is None:
+                raise CommandError("Need to specify --since")
+            try:
+                since = datetime.datetime.fromisoformat(since)
+            except ValueError:
+                raise CommandError(f"Invalid --since '{since}', expected iso-format")
+
+            num_hourly, num_daily = rebuild_rollups(since, delay=delay)
+            print(f"created {num_hourly} hourly and {num_daily} daily rows")
@@ -1,19 +1,37 @@
+import io
 import sys
+import contextlib
+import datetime
 import glob
+import time
+import queue
+import functools
 import importlib
 import json
 import inspect
+import threading
 from pathlib import Path
 import subprocess
 import traceback
 from multiprocessing.pool import ThreadPool
-from typing import List, Dict, Type, Union, Generator
+from typing import List, Dict, Type, Union, Generator, Optional, Tuple
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import transaction, connection, close_old_connections
+from django.db.models import Max
 from django.conf import settings
 
-from park_data.models import store_snapshot, ErrorLog, ErrorLogSources
+from park_data.models import (
+    store_snapshot, StoreMethod, OnConflict, StoreTransaction, TransactionMode,
+    ErrorLog, ErrorLogSources, log_error, ParkingLot, ScrapeRun, ScrapeTask, ensure_partitions,
+    update_rollups, next_rollup_update,
+)
+from park_api.scraping import (
+    ScraperWorkerPool, ScrapeSchedule, ScrapeDurations, PoolListCache,
+    OutputFormat, output_to_snapshots,
+    SnapshotArchiveWriter, iter_archive, iter_replay, CircuitBreaker,
+    RunTelemetry, TaskTelemetry, iter_measured_output,
+)
 
 
 class Command(BaseCommand):
@@ -33,8 +51,9 @@ class Command(BaseCommand):
 
         parser.add_argument(
             "command", type=str,
-            choices=["list", "scrape"],
-            help="Command to execute"
+            choices=["list", "scrape", "serve", "replay"],
+            help="Command to execute. 'serve' keeps running and scrapes each pool"
+                 " every --interval seconds. 'replay' stores the outputs recorded with --archive"
         )
         parser.add_argument(
             "-p", "--pools", nargs="+", type=str,
@@ -51,31 +70,324 @@ class Command(BaseCommand):
             "-j", "--processes", type=int, default=1,
             help="Scrape in N parallel processes"
         )
+        parser.add_argument(
+            "-s", "--store-method", type=str, choices=StoreMethod.choices, default=StoreMethod.orm,
+            help="Method to store the snapshots in database, 'bulk' uses a constant number of queries"
+                 " per snapshot"
+        )
+        parser.add_argument(
+            "--changes-only", type=bool, nargs="?", default=False, const=True,
+            help="Only store a new data row if the values of a lot changed"
+                 ", otherwise extend the 'last_seen' timestamp of the previous row"
+        )
+        parser.add_argument(
+            "--skip-unchanged", type=bool, nargs="?", default=False, const=True,
+            help="Skip comparing the lots of a snapshot if it is equal to the previous snapshot"
+                 " of the pool and only extend the 'last_seen' timestamps of the previous rows"
+        )
+        parser.add_argument(
+            "--on-conflict", type=str, choices=OnConflict.choices, default=OnConflict.nothing,
+            help="What to do if a lot already has data for the same timestamp"
+                 ", e.g. when storing cached results again"
+        )
+        parser.add_argument(
+            "-t", "--transaction", dest="transaction_mode", type=str,
+            choices=TransactionMode.choices, default=TransactionMode.snapshot,
+            help="Store in one database transaction per snapshot, per scraper call"
+                 " or per --transaction-rows rows. 'none' commits each statement"
+        )
+        parser.add_argument(
+            "--transaction-rows", type=int, default=10000,
+            help="Number of rows after which a transaction is committed with '-t rows'"
+        )
+        parser.add_argument(
+            "-w", "--workers", type=bool, nargs="?", default=False, const=True,
+            help="Run the scrapers in persistent worker processes (N per module, see --processes)"
+                 " instead of starting a new process for each call."
+                 " A worker is replaced when a python file of its module changes"
+        )
+        parser.add_argument(
+            "--worker-max-jobs", type=int, default=None,
+            help="Replace a persistent worker process after this number of scraper calls"
+        )
+        parser.add_argument(
+            "-o", "--output-format", type=str, choices=OutputFormat.choices, default=OutputFormat.json,
+            help="Output format requested from the scrapers. 'jsonl' and 'msgpack' are stored"
+                 " while the scraper is still running"
+        )
+        parser.add_argument(
+            "-a", "--archive", type=str, default=None,
+            help="Record all scraper outputs to this file or directory"
+                 ", or the file or directory to read from with 'replay'"
+        )
+        parser.add_argument(
+            "--speed", type=float, default=1.,
+            help="Replay the recorded outputs N times faster than recorded, 0 for no waiting"
+        )
+        parser.add_argument(
+            "-i", "--interval", type=float, default=300,
+            help="Seconds between two scrapes of the same pool in 'serve' mode"
+        )
+        parser.add_argument(
+            "--list-interval", type=float, default=3600,
+            help="Seconds between two discoveries of the available pools in 'serve' mode"
+        )
+        parser.add_argument(
+            "--queue-size", type=int, default=10,
+            help="Maximum number of scraped but not yet stored results when scraping in parallel"
+        )
+        parser.add_argument(
+            "--module-timeout", type=float, default=600,
+            help="Seconds after which a call to a whole scraper module is killed"
+        )
+        parser.add_argument(
+            "--pool-timeout", type=float, default=120,
+            help="Seconds after which scraping a single pool is killed"
+        )
+        parser.add_argument(
+            "--breaker-threshold", type=int, default=5,
+            help="Number of consecutive failures after which a pool is only scraped"
+                 " with exponentially growing delays, 0 to disable"
+        )
+        parser.add_argument(
+            "--breaker-delay", type=float, default=300,
+            help="Seconds until the first probe scrape of a failing pool"
+        )
+        parser.add_argument(
+            "--breaker-max-delay", type=float, default=6 * 3600,
+            help="Maximum seconds between two probe scrapes of a failing pool"
+        )
+        parser.add_argument(
+            "--no-telemetry", type=bool, nargs="?", default=False, const=True,
+            help="Do not store the timings of each run and scraper call in the database"
+        )
+        parser.add_argument(
+            "--no-rollups", type=bool, nargs="?", default=False, const=True,
+            help="Do not aggregate the completed hours and days into the rollup tables"
+                 " after 'scrape' or while running 'serve'"
+        )
+        parser.add_argument(
+            "--no-list-cache", type=bool, nargs="?", default=False, const=True,
+            help="Always call the scraper modules to list the pools instead of using the cached"
+                 " list of a module when it's code has not changed"
+        )
+
+    def handle(
+            self,
+            *args,
+            command: str,
+            pools,
+            cache,
+            processes,
+            store_method: str,
+            changes_only: bool,
+            skip_unchanged: bool,
+            on_conflict: str,
+            transaction_mode: str,
+            transaction_rows: int,
+            workers: bool,
+            worker_max_jobs: Optional[int],
+            output_format: str,
+            archive: Optional[str],
+            speed: float,
+            interval: float,
+            list_interval: float,
+            queue_size: int,
+            module_timeout: float,
+            pool_timeout: float,
+            breaker_threshold: int,
+            breaker_delay: float,
+            breaker_max_delay: float,
+            no_telemetry: bool,
+            no_rollups: bool,
+            no_list_cache: bool,
+            verbosity: int,
+            **options
+    ):
+        options = ScrapeOptions(
+            pool_filter=pools,
+            caching=cache,
+            processes=processes,
+            store_method=store_method,
+            changes_only=changes_only,
+            skip_unchanged=skip_unchanged,
+            on_conflict=on_conflict,
+            store_transaction=StoreTransaction(transaction_mode, max_rows=transaction_rows),
+            output_format=output_format,
+            queue_size=queue_size,
+            module_timeout=module_timeout,
+            pool_timeout=pool_timeout,
+            rollups=not no_rollups and command in ("scrape", "serve"),
+            verbose=verbosity >= 2,
+        )
+        if workers:
+            options.workers = ScraperWorkerPool(processes=processes, verbose=options.verbose, max_jobs=worker_max_jobs)
+        if not no_list_cache:
+            options.list_cache = PoolListCache(settings.SCRAPE_STATE_PATH / "pools")
+        if archive and command in ("scrape", "serve"):
+            options.recorder = SnapshotArchiveWriter(archive)
+        if breaker_threshold > 0 and command in ("scrape", "serve"):
+            options.breaker = CircuitBreaker(
+                threshold=breaker_threshold, delay=breaker_delay, max_delay=breaker_max_delay,
+            )
+            load_breaker_history(options.breaker)
+        if not no_telemetry and command in ("scrape", "serve"):
+            options.telemetry = RunTelemetry(command, processes=processes, options={
+                "store_method": store_method,
+                "transaction": transaction_mode,
+                "output_format": output_format,
+                "workers": workers,
+                "changes_only": changes_only,
+                "skip_unchanged": skip_unchanged,
+            })
+
+        try:
+            if command == "list":
+                scraper_pools = dict()
+                for scraper_py in iter_scrapers():
+                    scraper_pools[scraper_py.parent.name] = run_scraper_process(
+                        path=scraper_py.parent, command="list", pool_filter=pools,
+                        caching=cache, workers=options.workers, timeout=module_timeout,
+                        verbose=options.verbose,
+                    )
+                print(json.dumps(scraper_pools, indent=2))
+                for module, pools in scraper_pools.items():
+                    if "error" in pools:
+                        exit(1)
+
+            elif command == "scrape":
+                if processes > 1:
+                    scrape_parallel(options)
+                else:
+                    scrape(options)
+
+            elif command == "serve":
+                serve(options, interval=interval, list_interval=list_interval)
+
+            elif command == "replay":
+                if not archive:
+                    raise CommandError("Need to specify the --archive to replay")
+                replay(options, archive, speed=speed)
 
-    def handle(self, *args, command: str, pools, cache, processes, verbosity: int, **options):
-        if command == "list":
-            scraper_pools = dict()
-            for scraper_py in iter_scrapers():
-                scraper_pools[scraper_py.parent.name] = run_scraper_process(
-                    path=scraper_py.parent, command="list", pool_filter=pools,
-                    caching=cache, verbose=verbosity >= 2,
-                )
-            print(json.dumps(scraper_pools, indent=2))
-            for module, pools in scraper_pools.items():
-                if "error" in pools:
-                    exit(1)
-
-        elif command == "scrape":
-            if processes > 1:
-                scrape_parallel(
-                    pool_filter=pools, caching=cache, processes=processes,
-                    verbose=verbosity >= 2,
-                )
             else:
-                scrape(pool_filter=pools, caching=cache, verbose=verbosity >= 2)
+                raise ValueError(f"Invalid command '{command}'")
 
-        else:
-            raise ValueError(f"Invalid command '{command}'")
+            options.store_transaction.commit()
+            if options.telemetry is not None and command == "scrape":
+                save_telemetry(options.telemetry)
+            if options.rollups and command == "scrape":
+                store_rollups(options)
+
+            if options.verbose and options.skip_unchanged:
+                print(options.skip_summary(), file=sys.stderr)
+
+        finally:
+            options.store_transaction.rollback()
+            if options.workers is not None:
+                options.workers.close()
+            if options.recorder is not None:
+                options.recorder.close()
+
+
+class ScrapeOptions:
+    """
+    Options that are passed to the scrape functions
+    """
+    def __init__(
+            self,
+            pool_filter: Optional[List[str]] = None,
+            caching: Union[bool, str] = False,
+            processes: int = 1,
+            store_method: str = StoreMethod.orm,
+            changes_only: bool = False,
+            skip_unchanged: bool = False,
+            on_conflict: str = OnConflict.nothing,
+            store_transaction: Optional[StoreTransaction] = None,
+            output_format: str = OutputFormat.json,
+            workers: Optional[ScraperWorkerPool] = None,
+            list_cache: Optional[PoolListCache] = None,
+            recorder: Optional[SnapshotArchiveWriter] = None,
+            breaker: Optional[CircuitBreaker] = None,
+            telemetry: Optional[RunTelemetry] = None,
+            queue_size: int = 10,
+            module_timeout: Optional[float] = None,
+            pool_timeout: Optional[float] = None,
+            rollups: bool = False,
+            verbose: bool = False,
+    ):
+        """
+        :param skip_unchanged: bool, passed to `store_snapshot`. The number
+            of skipped snapshots is counted in `num_skipped`
+
+        :param store_transaction: optional StoreTransaction, groups the stored
+            snapshots into transactions, defaults to one transaction per snapshot
+
+        :param workers: optional ScraperWorkerPool, if defined the scrapers
+            are executed in it's persistent worker processes instead
+            of starting a new python interpreter for each call.
+
+        :param list_cache: optional PoolListCache, if defined, a module is only
+            called for listing the pools if it's code changed since the last call
+
+        :param recorder: optional SnapshotArchiveWriter, if defined, all
+            scraper outputs are recorded for replaying them later
+
+        :param breaker: optional CircuitBreaker, if defined, persistently
+            failing pools are only scraped occasionally. Only applies
+            when scraping single pools in parallel or with 'serve'
+
+        :param telemetry: optional RunTelemetry, if defined, the timings
+            of each scraper call are collected in it
+
+        :param queue_size: maximum number of results of parallel scrapers
+            that wait for being stored
+
+        :param module_timeout: optional float, seconds after which a
+            call to a whole module is killed
+
+        :param pool_timeout: optional float, seconds after which scraping
+            a single pool is killed
+
+        :param rollups: bool, aggregate the completed hours and days
+            into the rollup tables, see `store_rollups`
+        """
+        self.pool_filter = pool_filter
+        self.caching = caching
+        self.processes = processes
+        self.store_method = store_method
+        self.changes_only = changes_only
+        self.skip_unchanged = skip_unchanged
+        self.on_conflict = on_conflict
+        self.store_transaction = store_transaction or StoreTransaction(TransactionMode.snapshot)
+        self.output_format = output_format
+        self.workers = workers
+        self.list_cache = list_cache
+        self.recorder = recorder
+        self.breaker = breaker
+        self.telemetry = telemetry
+        self.queue_size = queue_size
+        self.module_timeout = module_timeout
+        self.pool_timeout = pool_timeout
+        self.rollups = rollups
+        self.verbose = verbose
+        # number of stored and of skipped snapshots
+        self.num_snapshots = 0
+        self.num_skipped = 0
+
+    def store_kwargs(self) -> dict:
+        """
+        Returns the keyword arguments for `store_snapshot`
+        """
+        return {
+            "method": self.store_method,
+            "changes_only": self.changes_only,
+            "skip_unchanged": self.skip_unchanged,
+            "on_conflict": self.on_conflict,
+        }
+
+    def skip_summary(self) -> str:
+        percent = self.num_skipped / self.num_snapshots * 100. if self.num_snapshots else 0.
+        return f"skipped {self.num_skipped} of {self.num_snapshots} snapshots as unchanged ({percent:.1f}%)"
 
 
 def iter_scrapers() -> Generator[Path, None, None]:
@@ -87,24 +399,126 @@ def iter_scrapers() -> Generator[Path, None, None]:
         yield Path(scraper_py)
 
 
-def scrape(pool_filter: List[str], caching: Union[bool, str], verbose: bool = False):
+def scrape(options: ScrapeOptions):
     for scraper_py in iter_scrapers():
         module_path = scraper_py.parent
+        telemetry = options.telemetry.task(module_path.name) if options.telemetry is not None else None
+
+        for snapshots in iter_scraper_output(
+                path=module_path, pool_filter=options.pool_filter, options=options,
+                timeout=options.module_timeout, telemetry=telemetry,
+        ):
+            store_output(options, module_path.name, snapshots, telemetry=telemetry)
+        options.store_transaction.end_module()
+        if telemetry is not None:
+            telemetry.finished = True
+
+
+def store_output(
+        options: ScrapeOptions,
+        module_name: str,
+        snapshots: Union[list, dict],
+        pool_id: Optional[str] = None,
+        record: bool = True,
+        telemetry: Optional[TaskTelemetry] = None,
+):
+    """
+    Record the output of a scraper call, if enabled, and store it
+
+    :param telemetry: optional TaskTelemetry of the scraper call,
+        receives the storing time, number of queries and counts
+    """
+    if record and options.recorder is not None:
+        options.recorder.write(module_name, pool_id, snapshots)
+
+    num_queries = 0
+
+    def _count_queries(execute, sql, params, many, context):
+        nonlocal num_queries
+        num_queries += 1
+        return execute(sql, params, many, context)
 
-        snapshots = run_scraper_process(
-            path=module_path, command="scrape", pool_filter=pool_filter,
-            caching=caching, verbose=verbose,
+    with connection.execute_wrapper(_count_queries):
+        start = time.perf_counter()
+        num_skipped = store_snapshots(
+            module_name, snapshots, pool_id=pool_id,
+            store_transaction=options.store_transaction, **options.store_kwargs()
         )
-        store_snapshots(module_path.name, snapshots)
+        seconds = time.perf_counter() - start
 
+    if isinstance(snapshots, list):
+        options.num_snapshots += len(snapshots)
+    options.num_skipped += num_skipped
+
+    if telemetry is not None:
+        telemetry.seconds["store"] += seconds
+        telemetry.num_queries += num_queries
+        telemetry.num_skipped += num_skipped
+        if isinstance(snapshots, dict):
+            telemetry.num_errors += 1 if snapshots.get("error") else 0
+        else:
+            for snapshot in snapshots:
+                if snapshot.get("error"):
+                    telemetry.num_errors += 1
+                else:
+                    telemetry.num_snapshots += 1
+                    telemetry.num_lots += len(snapshot.get("lots") or [])
+
+
+def replay(options: ScrapeOptions, archive: str, speed: float = 1.):
+    """
+    Store all outputs of an archive recorded with `--archive`
+    at the recorded pace, or `speed` times faster.
+    """
+    last_module = None
+    # make the stored data visible while waiting
+    records = iter_replay(iter_archive(archive), speed=speed, before_wait=options.store_transaction.commit)
+    for record in records:
+        if record["module"] != last_module:
+            options.store_transaction.end_module()
+            last_module = record["module"]
+
+        if options.verbose:
+            print(f"replaying {record['module']} {record['pool'] or ''}", file=sys.stderr)
+        store_output(options, record["module"], record["output"], pool_id=record["pool"], record=False)
+
+
+def store_snapshots(
+        module_name: str,
+        snapshots: Union[list, dict],
+        pool_id: Optional[str] = None,
+        store_transaction: Optional[StoreTransaction] = None,
+        **store_kwargs,
+) -> int:
+    """
+    Store the output of a scraper call or log the errors
+
+    :param pool_id: optional str, the pool that was scraped in the call.
+        An error of the call is logged for this pool instead of the module.
+
+    :param store_transaction: optional StoreTransaction, each snapshot
+        is stored within it. Errors while storing a snapshot are
+        logged and do not affect the other snapshots.
+
+    :param store_kwargs: passed to `store_snapshot`
+
+    :returns int, number of snapshots that have been skipped
+        with `skip_unchanged`
+    """
+    num_skipped = 0
+    if store_transaction is None:
+        store_transaction = StoreTransaction(TransactionMode.none)
 
-def store_snapshots(module_name: str, snapshots: Union[list, dict]):
     if isinstance(snapshots, dict) and snapshots.get("error"):
-        print(f"\n\nERROR in module {module_name}:\n {snapshots['error']}")
+        if pool_id:
+            print(f"\n\nERROR in pool {module_name}.{pool_id}:\n {snapshots['error']}")
+        else:
+            print(f"\n\nERROR in module {module_name}:\n {snapshots['error']}")
 
-        ErrorLog.objects.create(
-            source=ErrorLogSources.module,
+        log_error(
+            source=ErrorLogSources.pool if pool_id else ErrorLogSources.module,
             module_name=module_name,
+            pool_id=pool_id,
             text=snapshots["error"],
         )
     else:
@@ -112,39 +526,576 @@ def store_snapshots(module_name: str, snapshots: Union[list, dict]):
             if snapshot.get("error"):
                 print(f"\n\nERROR in pool {module_name}.{snapshot['pool']['id']}:\n {snapshot['error']}")
 
-                ErrorLog.objects.create(
+                log_error(
                     source=ErrorLogSources.pool,
                     module_name=module_name,
                     pool_id=snapshot["pool"]["id"],
                     text=snapshot["error"],
                 )
             else:
-                store_snapshot(snapshot)
+                def _log_invalid_lot(lot: dict, error: str):
+                    log_error(
+                        source=ErrorLogSources.store,
+                        module_name=module_name,
+                        pool_id=snapshot["pool"]["id"],
+                        text=f"Invalid lot '{lot['id']}': {error}",
+                    )
+
+                try:
+                    with store_transaction.snapshot(num_rows=len(snapshot["lots"])):
+                        if store_snapshot(snapshot, on_invalid=_log_invalid_lot, **store_kwargs) is None:
+                            num_skipped += 1
+
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+                    print(f"\n\nERROR storing pool {module_name}.{snapshot['pool']['id']}:\n {error}")
+
+                    log_error(
+                        source=ErrorLogSources.store,
+                        module_name=module_name,
+                        pool_id=snapshot["pool"]["id"],
+                        text=error,
+                    )
+
+    return num_skipped
+
+
+def scrape_parallel(options: ScrapeOptions):
+    """
+    Scrape all pools in `options.processes` parallel threads.
+
+    The pools that took the longest in previous runs are started first.
+
+    Each scraper output is passed through a queue to the calling thread
+    which stores it right away. The queue holds at most `options.queue_size`
+    results, scraper threads wait when it's full.
+    """
+    scraper_commands = discover_pools(options)
+    if not scraper_commands:
+        return
+
+    if options.breaker is not None:
+        scraper_commands = [
+            (path, pool_id) for path, pool_id in scraper_commands
+            if _breaker_allows(options, path, pool_id)
+        ]
+
+    durations = ScrapeDurations(settings.SCRAPE_STATE_PATH / "durations.json")
+    scraper_commands = durations.sort_longest_first(scraper_commands)
+
+    results = queue.Queue(maxsize=max(1, options.queue_size))
+    thread_pool = ThreadPool(options.processes)
+    failed_keys = set()
+    tasks = dict()
+    try:
+        for path, pool_id in scraper_commands:
+            task = tasks[(path, pool_id)] = _start_task(options, path, pool_id)
+            thread_pool.apply_async(scrape_pool_to_queue, (path, pool_id, options, results, task))
+
+        num_done = 0
+        while num_done < len(scraper_commands):
+            # make the stored data visible while waiting
+            if results.empty():
+                options.store_transaction.commit()
+
+            path, pool_id, snapshots, seconds = results.get()
+            if snapshots is not None:
+                if output_has_error(snapshots):
+                    failed_keys.add((path, pool_id))
+                store_output(
+                    options, path.name, snapshots, pool_id=pool_id, telemetry=tasks.get((path, pool_id)),
+                )
+            else:
+                options.store_transaction.end_module()
+                durations.update(path.name, pool_id, seconds)
+                update_breaker(options, path, pool_id, failed=(path, pool_id) in failed_keys)
+                failed_keys.discard((path, pool_id))
+                _finish_task(tasks.pop((path, pool_id), None))
+                num_done += 1
+
+    finally:
+        thread_pool.terminate()
+        durations.save()
 
 
-def scrape_parallel(pool_filter: List[str], caching: Union[bool, str], processes: int, verbose: bool = False):
+def discover_pools(options: ScrapeOptions) -> List[Tuple[Path, str]]:
+    """
+    Return a (module path, pool_id) tuple for each pool of each scraper module
+    """
     scraper_commands = []
     for scraper_py in iter_scrapers():
-        pool_ids = run_scraper_process(
-            path=scraper_py.parent, command="list", pool_filter=pool_filter, caching=caching,
-            verbose=verbose,
-        )
-        if pool_ids:
+        module_path = scraper_py.parent
+
+        pool_ids = None
+        if options.list_cache is not None:
+            pool_ids = options.list_cache.get(module_path, options.pool_filter)
+            if pool_ids is not None and options.verbose:
+                print(f"using cached pool list of module '{module_path.name}'", file=sys.stderr)
+
+        if pool_ids is None:
+            pool_ids = run_scraper_process(
+                path=module_path, command="list", pool_filter=options.pool_filter,
+                caching=options.caching, workers=options.workers, timeout=options.module_timeout,
+                verbose=options.verbose,
+            )
+            if options.list_cache is not None and isinstance(pool_ids, list):
+                options.list_cache.set(module_path, options.pool_filter, pool_ids)
+
+        if isinstance(pool_ids, dict) and pool_ids.get("error"):
+            store_snapshots(scraper_py.parent.name, pool_ids)
+        elif pool_ids:
             for pool_id in pool_ids:
-                scraper_commands.append([scraper_py.parent, pool_id])
+                scraper_commands.append((scraper_py.parent, pool_id))
 
-    if not scraper_commands:
+    return scraper_commands
+
+
+def serve(options: ScrapeOptions, interval: float, list_interval: float):
+    """
+    Scrape each pool every `interval` seconds until interrupted.
+
+    The pools are discovered once every `list_interval` seconds.
+    The partitions of the data table for the next months are created
+    at the same time. The rollups are updated after each full hour.
+    Scrapes are started when a pool is due and the results are stored
+    as soon as they arrive. The pools are spread evenly across the interval
+    to distribute the database writes.
+    """
+    schedule = ScrapeSchedule(interval=interval)
+    results = queue.Queue(maxsize=max(1, options.queue_size))
+    thread_pool = ThreadPool(options.processes)
+    durations = ScrapeDurations(settings.SCRAPE_STATE_PATH / "durations.json")
+    next_discovery = time.monotonic()
+    next_rollups = datetime.datetime.utcnow()
+    failed_keys = set()
+    tasks = dict()
+
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_discovery:
+                # the partitions are created outside of the open store transaction
+                options.store_transaction.commit()
+
+                # one ScrapeRun per discovery cycle
+                if options.telemetry is not None and options.telemetry.finished_tasks():
+                    save_telemetry(options.telemetry)
+                    options.telemetry = options.telemetry.next_run()
+
+                for name in ensure_partitions():
+                    print(f"created partition {name}", file=sys.stderr)
+
+                known_keys = set(schedule.keys())
+                discovered_keys = discover_pools(options)
+                for key in known_keys - set(discovered_keys):
+                    schedule.remove(key)
+                schedule.add_spread([key for key in discovered_keys if key not in known_keys], now=now)
+                next_discovery = now + list_interval
+                durations.save()
+                if options.verbose:
+                    print(f"serving {len(schedule)} pools", file=sys.stderr)
+                    if options.skip_unchanged:
+                        print(options.skip_summary(), file=sys.stderr)
+
+            if options.rollups and datetime.datetime.utcnow() >= next_rollups:
+                store_rollups(options)
+                next_rollups = next_rollup_update(datetime.datetime.utcnow())
+
+            for path, pool_id in schedule.pop_due():
+                if not _breaker_allows(options, path, pool_id):
+                    schedule.done((path, pool_id))
+                    continue
+                task = tasks[(path, pool_id)] = _start_task(options, path, pool_id)
+                thread_pool.apply_async(scrape_pool_to_queue, (path, pool_id, options, results, task))
+
+            timeout = schedule.seconds_until_next()
+            timeout = min(
+                next_discovery - time.monotonic(),
+                timeout if timeout is not None else list_interval,
+            )
+            if options.rollups:
+                timeout = min(timeout, (next_rollups - datetime.datetime.utcnow()).total_seconds())
+            # make the stored data visible while waiting
+            if results.empty():
+                options.store_transaction.commit()
+                close_old_connections()
+
+            try:
+                path, pool_id, snapshots, seconds = results.get(timeout=max(0., timeout))
+            except queue.Empty:
+                continue
+
+            if snapshots is not None:
+                if output_has_error(snapshots):
+                    failed_keys.add((path, pool_id))
+                store_output(
+                    options, path.name, snapshots, pool_id=pool_id, telemetry=tasks.get((path, pool_id)),
+                )
+            else:
+                options.store_transaction.end_module()
+                schedule.done((path, pool_id))
+                durations.update(path.name, pool_id, seconds)
+                update_breaker(options, path, pool_id, failed=(path, pool_id) in failed_keys)
+                failed_keys.discard((path, pool_id))
+                _finish_task(tasks.pop((path, pool_id), None))
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        thread_pool.terminate()
+        durations.save()
+
+    if options.telemetry is not None and options.telemetry.finished_tasks():
+        options.store_transaction.commit()
+        save_telemetry(options.telemetry)
+
+
+def output_has_error(snapshots: Union[list, dict]) -> bool:
+    """
+    Returns True if the scraper output is an error or contains a snapshot with an error
+    """
+    if isinstance(snapshots, dict):
+        return bool(snapshots.get("error"))
+    return any(snapshot.get("error") for snapshot in snapshots)
+
+
+def update_breaker(options: ScrapeOptions, path: Path, pool_id: str, failed: bool):
+    """
+    Report the result of scraping a single pool to the circuit breaker, if enabled
+    """
+    if options.breaker is None:
+        return
+    was_open = options.breaker.is_open(path.name, pool_id)
+    if failed:
+        options.breaker.failure(path.name, pool_id)
+    else:
+        options.breaker.success(path.name, pool_id)
+
+    if options.breaker.is_open(path.name, pool_id) != was_open:
+        if was_open:
+            print(f"pool {path.name}.{pool_id} recovered", file=sys.stderr)
+        else:
+            print(f"pool {path.name}.{pool_id} is failing, only probing from now on", file=sys.stderr)
+
+
+def load_breaker_history(breaker: CircuitBreaker):
+    """
+    Restore the consecutive failures of each pool from the ErrorLog.
+
+    All errors of a pool that are logged after the latest stored data
+    of the pool count as consecutive failures. Only the errors
+    of the last `2 * breaker.max_delay` seconds are considered.
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=2 * breaker.max_delay)
+    last_success = dict(
+        ParkingLot.objects
+        .values("pool__pool_id")
+        .annotate(last_success=Max("latest_data__timestamp"))
+        .values_list("pool__pool_id", "last_success")
+    )
+
+    failures = dict()
+    for module_name, pool_id, first_seen, last_seen, count in (
+            ErrorLog.objects
+            .filter(source=ErrorLogSources.pool, last_seen__gte=since)
+            .exclude(pool_id=None)
+            .order_by("last_seen")
+            .values_list("module_name", "pool_id", "timestamp", "last_seen", "count")
+    ):
+        success = last_success.get(pool_id)
+        if success and last_seen <= success:
+            continue
+        # an aggregated error might include failures before the last success
+        if success and first_seen <= success:
+            count = 1
+        num_failures = failures.get((module_name, pool_id), (0, None))[0]
+        failures[(module_name, pool_id)] = (num_failures + count, last_seen)
+
+    for (module_name, pool_id), (num_failures, last_seen) in failures.items():
+        breaker.set_failures(
+            module_name, pool_id, num_failures,
+            last_seen.replace(tzinfo=datetime.timezone.utc).timestamp(),
+        )
+
+
+def _breaker_allows(options: ScrapeOptions, path: Path, pool_id: str) -> bool:
+    if options.breaker is None or options.breaker.allow(path.name, pool_id):
+        return True
+    if options.verbose:
+        print(f"skipping failing pool {path.name}.{pool_id}", file=sys.stderr)
+    return False
+
+
+def save_telemetry(run: RunTelemetry) -> ScrapeRun:
+    """
+    Store the finished tasks of a run as ScrapeRun and ScrapeTask rows
+    """
+    tasks = run.finished_tasks()
+    run_model = ScrapeRun.objects.create(
+        date_started=run.date_started,
+        date_finished=datetime.datetime.utcnow(),
+        command=run.command,
+        processes=run.processes,
+        options=run.options,
+        num_tasks=len(tasks),
+        num_snapshots=sum(task.num_snapshots for task in tasks),
+        num_skipped=sum(task.num_skipped for task in tasks),
+        num_lots=sum(task.num_lots for task in tasks),
+        num_errors=sum(task.num_errors for task in tasks),
+        num_queries=sum(task.num_queries for task in tasks),
+    )
+    ScrapeTask.objects.bulk_create([
+        ScrapeTask(
+            run=run_model,
+            date_started=task.date_started,
+            module_name=task.module_name,
+            pool_id=task.pool_id,
+            spawn_seconds=task.seconds["spawn"],
+            scrape_seconds=task.seconds["scrape"],
+            parse_seconds=task.seconds["parse"],
+            store_seconds=task.seconds["store"],
+            num_bytes=task.num_bytes,
+            num_snapshots=task.num_snapshots,
+            num_skipped=task.num_skipped,
+            num_lots=task.num_lots,
+            num_errors=task.num_errors,
+            num_queries=task.num_queries,
+        )
+        for task in tasks
+    ])
+    return run_model
+
+
+# maximum time range that is aggregated between two scrapes
+ROLLUP_MAX_RANGE = datetime.timedelta(days=1)
+
+
+def store_rollups(options: ScrapeOptions):
+    """
+    Aggregate the hours and days that completed since the last update
+    into the rollup tables, see `park_data.models.update_rollups`.
+
+    At most `ROLLUP_MAX_RANGE` is aggregated per call, so the first
+    call does not aggregate the whole history (see `pa_rollups rebuild`)
+    and a long pause is caught up over several calls.
+
+    Errors are logged and do not stop the scraping.
+    """
+    # the rollups only read committed rows
+    options.store_transaction.commit()
+    try:
+        num_hourly, num_daily = update_rollups(max_range=ROLLUP_MAX_RANGE)
+
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+        print(f"\n\nERROR updating rollups:\n {error}")
+
+        log_error(
+            source=ErrorLogSources.store,
+            module_name="rollups",
+            pool_id=None,
+            text=error,
+        )
+        return
+
+    if options.verbose and (num_hourly or num_daily):
+        print(f"created {num_hourly} hourly and {num_daily} daily rollup rows", file=sys.stderr)
+
+
+def _start_task(options: ScrapeOptions, path: Path, pool_id: str) -> Optional[TaskTelemetry]:
+    if options.telemetry is None:
+        return None
+    return options.telemetry.task(path.name, pool_id)
+
+
+def _finish_task(telemetry: Optional[TaskTelemetry]):
+    if telemetry is not None:
+        telemetry.finished = True
+
+
+def scrape_pool_to_queue(
+        path: Path,
+        pool_id: str,
+        options: ScrapeOptions,
+        results: queue.Queue,
+        telemetry: Optional[TaskTelemetry] = None,
+):
+    """
+    Scrape a single pool and put each output into the `results` queue,
+    never raises.
+
+    Puts (path, pool_id, snapshots, None) for each output
+    and finally (path, pool_id, None, seconds).
+    """
+    start = time.monotonic()
+    try:
+        for snapshots in iter_scraper_output(
+                path=path, pool_filter=[pool_id], options=options, timeout=options.pool_timeout,
+                telemetry=telemetry,
+        ):
+            results.put((path, pool_id, snapshots, None))
+    except Exception as e:
+        results.put((path, pool_id, {"error": f"{type(e).__name__}: {e}\n{traceback.format_exc()}"}, None))
+
+    results.put((path, pool_id, None, time.monotonic() - start))
+
+
+def iter_scraper_output(
+        path: Path,
+        pool_filter: Optional[List[str]],
+        options: ScrapeOptions,
+        timeout: Optional[float] = None,
+        telemetry: Optional[TaskTelemetry] = None,
+) -> Generator[Union[dict, list], None, None]:
+    """
+    Run the scrape command of a module and yield the outputs
+    in the shape accepted by `store_snapshots`.
+
+    For the streaming output formats, each snapshot is yielded
+    as soon as the scraper has written it. The persistent workers
+    do not stream, their complete output is parsed at the end.
+
+    :param telemetry: optional TaskTelemetry, receives the spawn,
+        scrape and parse timings and the output size
+    """
+    if options.output_format == OutputFormat.json or not scraper_supports_output_format(path, options.list_cache):
+        yield run_scraper_process(
+            path=path, command="scrape", pool_filter=pool_filter, caching=options.caching,
+            workers=options.workers, timeout=timeout, verbose=options.verbose, telemetry=telemetry,
+        )
         return
 
-    snapshots = ThreadPool(processes).map(
-        lambda args: run_scraper_process(
-            path=args[0], command="scrape", pool_filter=[args[1]], caching=caching,
-            verbose=verbose
-        ),
-        scraper_commands,
+    if options.verbose:
+        print(f"module '{path.name}' scraping {pool_filter or 'all pools'}", file=sys.stderr)
+
+    args = scraper_args(
+        "scrape", pool_filter=pool_filter, caching=options.caching,
+        output_format=options.output_format,
     )
-    for sn, (path, pool_id) in zip(snapshots, scraper_commands):
-        store_snapshots(path.name, sn)
+
+    if options.workers is not None:
+        try:
+            with _measure(telemetry, "scrape"):
+                stdout, stderr = options.workers.run(path, args, timeout=timeout)
+        except TimeoutError:
+            yield {"error": f"Timeout: '{' '.join(args)}' exceeded {timeout} seconds"}
+            return
+
+        try:
+            stream = io.BytesIO(stdout)
+            for obj in iter_measured_output(stream, options.output_format, telemetry):
+                yield output_to_snapshots(obj)
+        except ValueError:
+            yield {"error": stderr}
+        return
+
+    args = [python_executable(), "scraper.py", *args]
+    if options.verbose:
+        print("running", " ".join(str(a) for a in args), "in directory", path, file=sys.stderr)
+
+    with _measure(telemetry, "spawn"):
+        process = subprocess.Popen(
+            args=args,
+            cwd=str(path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    # read stderr in parallel to not block the process
+    stderr = []
+    stderr_thread = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        process.kill()
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, _kill)
+        timer.start()
+
+    decode_error = False
+    finished = False
+    try:
+        try:
+            for obj in iter_measured_output(process.stdout, options.output_format, telemetry):
+                yield output_to_snapshots(obj)
+        except ValueError:
+            decode_error = True
+        else:
+            finished = True
+
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # kill on decoding errors or when the caller stopped iterating
+        if not finished and process.poll() is None:
+            process.kill()
+        with _measure(telemetry, "scrape"):
+            process.wait()
+            stderr_thread.join()
+
+    if timed_out.is_set():
+        yield {"error": f"Timeout: '{' '.join(args[1:])}' exceeded {timeout} seconds"}
+    elif decode_error or process.returncode:
+        yield {"error": b"".join(stderr).decode("utf-8") or f"Exit code {process.returncode}"}
+
+
+_output_format_support: Dict[Tuple[str, float], bool] = dict()
+
+
+def scraper_supports_output_format(path: Path, list_cache: Optional[PoolListCache] = None) -> bool:
+    """
+    Return True if the module's scraper.py accepts the `--output-format` argument.
+
+    The result is cached until the scraper.py file changes, on disk
+    in the `list_cache` so that only the first run probes the module.
+    """
+    try:
+        key = (str(path), (path / "scraper.py").stat().st_mtime)
+    except OSError:
+        return False
+
+    if key not in _output_format_support:
+        supported = list_cache.get_feature(path, "output_format") if list_cache is not None else None
+        if supported is None:
+            try:
+                output = subprocess.run(
+                    [python_executable(), "scraper.py", "scrape", "--help"],
+                    cwd=str(path), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60,
+                ).stdout
+            except (OSError, subprocess.TimeoutExpired):
+                output = b""
+            supported = b"--output-format" in output
+            if list_cache is not None:
+                list_cache.set_feature(path, "output_format", supported)
+        _output_format_support[key] = supported
+
+    return _output_format_support[key]
+
+
+def scraper_args(
+        command: str,
+        pool_filter: Optional[List[str]],
+        caching: Union[bool, str],
+        output_format: str = OutputFormat.json,
+) -> List[str]:
+    """
+    Return the command line arguments for a scraper.py
+    """
+    args = [command]
+    if pool_filter:
+        args += ["--pools", *pool_filter]
+    if caching is True:
+        args += ["--cache"]
+    elif caching:
+        args += ["--cache", caching]
+    if output_format != OutputFormat.json:
+        args += ["--output-format", output_format]
+    return args
 
 
 def run_scraper_process(
@@ -152,40 +1103,80 @@ def run_scraper_process(
         command: str,
         pool_filter: List[str],
         caching: Union[bool, str],
+        workers: Optional[ScraperWorkerPool] = None,
+        timeout: Optional[float] = None,
         verbose: bool = False,
+        telemetry: Optional[TaskTelemetry] = None,
 ) -> Union[dict, list]:
+    """
+    Run a scraper module's command and return the decoded json output
+
+    :param workers: optional ScraperWorkerPool, if defined the command
+        is executed in one of it's persistent worker processes instead
+        of starting a new python interpreter.
+
+    :param timeout: optional float, number of seconds after which the
+        scraper is killed and an error is returned
 
+    :param telemetry: optional TaskTelemetry, receives the timings and output size
+    """
     if verbose and command == "scrape":
         print(f"module '{path.name}' scraping {pool_filter or 'all pools'}", file=sys.stderr)
 
-    args = [python_executable(), "scraper.py", command]
-    if pool_filter:
-        args += ["--pools", *pool_filter]
-    if caching is True:
-        args += ["--cache"]
-    elif caching:
-        args += ["--cache", caching]
+    args = scraper_args(command, pool_filter=pool_filter, caching=caching)
+
+    if workers is not None:
+        try:
+            if verbose:
+                print("running worker", " ".join(args), "in directory", path, file=sys.stderr)
+            with _measure(telemetry, "scrape"):
+                stdout, stderr = workers.run(path, args, timeout=timeout)
+            if telemetry is not None:
+                telemetry.num_bytes += len(stdout)
+            try:
+                with _measure(telemetry, "parse"):
+                    return json.loads(stdout)
+            except json.JSONDecodeError:
+                return {"error": stderr}
 
+        except TimeoutError:
+            return {"error": f"Timeout: '{' '.join(args)}' exceeded {timeout} seconds"}
+
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}\n{traceback.format_exc()}"}
+
+    args = [python_executable(), "scraper.py", *args]
     try:
         if verbose:
             print("running", " ".join(str(a) for a in args), "in directory", path, file=sys.stderr)
-        process = subprocess.Popen(
-            args=args,
-            cwd=str(path),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+        with _measure(telemetry, "spawn"):
+            process = subprocess.Popen(
+                args=args,
+                cwd=str(path),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
         try:
-            output = process.stdout.read()
-            return json.loads(output.decode("utf-8"))
+            with _measure(telemetry, "scrape"):
+                stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            return {"error": f"Timeout: '{' '.join(args[1:])}' exceeded {timeout} seconds"}
+
+        if telemetry is not None:
+            telemetry.num_bytes += len(stdout)
+        try:
+            with _measure(telemetry, "parse"):
+                return json.loads(stdout.decode("utf-8"))
         except json.JSONDecodeError:
-            output = process.stderr.read()
-            return {"error": output.decode("utf-8")}
+            return {"error": stderr.decode("utf-8")}
 
     except Exception as e:
         return {"error": f"{type(e).__name__}: {e}\n{traceback.format_exc()}"}
 
 
+@functools.lru_cache()
 def python_executable() -> str:
     try:
         python_path = subprocess.check_output(["sh", "-c", "which python"])
@@ -200,3 +1191,9 @@ def python_executable() -> str:
         fn = Path(sys.executable)
 
     return str(fn.resolve())
+
+
+def _measure(telemetry: Optional[TaskTelemetry], phase: str):
+    if telemetry is None:
+        return contextlib.nullcontext()
+    return telemetry.measure(phase)
@@ -2,7 +2,7 @@ import datetime
 from typing import Optional, List
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import QuerySet
+from django.db.models import QuerySet, Sum, Count, Min, Max
 
 from park_data.models import *
 
@@ -53,7 +53,7 @@ def dump_stats(time: Optional[str], pools: List[str], verbosity: int):
 
     if start_time:
         data_qset = data_qset.filter(timestamp__gte=start_time)
-        error_qset = error_qset.filter(timestamp__gte=start_time)
+        error_qset = error_qset.filter(last_seen__gte=start_time)
 
         lot_ids = data_qset.values_list("lot__lot_id", flat=True).distinct()
         lot_qset = lot_qset.filter(lot_id__in=lot_ids)
@@ -100,12 +100,46 @@ def dump_stats(time: Optional[str], pools: List[str], verbosity: int):
         for model in data_qset.order_by("-timestamp")[:max_list]:
             print("   ", model)
 
+    print("\nRollups")
+    hourly_qset = None
+    for name, model in (("hourly", ParkingDataHourly), ("daily", ParkingDataDaily)):
+        rollup_qset = model.objects.all()
+        if pools:
+            rollup_qset = rollup_qset.filter(lot__pool__pool_id__in=pools)
+        if start_time:
+            rollup_qset = rollup_qset.filter(timestamp__gte=start_time)
+        if model is ParkingDataHourly:
+            hourly_qset = rollup_qset
+        stats = rollup_qset.aggregate(count=Count("*"), first=Min("timestamp"), last=Max("timestamp"))
+        print("  {:19} {:9,d}".format(f"{name}:", stats["count"]), end="")
+        if stats["count"]:
+            print(f"  {stats['first']} - {stats['last']}", end="")
+        print()
+
+    # the aggregated hours, without reading the data table
+    stats = hourly_qset.aggregate(
+        num_rows=Sum("num_rows"), num_open=Sum("num_open"),
+        num_free_count=Sum("num_free_count"), num_free_sum=Sum("num_free_sum"),
+        num_occupied_count=Sum("num_occupied_count"), num_occupied_sum=Sum("num_occupied_sum"),
+    )
+    if stats["num_rows"]:
+        print("  open:               {:9.1%}".format(stats["num_open"] / stats["num_rows"]))
+    for field in ("num_free", "num_occupied"):
+        if stats[f"{field}_count"]:
+            print("  {:19} {:9.1f}".format(
+                f"mean {field}:", stats[f"{field}_sum"] / stats[f"{field}_count"]
+            ))
+
+    def _num_errors(qset) -> int:
+        return qset.aggregate(num_errors=Sum("count"))["num_errors"] or 0
+
     print("\nErrors")
-    print("  all:                {:9d}".format(error_qset.count()))
-    print("  modules:            {:9d}".format(error_qset.filter(pool_id=None).count()))
-    print("  pools:              {:9d}".format(error_qset.exclude(pool_id=None).count()))
+    print("  all:                {:9d}".format(_num_errors(error_qset)))
+    print("  modules:            {:9d}".format(_num_errors(error_qset.filter(pool_id=None))))
+    print("  pools:              {:9d}".format(_num_errors(error_qset.exclude(pool_id=None))))
+    print("  distinct:           {:9d}".format(error_qset.count()))
 
     if verbosity > 1:
         print()
-        for model in error_qset.order_by("-timestamp")[:max_list]:
-            print("   ", model)
+        for model in error_qset.order_by("-last_seen")[:max_list]:
+            print("   ", model, f"({model.count}x)")
@@ -0,0 +1,8 @@
+from .archive import SnapshotArchiveWriter, iter_archive, iter_replay
+from .breaker import CircuitBreaker
+from .durations import ScrapeDurations
+from .pool_cache import PoolListCache
+from .protocol import OutputFormat, iter_output, output_to_snapshots
+from .schedule import ScrapeSchedule
+from .telemetry import RunTelemetry, TaskTelemetry, iter_measured_output
+from .workers import ScraperWorkerPool
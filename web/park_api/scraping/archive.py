@@ -0,0 +1,98 @@
+"""
+Record raw scraper outputs to disk and read them back for replaying.
+
+An archive is a gzip compressed file with one json object per line:
+
+    {"time": <unix timestamp>, "module": <module name>, "pool": <pool id or null>, "output": <scraper output>}
+
+"""
+import datetime
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Union, Optional, Generator, Callable
+
+
+class SnapshotArchiveWriter:
+    """
+    Appends scraper outputs to an archive.
+
+    If `path` is a directory, a new file named by the current time is created.
+    """
+    def __init__(self, path: Union[str, Path], flush_interval: float = 60.):
+        path = Path(path)
+        if path.is_dir():
+            path = path / datetime.datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S.jsonl.gz")
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, module_name: str, pool_id: Optional[str], output: Union[list, dict]):
+        self._file.write(json.dumps({
+            "time": time.time(),
+            "module": module_name,
+            "pool": pool_id,
+            "output": output,
+        }, separators=(",", ":")))
+        self._file.write("\n")
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def iter_archive(path: Union[str, Path]) -> Generator[dict, None, None]:
+    """
+    Yield the records of an archive file or of all archive files
+    in a directory, ordered by file name.
+    """
+    path = Path(path)
+    filenames = sorted(path.glob("*.jsonl.gz")) if path.is_dir() else [path]
+    for filename in filenames:
+        with gzip.open(filename, "rt", encoding="utf-8") as fp:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def iter_replay(
+        records: Generator[dict, None, None],
+        speed: float = 1.,
+        before_wait: Optional[Callable[[], None]] = None,
+) -> Generator[dict, None, None]:
+    """
+    Yield the records at the time they have been recorded,
+    relative to the first record.
+
+    :param speed: float, replay N times faster, 0 for no waiting
+
+    :param before_wait: optional callable, called before waiting for the next record
+    """
+    first_time = None
+    start = time.monotonic()
+    for record in records:
+        if speed > 0:
+            if first_time is None:
+                first_time = record["time"]
+            wait = start + (record["time"] - first_time) / speed - time.monotonic()
+            if wait > 0:
+                if before_wait is not None:
+                    before_wait()
+                time.sleep(wait)
+        yield record
@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class CircuitBreaker:
+    """
+    Per-pool circuit breaker for persistently failing scrapers.
+
+    After `threshold` consecutive failures of a pool, the circuit opens
+    and the pool is only scraped once after an exponentially growing
+    delay (a probe). A successful probe closes the circuit again,
+    a failed probe doubles the delay up to `max_delay`.
+
+    The times are unix timestamps so that the state can be restored
+    from the ErrorLog with `set_failures`.
+    """
+    def __init__(self, threshold: int = 5, delay: float = 300., max_delay: float = 6 * 3600.):
+        """
+        :param threshold: int, number of consecutive failures that open the circuit,
+            0 disables the breaker
+
+        :param delay: float, seconds until the first probe after the circuit opened
+
+        :param max_delay: float, maximum seconds between two probes
+        """
+        self.threshold = threshold
+        self.delay = delay
+        self.max_delay = max_delay
+        # (module_name, pool_id) -> (consecutive failures, time of last failure)
+        self._failures: Dict[Tuple[str, str], Tuple[int, float]] = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of open circuits"""
+        with self._lock:
+            return len([key for key in self._failures if self._is_open(key)])
+
+    def allow(self, module_name: str, pool_id: str, now: Optional[float] = None) -> bool:
+        """
+        Returns True if the pool should be scraped, either because the circuit
+        is closed or because the next probe is due
+        """
+        key = (module_name, pool_id)
+        with self._lock:
+            if not self._is_open(key):
+                return True
+            return (now if now is not None else time.time()) >= self._next_probe(key)
+
+    def is_open(self, module_name: str, pool_id: str) -> bool:
+        with self._lock:
+            return self._is_open((module_name, pool_id))
+
+    def next_probe(self, module_name: str, pool_id: str) -> Optional[float]:
+        """
+        Returns the time of the next probe if the circuit is open
+        """
+        key = (module_name, pool_id)
+        with self._lock:
+            if not self._is_open(key):
+                return None
+            return self._next_probe(key)
+
+    def success(self, module_name: str, pool_id: str):
+        with self._lock:
+            self._failures.pop((module_name, pool_id), None)
+
+    def failure(self, module_name: str, pool_id: str, now: Optional[float] = None):
+        key = (module_name, pool_id)
+        with self._lock:
+            num_failures = self._failures.get(key, (0, 0.))[0]
+            self._failures[key] = (num_failures + 1, now if now is not None else time.time())
+
+    def set_failures(self, module_name: str, pool_id: str, num_failures: int, last_failure: float):
+        """
+        Restore the number of consecutive failures, e.g. from the ErrorLog
+        """
+        with self._lock:
+            if num_failures > 0:
+                self._failures[(module_name, pool_id)] = (num_failures, last_failure)
+            else:
+                self._failures.pop((module_name, pool_id), None)
+
+    def _is_open(self, key: Tuple[str, str]) -> bool:
+        return self.threshold > 0 and self._failures.get(key, (0, 0.))[0] >= self.threshold
+
+    def _next_probe(self, key: Tuple[str, str]) -> float:
+        num_failures, last_failure = self._failures[key]
+        # avoid huge powers for very long outages
+        exponent = min(num_failures - self.threshold, 32)
+        return last_failure + min(self.max_delay, self.delay * 2 ** exponent)
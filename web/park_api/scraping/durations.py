@@ -0,0 +1,57 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+class ScrapeDurations:
+    """
+    Persistent moving average of the scrape duration per module and pool.
+
+    Used to start the historically slowest pools first
+    (longest-processing-time-first) so that the wall time
+    of a parallel scrape stays close to the slowest single pool.
+    """
+    def __init__(self, filename: Optional[Path] = None, smoothing: float = .3):
+        self.filename = filename
+        self.smoothing = smoothing
+        self._durations: Dict[str, float] = dict()
+        self._lock = threading.Lock()
+        if self.filename and self.filename.exists():
+            try:
+                self._durations = json.loads(self.filename.read_text())
+            except (json.JSONDecodeError, OSError):
+                pass
+
+    @classmethod
+    def key(cls, module_name: str, pool_id: str) -> str:
+        return f"{module_name}/{pool_id}"
+
+    def get(self, module_name: str, pool_id: str) -> Optional[float]:
+        return self._durations.get(self.key(module_name, pool_id))
+
+    def update(self, module_name: str, pool_id: str, seconds: float):
+        key = self.key(module_name, pool_id)
+        with self._lock:
+            if key in self._durations:
+                seconds = self.smoothing * seconds + (1. - self.smoothing) * self._durations[key]
+            self._durations[key] = seconds
+
+    def sort_longest_first(self, scraper_commands: List[Tuple[Path, str]]) -> List[Tuple[Path, str]]:
+        """
+        Sort (module path, pool_id) tuples by decreasing duration.
+        Pools without history are treated as the slowest.
+        """
+        default = max(self._durations.values(), default=0.) + 1.
+        return sorted(
+            scraper_commands,
+            key=lambda cmd: -(self.get(cmd[0].name, cmd[1]) or default),
+        )
+
+    def save(self):
+        if not self.filename:
+            return
+        with self._lock:
+            data = json.dumps(self._durations, indent=2, sort_keys=True)
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.filename.write_text(data)
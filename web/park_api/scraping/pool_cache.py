@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+
+
+class PoolListCache:
+    """
+    Disk cache for the output of the scraper modules' `list` command
+    and for the probed features of a module, like the supported arguments.
+
+    An entry is valid as long as no python file in the module
+    directory has changed.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+
+    def get(self, module_path: Path, pool_filter: Optional[List[str]]) -> Optional[List[str]]:
+        filename = self._filename(module_path)
+        try:
+            data = json.loads(filename.read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if data.get("key") != self._key(module_path, pool_filter):
+            return None
+        return data.get("pool_ids")
+
+    def set(self, module_path: Path, pool_filter: Optional[List[str]], pool_ids: List[str]):
+        filename = self._filename(module_path)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(json.dumps({
+            "key": self._key(module_path, pool_filter),
+            "pool_ids": pool_ids,
+        }, indent=2))
+
+    def get_feature(self, module_path: Path, name: str) -> Optional[bool]:
+        filename = self._filename(module_path, "features")
+        try:
+            data = json.loads(filename.read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if data.get("key") != module_fingerprint(module_path):
+            return None
+        return data.get("features", {}).get(name)
+
+    def set_feature(self, module_path: Path, name: str, value: bool):
+        filename = self._filename(module_path, "features")
+        key = module_fingerprint(module_path)
+        try:
+            data = json.loads(filename.read_text())
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        features = data.get("features", {}) if data.get("key") == key else {}
+
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(json.dumps({
+            "key": key,
+            "features": {**features, name: value},
+        }, indent=2))
+
+    def _filename(self, module_path: Path, suffix: str = "") -> Path:
+        if suffix:
+            return self.path / f"{module_path.name}.{suffix}.json"
+        return self.path / f"{module_path.name}.json"
+
+    def _key(self, module_path: Path, pool_filter: Optional[List[str]]) -> str:
+        return "{}/{}".format(
+            module_fingerprint(module_path),
+            ",".join(sorted(pool_filter or [])),
+        )
+
+
+def module_fingerprint(module_path: Path) -> str:
+    """
+    Hash of the names, sizes and modification times of all python files in the module
+    """
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(module_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(".py"):
+                stat = os.stat(os.path.join(root, name))
+                h.update(f"{root}/{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
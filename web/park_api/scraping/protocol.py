@@ -0,0 +1,68 @@
+"""
+Output formats of the scraper modules' `scrape` command.
+
+- `json`: The whole output is one json document, either a list
+  of snapshots or an object with an "error" key.
+
+- `jsonl`: One json object per line. Each line is either a snapshot
+  (an object with "pool" and "lots"), a snapshot with an "error" key
+  or an object with only an "error" key for errors of the whole module.
+  A large pool can be split into several lines with the same "pool"
+  and a part of the "lots" each.
+
+- `msgpack`: Like `jsonl` but a stream of msgpack encoded objects.
+  Requires the `msgpack` package.
+
+The line-based formats can be parsed and stored while the scraper
+is still running.
+"""
+import json
+from typing import BinaryIO, Generator, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class OutputFormat:
+    json = "json"
+    jsonl = "jsonl"
+    msgpack = "msgpack"
+
+    choices = (json, jsonl, msgpack)
+    streaming = (jsonl, msgpack)
+
+
+def iter_output(stream: BinaryIO, format: str) -> Generator[dict, None, None]:
+    """
+    Yield each object of a streaming format as soon as it is read.
+
+    :raises ValueError on decoding errors
+    """
+    if format == OutputFormat.jsonl:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    elif format == OutputFormat.msgpack:
+        if msgpack is None:
+            raise ValueError("Output format 'msgpack' requires the 'msgpack' package")
+        try:
+            for obj in msgpack.Unpacker(stream, raw=False):
+                yield obj
+        except (ValueError, msgpack.UnpackException) as e:
+            raise ValueError(f"{type(e).__name__}: {e}")
+
+    else:
+        raise ValueError(f"Invalid streaming output format '{format}'")
+
+
+def output_to_snapshots(obj: dict) -> Union[list, dict]:
+    """
+    Convert a streamed object to the shape of the `json` format
+    """
+    if "pool" in obj:
+        return [obj]
+    return obj
@@ -0,0 +1,95 @@
+import heapq
+import time
+from typing import Hashable, List, Dict, Optional, Iterable
+
+
+class ScrapeSchedule:
+    """
+    Keeps one next-due time per key (e.g. a (module, pool_id) tuple).
+
+    A key that has been returned by `pop_due` is considered running
+    and is not returned again until `done` is called for it.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._heap = []
+        self._due: Dict[Hashable, float] = dict()
+        self._running = set()
+
+    def __len__(self):
+        return len(self._due)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._due)
+
+    def add(self, key: Hashable, due: Optional[float] = None):
+        if due is None:
+            due = time.monotonic()
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, _Key(key)))
+
+    def add_spread(self, keys: Iterable[Hashable], now: Optional[float] = None):
+        """
+        Add all keys with due times evenly distributed across one interval
+        """
+        if now is None:
+            now = time.monotonic()
+        keys = list(keys)
+        for i, key in enumerate(keys):
+            self.add(key, now + i * self.interval / len(keys))
+
+    def remove(self, key: Hashable):
+        self._due.pop(key, None)
+        self._running.discard(key)
+
+    def pop_due(self, now: Optional[float] = None) -> List[Hashable]:
+        """
+        Return all keys that are due and schedule their next run
+        """
+        if now is None:
+            now = time.monotonic()
+        keys = []
+        while self._heap and self._heap[0][0] <= now:
+            due, key = heapq.heappop(self._heap)
+            key = key.key
+            # skip outdated heap entries
+            if self._due.get(key) != due:
+                continue
+            if key in self._running:
+                # try again when it's done
+                self.add(key, now + self.interval)
+                continue
+
+            self._running.add(key)
+            keys.append(key)
+            # keep the period independent of the scraping time
+            next_due = due + self.interval
+            if next_due <= now:
+                next_due = now + self.interval
+            self.add(key, next_due)
+
+        return keys
+
+    def done(self, key: Hashable):
+        self._running.discard(key)
+
+    def seconds_until_next(self, now: Optional[float] = None) -> Optional[float]:
+        if now is None:
+            now = time.monotonic()
+        while self._heap:
+            due, key = self._heap[0]
+            if self._due.get(key.key) != due:
+                heapq.heappop(self._heap)
+                continue
+            return max(0., due - now)
+
+
+class _Key:
+    """Wrapper to not compare the keys in the heap"""
+    __slots__ = ("key", )
+
+    def __init__(self, key: Hashable):
+        self.key = key
+
+    def __lt__(self, other):
+        return False
@@ -0,0 +1,140 @@
+"""
+Timing and size measurements of scraper calls.
+
+The measurements are collected in plain objects while scraping
+(also from the scraper threads) and are stored as
+`ScrapeRun` and `ScrapeTask` rows at the end of a run.
+"""
+import contextlib
+import datetime
+import threading
+import time
+from typing import BinaryIO, Generator, List, Optional
+
+from .protocol import iter_output
+
+
+class TaskTelemetry:
+    """
+    Measurements of one scraper call
+    """
+    PHASES = ("spawn", "scrape", "parse", "store")
+
+    def __init__(self, module_name: str, pool_id: Optional[str] = None):
+        self.module_name = module_name
+        self.pool_id = pool_id
+        self.date_started = datetime.datetime.utcnow()
+        self.seconds = {phase: 0. for phase in self.PHASES}
+        self.num_bytes = 0
+        self.num_snapshots = 0
+        self.num_skipped = 0
+        self.num_lots = 0
+        self.num_errors = 0
+        self.num_queries = 0
+        self.finished = False
+
+    @contextlib.contextmanager
+    def measure(self, phase: str):
+        """
+        Add the time spent in the context to the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[phase] += time.perf_counter() - start
+
+
+class RunTelemetry:
+    """
+    Collects the `TaskTelemetry` of one run
+    """
+    def __init__(self, command: str, processes: int = 1, options: Optional[dict] = None):
+        self.command = command
+        self.processes = processes
+        self.options = options
+        self.date_started = datetime.datetime.utcnow()
+        self.tasks: List[TaskTelemetry] = []
+        self._lock = threading.Lock()
+
+    def task(self, module_name: str, pool_id: Optional[str] = None) -> TaskTelemetry:
+        """
+        Start the measurements of a new scraper call
+        """
+        task = TaskTelemetry(module_name, pool_id)
+        with self._lock:
+            self.tasks.append(task)
+        return task
+
+    def finished_tasks(self) -> List[TaskTelemetry]:
+        with self._lock:
+            return [task for task in self.tasks if task.finished]
+
+    def next_run(self) -> "RunTelemetry":
+        """
+        Returns a new run that continues the unfinished tasks of this run
+        """
+        run = RunTelemetry(self.command, processes=self.processes, options=self.options)
+        with self._lock:
+            run.tasks = [task for task in self.tasks if not task.finished]
+        return run
+
+
+def iter_measured_output(
+        stream: BinaryIO,
+        format: str,
+        telemetry: Optional[TaskTelemetry],
+) -> Generator[dict, None, None]:
+    """
+    Like `protocol.iter_output` but counts the read bytes and separates
+    the time waiting for the stream ("scrape") from the decoding ("parse").
+
+    The time the caller spends between two objects is not measured.
+    """
+    if telemetry is None:
+        yield from iter_output(stream, format)
+        return
+
+    iterator = iter_output(_MeasuredStream(stream, telemetry), format)
+    while True:
+        start = time.perf_counter()
+        read_seconds = telemetry.seconds["scrape"]
+        try:
+            obj = next(iterator)
+        except StopIteration:
+            obj = None
+        finally:
+            telemetry.seconds["parse"] += max(
+                0., time.perf_counter() - start - (telemetry.seconds["scrape"] - read_seconds)
+            )
+        if obj is None:
+            return
+        yield obj
+
+
+class _MeasuredStream:
+    """
+    Wraps a binary stream and measures reading
+    """
+    def __init__(self, stream: BinaryIO, telemetry: TaskTelemetry):
+        self._stream = stream
+        self._telemetry = telemetry
+
+    def read(self, size: int = -1) -> bytes:
+        with self._telemetry.measure("scrape"):
+            data = self._stream.read(size)
+        self._telemetry.num_bytes += len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        with self._telemetry.measure("scrape"):
+            line = self._stream.readline(size)
+        self._telemetry.num_bytes += len(line)
+        return line
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
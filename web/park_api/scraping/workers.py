@@ -0,0 +1,244 @@
+"""
+Persistent scraper worker processes.
+
+Instead of starting a new python interpreter for each call of a scraper
+module, a worker process changes into the module's directory, imports
+`scraper.py` once and then executes the module's main code for every
+job that is sent through a pipe. All packages that the scraper imports
+stay loaded between jobs.
+
+Note: This module must not import django because the workers are
+started via 'spawn' and should stay lightweight.
+"""
+import io
+import os
+import sys
+import time
+import runpy
+import queue
+import threading
+import traceback
+import importlib
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+
+
+class ScraperWorkerPool:
+    """
+    Keeps up to `processes` worker processes per scraper module.
+
+    `run` can be called from multiple threads. A worker that crashes
+    is discarded and a new one is started on demand.
+
+    Workers are replaced when a python file of their module changed
+    on disk since they were started, or after `max_jobs` jobs.
+    """
+    # seconds between checks of a module's files
+    MTIME_CHECK_INTERVAL = 10.
+
+    def __init__(self, processes: int = 1, verbose: bool = False, max_jobs: Optional[int] = None):
+        self.processes = max(1, processes)
+        self.verbose = verbose
+        self.max_jobs = max_jobs
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        # module path -> queue of idle workers
+        self._idle: Dict[str, queue.Queue] = dict()
+        # module path -> number of started workers
+        self._num_started: Dict[str, int] = dict()
+        self._workers: List["_Worker"] = []
+        # module path -> (time of check, latest modification time)
+        self._mtimes: Dict[str, Tuple[float, float]] = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run(self, path: Path, args: List[str], timeout: Optional[float] = None) -> Tuple[bytes, str]:
+        """
+        Run the scraper.py in `path` with command line `args`
+
+        :param timeout: optional float, seconds after which the worker is killed
+
+        :returns tuple of (stdout bytes, stderr)
+        :raises TimeoutError
+        """
+        worker = self._acquire(path)
+        try:
+            stdout, stderr = worker.run(args, timeout=timeout)
+        except TimeoutError:
+            self._discard(path, worker)
+            raise
+        except (EOFError, OSError, BrokenPipeError) as e:
+            self._discard(path, worker)
+            return b"", f"Scraper worker for '{path.name}' died: {type(e).__name__}: {e}"
+
+        self._release(path, worker)
+        return stdout, stderr
+
+    def close(self):
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+            self._idle.clear()
+            self._num_started.clear()
+        for worker in workers:
+            worker.close()
+
+    def _acquire(self, path: Path) -> "_Worker":
+        key = str(path)
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = queue.Queue()
+                self._num_started[key] = 0
+            idle = self._idle[key]
+            start_new = idle.empty() and self._num_started[key] < self.processes
+            if start_new:
+                self._num_started[key] += 1
+
+        mtime = self._module_mtime(path)
+        if start_new:
+            return self._start(path, mtime)
+
+        worker = idle.get()
+        if worker.mtime < mtime or (self.max_jobs and worker.num_jobs >= self.max_jobs):
+            if self.verbose:
+                print(f"replacing scraper worker for module '{path.name}'", file=sys.stderr)
+            self._discard(path, worker)
+            with self._lock:
+                self._num_started[key] += 1
+            return self._start(path, mtime)
+
+        return worker
+
+    def _start(self, path: Path, mtime: float) -> "_Worker":
+        if self.verbose:
+            print(f"starting scraper worker for module '{path.name}'", file=sys.stderr)
+        worker = _Worker(self._context, path, mtime)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _module_mtime(self, path: Path) -> float:
+        """
+        Returns the latest modification time of the module's python files,
+        checked at most every `MTIME_CHECK_INTERVAL` seconds
+        """
+        key = str(path)
+        now = time.monotonic()
+        with self._lock:
+            checked, mtime = self._mtimes.get(key, (None, 0.))
+        if checked is not None and now - checked < self.MTIME_CHECK_INTERVAL:
+            return mtime
+
+        mtime = 0.
+        for file in path.rglob("*.py"):
+            try:
+                mtime = max(mtime, file.stat().st_mtime)
+            except OSError:
+                pass
+        with self._lock:
+            self._mtimes[key] = (now, mtime)
+        return mtime
+
+    def _release(self, path: Path, worker: "_Worker"):
+        with self._lock:
+            idle = self._idle.get(str(path))
+        if idle is not None:
+            idle.put(worker)
+
+    def _discard(self, path: Path, worker: "_Worker"):
+        worker.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            key = str(path)
+            if key in self._num_started:
+                self._num_started[key] -= 1
+
+
+class _Worker:
+
+    def __init__(self, context, path: Path, mtime: float = 0.):
+        self.path = path
+        # the latest modification time of the module files when started
+        self.mtime = mtime
+        self.num_jobs = 0
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(str(path), child_connection),
+            name=f"scraper-worker-{path.name}",
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+    def run(self, args: List[str], timeout: Optional[float] = None) -> Tuple[bytes, str]:
+        self.num_jobs += 1
+        self.connection.send(args)
+        if timeout is not None and not self.connection.poll(timeout):
+            raise TimeoutError(f"Scraper worker for '{self.path.name}' exceeded {timeout} seconds")
+        return self.connection.recv()
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        if self.process.is_alive():
+            self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+def _worker_main(path: str, connection):
+    os.chdir(path)
+    sys.path.insert(0, path)
+
+    # import the scraper module and all its dependencies once
+    import_error = None
+    try:
+        importlib.import_module("scraper")
+    except BaseException:
+        import_error = traceback.format_exc()
+
+    while True:
+        try:
+            args = connection.recv()
+        except EOFError:
+            break
+        if args is None:
+            break
+
+        if import_error:
+            connection.send((b"", import_error))
+        else:
+            connection.send(_run_scraper_main(args))
+
+
+def _run_scraper_main(args: List[str]) -> Tuple[bytes, str]:
+    # like sys.stdout, the capture has a binary `buffer`
+    #   so binary output formats (msgpack) can be written
+    stdout_bytes = io.BytesIO()
+    stdout = io.TextIOWrapper(stdout_bytes, encoding="utf-8", write_through=True)
+    stderr = io.StringIO()
+    sys.argv = ["scraper.py", *args]
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            # executes the module code as '__main__', using the bytecode of
+            #   the already imported module
+            runpy.run_module("scraper", run_name="__main__", alter_sys=True)
+    except SystemExit:
+        pass
+    except BaseException:
+        stderr.write(traceback.format_exc())
+
+    stdout.flush()
+    return stdout_bytes.getvalue(), stderr.getvalue()
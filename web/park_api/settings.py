@@ -40,6 +40,23 @@ ALLOWED_HOSTS = config('DJANGO_ALLOWED_HOSTS').split()
 
 STATIC_ROOT = config("DJANGO_STATIC_PATH", default=BASE_DIR / "static", cast=Path)
 
+# place to store persistent state of the pa_scrape command
+SCRAPE_STATE_PATH = config("PA_SCRAPE_STATE_PATH", default=BASE_DIR / ".scrape-state", cast=Path)
+
+# cache for precomputed api responses. The default is in the memory of each
+#   process, so changes by the pa_scrape command reach the other processes
+#   after API_CACHE_SECONDS. Use a shared in-memory cache (e.g.
+#   django.core.cache.backends.memcached.PyMemcacheCache) to see them at once
+CACHES = {
+    "default": {
+        "BACKEND": config("PA_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("PA_CACHE_LOCATION", default=""),
+    }
+}
+
+# maximum age of a precomputed api response
+API_CACHE_SECONDS = config("PA_API_CACHE_SECONDS", default=300, cast=int)
+
 # --- end CI variables ---
 
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
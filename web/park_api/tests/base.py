@@ -2,9 +2,10 @@ from pathlib import Path
 import json
 import glob
 import datetime
-from typing import Tuple, List, Union
+from typing import Tuple, List, Union, Callable
 
 from django.test import TestCase
+from django.core.cache import cache
 from django.urls import reverse
 from django.contrib.gis.geos import Point
 from django.core.serializers.json import DjangoJSONEncoder
@@ -22,6 +23,11 @@ class TestBase(TestCase):
         super().__init__(*args, **kwargs)
         self.client = APIClient()
 
+    def setUp(self):
+        # rolled back database changes do not invalidate the caches
+        identity_cache.invalidate()
+        cache.clear()
+
     @classmethod
     def load_data(cls, filename: str) -> Union[dict, list]:
         return json.loads((cls.DATA_PATH / filename).read_text())
@@ -33,6 +39,21 @@ class TestBase(TestCase):
             loc["geo_point"] = Point(loc["geo_point"])
             Location.objects.create(**loc)
 
+    def for_each_store_method(self, test: Callable[[str, dict], None], filename: str = "dresden-01.json"):
+        """
+        Call `test(method, snapshot)` in a subTest for each `StoreMethod`
+        with a freshly loaded snapshot and without the lots of the previous method.
+        """
+        for method in StoreMethod.choices:
+            with self.subTest(method=method):
+                ParkingLot.objects.all().delete()
+                LatestParkingData.objects.all().delete()
+                test(method, self.load_data(filename))
+
+    @classmethod
+    def streaming_json(cls, response) -> Union[dict, list]:
+        return json.loads(b"".join(response.streaming_content))
+
     @classmethod
     def dump(cls, data: Union[list, dict]):
         print(json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder, indent=2))
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from .base import *
 
 
@@ -7,13 +9,16 @@ class TestApiV1(TestBase):
     def setUpTestData(cls):
         cls.store_location_fixtures()
 
-        data_models = store_snapshot(cls.load_data("datteln-01.json"))
+        # the class-wide transaction is never committed, run the callbacks of the snapshot signal
+        with cls.captureOnCommitCallbacks(execute=True):
+            data_models = store_snapshot(cls.load_data("datteln-01.json"))
         location_model = Location.objects.get(city="Datteln")
         for data_model in data_models:
             data_model.lot.location = location_model
             data_model.lot.save()
 
-        data_models = store_snapshot(cls.load_data("dresden-01.json"))
+        with cls.captureOnCommitCallbacks(execute=True):
+            data_models = store_snapshot(cls.load_data("dresden-01.json"))
         location_model = Location.objects.get(city="Dresden")
         for data_model in data_models:
             data_model.lot.location = location_model
@@ -51,6 +56,37 @@ class TestApiV1(TestBase):
             response["cities"],
         )
 
+    def test_101_root_cache(self):
+        url = reverse("api_v1:city-map")
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(response.content, cached_response.content)
+        self.assertEqual(response.data, json.loads(cached_response.content))
+
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code)
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH="*").status_code)
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=f'"x{etag[1:]}').status_code)
+
+        # a change of the pool invalidates the cache
+        pool = ParkingPool.objects.get(pool_id="dresden")
+        pool.attribution_url = "https://www.dresden.de/"
+        pool.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+        self.assertEqual("https://www.dresden.de/", response.data["cities"]["Dresden"]["attribution"]["url"])
+
+        # a lot that moves out of a city invalidates the cache
+        etag = response["ETag"]
+        lot = ParkingLot.objects.get(lot_id="dresdenaltmarkt")
+        lot.location = None
+        lot.save()
+        self.assertNotEqual(etag, self.client.get(url)["ETag"])
+
     def test_200_city(self):
         response = self.client.get(reverse("api_v1:city-lots", args=("Dresden", ))).data
 
@@ -88,3 +124,135 @@ class TestApiV1(TestBase):
             },
             response,
         )
+
+    def test_201_city_materialized(self):
+        url = reverse("api_v1:city-lots", args=("Dresden", ))
+        response = self.client.get(url)
+        # the response has been stored by the first request
+        with self.assertNumQueries(2):
+            self.assertEqual(response.content, self.client.get(url).content)
+
+        snapshot = self.load_data("dresden-01.json")
+        for lot in snapshot["lots"]:
+            lot["timestamp"] = "2022-03-01T17:30:00"
+        snapshot["lots"][0].update({"num_free": 100, "num_occupied": 300})
+
+        # the bulk method does not send model signals,
+        #   the pool is rendered once per transaction
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            store_snapshot(snapshot, method=StoreMethod.bulk)
+            store_snapshot(snapshot, method=StoreMethod.bulk)
+        self.assertEqual(1, len(callbacks))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url).data
+        self.assertEqual(datetime.datetime(2022, 3, 1, 17, 30), response["last_downloaded"])
+        self.assertEqual(100, response["lots"][0]["free"])
+
+        # changes outside of snapshots are visible as well
+        lot = ParkingLot.objects.get(lot_id="dresdenaltmarkt")
+        lot.name = "Altmarkt-Galerie"
+        lot.save()
+        self.assertEqual("Altmarkt-Galerie", self.client.get(url).data["lots"][0]["name"])
+
+
+class TestApiV1Timespan(TestBase):
+
+    def test_300_timespan_changes_only(self):
+        snapshot = self.load_data("dresden-01.json")
+        store_snapshot(snapshot, changes_only=True)
+        for lot in snapshot["lots"]:
+            lot["timestamp"] = "2022-03-01T17:28:52"
+        store_snapshot(snapshot, changes_only=True)
+
+        url = reverse("api_v1:timespan", args=("Dresden", "dresdenaltmarkt"))
+        response = self.streaming_json(self.client.get(url, {
+            "version": "1.1", "from": "2022-03-01T17:00:00", "to": "2022-03-01T18:00:00",
+        }))
+        self.assertEqual(
+            [
+                {"timestamp": "2022-03-01T17:23:52", "free": 154},
+                {"timestamp": "2022-03-01T17:28:52", "free": 154},
+            ],
+            response["data"],
+        )
+
+        # a row that started before the time range is clipped
+        response = self.streaming_json(self.client.get(url, {
+            "version": "1.1", "from": "2022-03-01T17:25:00", "to": "2022-03-01T18:00:00",
+        }))
+        self.assertEqual(
+            [
+                {"timestamp": "2022-03-01T17:25:00", "free": 154},
+                {"timestamp": "2022-03-01T17:28:52", "free": 154},
+            ],
+            response["data"],
+        )
+
+    def test_301_timespan_streaming(self):
+        from api_v1.timespan_view import TimespanView
+
+        snapshot = self.load_data("dresden-01.json")
+        store_snapshot(snapshot)
+        for lot in snapshot["lots"]:
+            lot["timestamp"] = "2022-03-01T17:28:52"
+        snapshot["lots"][0].update({"num_free": 100, "num_occupied": 300})
+        store_snapshot(snapshot)
+
+        url = reverse("api_v1:timespan", args=("Dresden", "dresdenaltmarkt"))
+        params = {"from": "2022-03-01T17:00:00", "to": "2022-03-01T18:00:00"}
+
+        # one row per chunk
+        with mock.patch.object(TimespanView, "chunk_size", 1):
+            response = self.client.get(url, params)
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        self.assertEqual(4, len(chunks))
+        self.assertEqual(
+            {"version": 1.0, "data": {"2022-03-01T17:23:52": 61, "2022-03-01T17:28:52": 75}},
+            json.loads(b"".join(chunks)),
+        )
+
+        response = self.streaming_json(self.client.get(url, {**params, "version": "1.1"}))
+        self.assertEqual(
+            [
+                {"timestamp": "2022-03-01T17:23:52", "free": 154},
+                {"timestamp": "2022-03-01T17:28:52", "free": 100},
+            ],
+            response["data"],
+        )
+
+        self.assertEqual(400, self.client.get(url, {"from": "2022-03-01"}).status_code)
+
+    def test_302_timespan_resolution(self):
+        snapshot = self.load_data("dresden-01.json")
+        store_snapshot(snapshot)
+        for timestamp, num_free in (("2022-03-01T17:28:52", 100), ("2022-03-01T18:05:00", 120)):
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = timestamp
+            snapshot["lots"][0].update({"num_free": num_free, "num_occupied": 400 - num_free})
+            store_snapshot(snapshot)
+
+        url = reverse("api_v1:timespan", args=("Dresden", "dresdenaltmarkt"))
+        params = {"from": "2022-03-01T17:00:00", "to": "2022-03-01T19:00:00", "resolution": "1h"}
+
+        response = self.streaming_json(self.client.get(url, {**params, "version": "1.1"}))
+        self.assertEqual(
+            [
+                {
+                    "timestamp": "2022-03-01T17:00:00",
+                    "free": 127, "free_min": 100, "free_mean": 127.0, "free_max": 154,
+                },
+                {
+                    "timestamp": "2022-03-01T18:00:00",
+                    "free": 120, "free_min": 120, "free_mean": 120.0, "free_max": 120,
+                },
+            ],
+            response["data"],
+        )
+
+        response = self.streaming_json(self.client.get(url, params))
+        self.assertEqual({"2022-03-01T17:00:00": 68, "2022-03-01T18:00:00": 70}, response["data"])
+
+        self.assertEqual(400, self.client.get(url, {**params, "resolution": "10s"}).status_code)
+        self.assertEqual(400, self.client.get(url, {**params, "resolution": "1w"}).status_code)
@@ -0,0 +1,37 @@
+from django.db import connection
+
+from .base import *
+
+
+class TestPartitions(TestBase):
+
+    def test_partition_start(self):
+        self.assertEqual(
+            datetime.datetime(2022, 3, 1),
+            partition_start(datetime.datetime(2022, 3, 31, 23, 59, 59)),
+        )
+
+    def test_create_and_remove(self):
+        snapshot = self.load_data("dresden-01.json")
+        for lot in snapshot["lots"]:
+            lot["timestamp"] = "2010-05-03T12:00:00"
+        # stored in the default partition
+        store_snapshot(snapshot)
+        # partitions can not be altered with pending foreign key checks in the test's transaction
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        self.assertEqual(
+            ["park_data_parkingdata_201005"],
+            create_partitions(datetime.datetime(2010, 5, 1), datetime.datetime(2010, 5, 2)),
+        )
+        self.assertEqual([], create_partitions(datetime.datetime(2010, 5, 1), datetime.datetime(2010, 5, 2)))
+        self.assertIn(
+            ("park_data_parkingdata_201005", datetime.datetime(2010, 5, 1), datetime.datetime(2010, 6, 1)),
+            get_partitions(),
+        )
+        # the rows have been moved from the default partition
+        self.assertEqual(2, ParkingData.objects.filter(timestamp__year=2010).count())
+
+        self.assertEqual(["park_data_parkingdata_201005"], remove_partitions(before=datetime.datetime(2010, 6, 1)))
+        self.assertEqual(0, ParkingData.objects.filter(timestamp__year=2010).count())
@@ -0,0 +1,125 @@
+from .base import *
+
+
+class TestRollups(TestBase):
+
+    def store_free(self, *values: Tuple[str, int], changes_only: bool = False):
+        snapshot = self.load_data("dresden-01.json")
+        for timestamp, num_free in values:
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = timestamp
+            snapshot["lots"][0].update({"num_free": num_free, "num_occupied": 400 - num_free})
+            store_snapshot(snapshot, changes_only=changes_only)
+
+    def test_update_rollups(self):
+        self.store_free(("2022-03-01T17:23:52", 154), ("2022-03-01T17:28:52", 100), ("2022-03-01T18:05:00", 120))
+
+        # the hour is not complete
+        self.assertEqual((0, 0), update_rollups(now=datetime.datetime(2022, 3, 1, 18, 5)))
+
+        self.assertEqual((2, 0), update_rollups(now=datetime.datetime(2022, 3, 1, 18, 15)))
+        hourly = ParkingDataHourly.objects.get(lot__lot_id="dresdenaltmarkt")
+        self.assertEqual(datetime.datetime(2022, 3, 1, 17), hourly.timestamp)
+        self.assertEqual(2, hourly.num_rows)
+        self.assertEqual((100, 127., 154), (hourly.num_free_min, hourly.num_free_mean, hourly.num_free_max))
+        self.assertEqual(400, hourly.capacity_max)
+        self.assertEqual(1., hourly.status_shares()["open"])
+
+        hourly = ParkingDataHourly.objects.get(lot__lot_id="dresdenanderfrauenkirche")
+        self.assertEqual(None, hourly.num_free_mean)
+        self.assertEqual(1., hourly.status_shares()["closed"])
+
+        # only the new hours and the completed day are aggregated
+        self.assertEqual((2, 2), update_rollups(now=datetime.datetime(2022, 3, 2, 0, 15)))
+        self.assertEqual((0, 0), update_rollups(now=datetime.datetime(2022, 3, 2, 0, 15)))
+
+        daily = ParkingDataDaily.objects.get(lot__lot_id="dresdenaltmarkt")
+        self.assertEqual(datetime.datetime(2022, 3, 1), daily.timestamp)
+        self.assertEqual(3, daily.num_rows)
+        self.assertEqual((100, 154), (daily.num_free_min, daily.num_free_max))
+        self.assertAlmostEqual(374 / 3, daily.num_free_mean)
+
+    def test_update_rollups_max_range(self):
+        self.store_free(("2022-03-01T17:23:52", 154), ("2022-03-02T05:00:00", 130), ("2022-03-03T10:05:00", 120))
+        now = datetime.datetime(2022, 3, 3, 11, 15)
+
+        # without rollups, only the last day is aggregated
+        update_rollups(now=now, max_range=datetime.timedelta(days=1))
+        self.assertEqual(
+            [datetime.datetime(2022, 3, 2, 5)],
+            sorted(set(ParkingDataHourly.objects.values_list("timestamp", flat=True))),
+        )
+
+        # a pause is caught up in steps of max_range, skipping the hours without data
+        rebuild_rollups(datetime.datetime(2022, 3, 1), now=datetime.datetime(2022, 3, 1, 18, 15))
+        update_rollups(now=now, max_range=datetime.timedelta(hours=5))
+        self.assertEqual(datetime.datetime(2022, 3, 2, 6), rollup_end())
+        update_rollups(now=now, max_range=datetime.timedelta(hours=5))
+        self.assertEqual(datetime.datetime(2022, 3, 3, 11), rollup_end())
+
+    def test_rollups_changes_only(self):
+        self.store_free(("2022-03-01T17:23:52", 154), ("2022-03-01T19:28:52", 154), changes_only=True)
+        self.assertEqual(1, ParkingData.objects.filter(lot__lot_id="dresdenaltmarkt").count())
+
+        update_rollups(now=datetime.datetime(2022, 3, 2, 1))
+        # the row is counted in each hour until it's last_seen timestamp
+        self.assertEqual(
+            [
+                (datetime.datetime(2022, 3, 1, 17), 1, 154),
+                (datetime.datetime(2022, 3, 1, 18), 1, 154),
+                (datetime.datetime(2022, 3, 1, 19), 1, 154),
+            ],
+            list(
+                ParkingDataHourly.objects.filter(lot__lot_id="dresdenaltmarkt")
+                .order_by("timestamp").values_list("timestamp", "num_rows", "num_free_sum")
+            ),
+        )
+        self.assertEqual(3, ParkingDataDaily.objects.get(lot__lot_id="dresdenaltmarkt").num_rows)
+
+        # rebuilding gives the same result
+        self.assertEqual((6, 2), rebuild_rollups(datetime.datetime(2022, 3, 1), now=datetime.datetime(2022, 3, 2, 1)))
+
+    def test_timespan_from_rollups(self):
+        self.store_free(("2022-03-01T17:23:52", 154), ("2022-03-01T17:28:52", 100), ("2022-03-01T18:05:00", 120))
+        url = reverse("api_v1:timespan", args=("Dresden", "dresdenaltmarkt"))
+        params = {"version": "1.1", "from": "2022-03-01T16:30:00", "to": "2022-03-01T19:00:00"}
+
+        def _get(resolution: str) -> list:
+            return self.streaming_json(self.client.get(url, {**params, "resolution": resolution}))["data"]
+
+        expected = {resolution: _get(resolution) for resolution in ("1h", "2h")}
+        self.assertEqual(
+            [
+                {"timestamp": "2022-03-01T16:00:00", "free": 127, "free_min": 100, "free_mean": 127.0, "free_max": 154},
+                {"timestamp": "2022-03-01T18:00:00", "free": 120, "free_min": 120, "free_mean": 120.0, "free_max": 120},
+            ],
+            expected["2h"],
+        )
+
+        # the 17:00 hour is read from the rollups, the rest from the data table
+        update_rollups(now=datetime.datetime(2022, 3, 1, 18, 15))
+        self.assertEqual(1, ParkingDataHourly.objects.filter(lot__lot_id="dresdenaltmarkt").count())
+        for resolution, data in expected.items():
+            self.assertEqual(data, _get(resolution))
+
+    def test_stats_from_rollups(self):
+        hour = floor_hour(datetime.datetime.utcnow()) - datetime.timedelta(hours=2)
+        self.store_free(
+            ((hour + datetime.timedelta(minutes=10)).isoformat(), 154),
+            ((hour + datetime.timedelta(minutes=20)).isoformat(), 100),
+            ((hour + datetime.timedelta(minutes=70)).isoformat(), 120),
+        )
+        url = reverse("stats")
+        params = {"hours": 4, "bucket_minutes": 60, "field": "num_free"}
+
+        def _get_buckets() -> list:
+            pools = self.client.get(url, params).context["pools"]
+            lot = [lot for pool in pools for lot in pool["lots"] if lot["lot_id"] == "dresdenaltmarkt"][0]
+            return lot["data"]["buckets"]
+
+        expected = _get_buckets()
+        self.assertEqual([127, 120], [value for value, _ in expected if value >= 0])
+
+        # the two completed hours of both lots are read from the rollups
+        self.assertEqual(4, update_rollups(delay=datetime.timedelta())[0])
+        self.assertEqual(expected, _get_buckets())
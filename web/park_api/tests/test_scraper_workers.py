@@ -0,0 +1,58 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from park_api.scraping import ScraperWorkerPool
+
+
+SCRAPER_PY = """
+import os
+import sys
+import json
+
+if __name__ == "__main__":
+    if sys.argv[1] == "crash":
+        os._exit(1)
+    elif sys.argv[1] == "fail":
+        raise ValueError("failed")
+    print(json.dumps({"args": sys.argv[1:], "pid": os.getpid()}))
+"""
+
+
+class TestScraperWorkers(SimpleTestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name) / "module"
+        self.path.mkdir()
+        (self.path / "scraper.py").write_text(SCRAPER_PY)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_worker_is_reused(self):
+        with ScraperWorkerPool(processes=1) as pool:
+            stdout, stderr = pool.run(self.path, ["scrape", "--pools", "a"])
+            result1 = json.loads(stdout)
+            self.assertEqual(["scrape", "--pools", "a"], result1["args"])
+
+            stdout, stderr = pool.run(self.path, ["list"])
+            result2 = json.loads(stdout)
+            self.assertEqual(["list"], result2["args"])
+            self.assertEqual(result1["pid"], result2["pid"])
+
+    def test_worker_errors(self):
+        with ScraperWorkerPool(processes=1) as pool:
+            stdout, stderr = pool.run(self.path, ["fail"])
+            self.assertEqual(b"", stdout)
+            self.assertIn("ValueError: failed", stderr)
+
+            stdout, stderr = pool.run(self.path, ["crash"])
+            self.assertEqual(b"", stdout)
+            self.assertIn("died", stderr)
+
+            # a new worker is started
+            stdout, stderr = pool.run(self.path, ["list"])
+            self.assertEqual(["list"], json.loads(stdout)["args"])
@@ -0,0 +1,245 @@
+import io
+import datetime
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from park_api.scraping import (
+    ScrapeSchedule, ScrapeDurations, PoolListCache, OutputFormat, iter_output, output_to_snapshots,
+    SnapshotArchiveWriter, iter_archive, iter_replay, CircuitBreaker, RunTelemetry, iter_measured_output,
+)
+from .base import TestBase, ErrorLog, ErrorLogSources, store_snapshot, log_error, ScrapeRun, reverse
+
+
+class TestScraping(SimpleTestCase):
+
+    def test_schedule(self):
+        schedule = ScrapeSchedule(interval=10)
+        schedule.add_spread(["a", "b"], now=0)
+
+        self.assertEqual(["a"], schedule.pop_due(now=0))
+        self.assertEqual(5., schedule.seconds_until_next(now=0))
+        self.assertEqual(["b"], schedule.pop_due(now=5))
+        # "a" is still running
+        self.assertEqual([], schedule.pop_due(now=10))
+
+        schedule.done("a")
+        schedule.done("b")
+        self.assertEqual(["b"], schedule.pop_due(now=15))
+        self.assertEqual(["a"], schedule.pop_due(now=20))
+
+        schedule.remove("b")
+        schedule.done("a")
+        self.assertEqual(["a"], schedule.pop_due(now=30))
+        self.assertEqual([], schedule.pop_due(now=35))
+
+    def test_durations_longest_first(self):
+        with tempfile.TemporaryDirectory() as path:
+            filename = Path(path) / "durations.json"
+            durations = ScrapeDurations(filename)
+            durations.update("module", "fast", 1.)
+            durations.update("module", "slow", 10.)
+            durations.save()
+
+            durations = ScrapeDurations(filename)
+            self.assertEqual(10., durations.get("module", "slow"))
+
+            module = Path("scrapers") / "module"
+            self.assertEqual(
+                [(module, "new"), (module, "slow"), (module, "fast")],
+                durations.sort_longest_first([(module, "fast"), (module, "slow"), (module, "new")])
+            )
+
+    def test_pool_list_cache(self):
+        with tempfile.TemporaryDirectory() as path:
+            module_path = Path(path) / "module"
+            module_path.mkdir()
+            (module_path / "scraper.py").write_text("print('[]')")
+
+            cache = PoolListCache(Path(path) / "cache")
+            self.assertIsNone(cache.get(module_path, None))
+
+            cache.set(module_path, None, ["a", "b"])
+            self.assertEqual(["a", "b"], cache.get(module_path, None))
+            self.assertIsNone(cache.get(module_path, ["a"]))
+
+            cache.set_feature(module_path, "output_format", True)
+            self.assertTrue(cache.get_feature(module_path, "output_format"))
+            self.assertIsNone(cache.get_feature(module_path, "other"))
+
+            (module_path / "scraper.py").write_text("print(['a'])")
+            self.assertIsNone(cache.get(module_path, None))
+            self.assertIsNone(cache.get_feature(module_path, "output_format"))
+
+    def test_jsonl_output(self):
+        stream = io.BytesIO(
+            b'{"pool": {"id": "a"}, "lots": [1]}\n'
+            b'\n'
+            b'{"pool": {"id": "a"}, "lots": [2]}\n'
+            b'{"error": "module failed"}\n'
+        )
+        outputs = [output_to_snapshots(obj) for obj in iter_output(stream, OutputFormat.jsonl)]
+        self.assertEqual(
+            [
+                [{"pool": {"id": "a"}, "lots": [1]}],
+                [{"pool": {"id": "a"}, "lots": [2]}],
+                {"error": "module failed"},
+            ],
+            outputs,
+        )
+
+        with self.assertRaises(ValueError):
+            list(iter_output(io.BytesIO(b'{"pool": \n'), OutputFormat.jsonl))
+
+    def test_archive(self):
+        with tempfile.TemporaryDirectory() as path:
+            with SnapshotArchiveWriter(path) as writer:
+                writer.write("module", None, [{"pool": {"id": "a"}, "lots": []}])
+                writer.write("module", "b", {"error": "failed"})
+
+            records = list(iter_replay(iter_archive(path), speed=0))
+            self.assertEqual(
+                [("module", None, [{"pool": {"id": "a"}, "lots": []}]), ("module", "b", {"error": "failed"})],
+                [(r["module"], r["pool"], r["output"]) for r in records],
+            )
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(threshold=2, delay=10, max_delay=30)
+        breaker.failure("module", "a", now=0)
+        self.assertTrue(breaker.allow("module", "a", now=1))
+
+        breaker.failure("module", "a", now=1)
+        self.assertTrue(breaker.is_open("module", "a"))
+        self.assertFalse(breaker.allow("module", "a", now=10))
+        self.assertTrue(breaker.allow("module", "a", now=11))
+
+        # a failed probe doubles the delay up to max_delay
+        breaker.failure("module", "a", now=11)
+        self.assertEqual(31, breaker.next_probe("module", "a"))
+        breaker.failure("module", "a", now=31)
+        self.assertEqual(61, breaker.next_probe("module", "a"))
+
+        breaker.success("module", "a")
+        self.assertFalse(breaker.is_open("module", "a"))
+        self.assertTrue(breaker.allow("module", "a", now=32))
+
+        # disabled
+        breaker = CircuitBreaker(threshold=0)
+        for i in range(10):
+            breaker.failure("module", "a")
+        self.assertTrue(breaker.allow("module", "a"))
+
+    def test_telemetry(self):
+        run = RunTelemetry("scrape")
+        task = run.task("module", "a")
+        stream = io.BytesIO(b'{"pool": {"id": "a"}, "lots": []}\n{"error": "failed"}\n')
+        self.assertEqual(
+            [{"pool": {"id": "a"}, "lots": []}, {"error": "failed"}],
+            list(iter_measured_output(stream, OutputFormat.jsonl, task)),
+        )
+        self.assertEqual(len(stream.getvalue()), task.num_bytes)
+        self.assertGreaterEqual(task.seconds["parse"], 0.)
+
+        run.task("module", "b")
+        task.finished = True
+        self.assertEqual([task], run.finished_tasks())
+        self.assertEqual(["b"], [t.pool_id for t in run.next_run().tasks])
+
+
+class TestScrapingHistory(TestBase):
+
+    def test_load_breaker_history(self):
+        from park_api.management.commands.pa_scrape import load_breaker_history
+
+        store_snapshot(self.load_data("dresden-01.json"))
+        now = datetime.datetime.utcnow()
+        for i in range(3):
+            ErrorLog.objects.create(
+                source=ErrorLogSources.pool, module_name="dresden", pool_id="dresden",
+                timestamp=now - datetime.timedelta(minutes=i),
+            )
+        # errors while storing are not scraper failures
+        ErrorLog.objects.create(
+            source=ErrorLogSources.store, module_name="dresden", pool_id="other", timestamp=now,
+        )
+
+        breaker = CircuitBreaker(threshold=3, delay=600)
+        load_breaker_history(breaker)
+        self.assertTrue(breaker.is_open("dresden", "dresden"))
+        self.assertFalse(breaker.allow("dresden", "dresden"))
+        self.assertFalse(breaker.is_open("dresden", "other"))
+
+        # a successful scrape resets the failures
+        snapshot = self.load_data("dresden-01.json")
+        for lot in snapshot["lots"]:
+            lot["timestamp"] = (now + datetime.timedelta(minutes=1)).isoformat()
+        store_snapshot(snapshot)
+        breaker = CircuitBreaker(threshold=3, delay=600)
+        load_breaker_history(breaker)
+        self.assertFalse(breaker.is_open("dresden", "dresden"))
+
+    def test_log_error(self):
+        now = datetime.datetime(2022, 3, 1, 12)
+        traceback = (
+            "Traceback (most recent call last):\n"
+            "  File \"scraper.py\", line 10, in <module>\n"
+            "ConnectionError: <Connection object at {}>: Failed after {} retries\n"
+        )
+        for i in range(3):
+            log_error(
+                ErrorLogSources.pool, "dresden", "dresden", traceback.format(hex(1000 + i), i),
+                now=now + datetime.timedelta(minutes=5 * i),
+            )
+        log_error(ErrorLogSources.pool, "dresden", "other", traceback.format("0x1", 1), now=now)
+
+        error_model = ErrorLog.objects.get(pool_id="dresden")
+        self.assertEqual(3, error_model.count)
+        self.assertEqual(now, error_model.timestamp)
+        self.assertEqual(now + datetime.timedelta(minutes=10), error_model.last_seen)
+        self.assertEqual("ConnectionError: <Connection object at 0x3e8>: Failed after 0 retries", error_model.text)
+        self.assertIn("Traceback", error_model.stacktrace)
+
+        # warnings before the traceback are not the message
+        for warning in ("DeprecationWarning: old api", "InsecureRequestWarning: Unverified HTTPS request"):
+            error_model = log_error(
+                ErrorLogSources.pool, "dresden", "warnings", f"scraper.py:1: {warning}\n" + traceback.format("0x1", 1),
+                now=now,
+            )
+        self.assertEqual("ConnectionError: <Connection object at 0x1>: Failed after 1 retries", error_model.text)
+        self.assertEqual(2, error_model.count)
+
+        # without traceback, the message is the first line
+        error_model = log_error(ErrorLogSources.store, "bonn", "bonn", "Invalid lot 'a'\ndetails", now=now)
+        self.assertEqual("Invalid lot 'a'", error_model.text)
+
+        # a new row after a pause
+        log_error(
+            ErrorLogSources.pool, "dresden", "dresden", traceback.format("0x1", 1),
+            now=now + datetime.timedelta(days=1),
+        )
+        self.assertEqual(
+            [3, 1],
+            list(ErrorLog.objects.filter(pool_id="dresden").order_by("timestamp").values_list("count", flat=True)),
+        )
+
+    def test_save_telemetry(self):
+        from park_api.management.commands.pa_scrape import save_telemetry
+
+        run = RunTelemetry("scrape", processes=2)
+        for pool_id in ("a", "b"):
+            task = run.task("module", pool_id)
+            task.seconds["scrape"] = 2.
+            task.num_snapshots = 1
+            task.num_lots = 10
+            task.finished = True
+        run.task("module", "c")
+
+        run_model = save_telemetry(run)
+        self.assertEqual(2, run_model.num_tasks)
+        self.assertEqual(20, ScrapeRun.objects.get().num_lots)
+        self.assertEqual(["a", "b"], sorted(run_model.tasks.values_list("pool_id", flat=True)))
+
+        response = self.client.get(reverse("scrape_stats"))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2., response.context["modules"][0]["seconds"])
@@ -1,3 +1,6 @@
+from django.db import connection, transaction, IntegrityError
+from django.test.utils import CaptureQueriesContext
+
 from .base import *
 
 
@@ -21,3 +24,268 @@ class TestStoreSnapshot(TestBase):
         self.assertEqual("nodata", data_models[0].status)
         self.assertEqual(None, data_models[0].num_free)
         self.assertEqual(None, data_models[0].percent_free)
+
+    def test_store_bulk(self):
+        snapshot = self.load_data("datteln-01.json")
+
+        data_models = store_snapshot(snapshot, method=StoreMethod.bulk)
+
+        self.assertEqual(207, data_models[0].capacity)
+        self.assertEqual(197, data_models[0].num_free)
+        self.assertEqual(10, data_models[0].num_occupied)
+        self.assertAlmostEqual(197 / 207 * 100., data_models[0].percent_free, places=2)
+        self.assertEqual(2, ParkingData.objects.count())
+
+        lot_model = ParkingLot.objects.get(lot_id="datteln-parkdeck-stadtgalerie")
+        self.assertEqual((7.341648, 51.652461), lot_model.geo_point.tuple)
+        self.assertEqual(197, lot_model.latest_data.num_free)
+
+        snapshot = self.load_data("datteln-02.json")
+        data_models = store_snapshot(snapshot, method=StoreMethod.bulk)
+
+        self.assertEqual(70, data_models[0].capacity)
+        self.assertEqual("nodata", data_models[0].status)
+        self.assertEqual(None, data_models[0].num_free)
+        self.assertEqual(None, data_models[0].percent_free)
+
+        lot_model = ParkingLot.objects.get(lot_id=data_models[0].lot.lot_id)
+        self.assertEqual("nodata", lot_model.latest_data.status)
+
+    def test_store_bulk_num_queries(self):
+        def _num_queries(snapshot: dict) -> int:
+            with CaptureQueriesContext(connection) as context:
+                store_snapshot(snapshot, method=StoreMethod.bulk)
+            return len(context.captured_queries)
+
+        small_snapshot = self.load_data("dresden-01.json")
+        large_snapshot = self.load_data("dresden-01.json")
+        large_snapshot["pool"]["id"] = "dresden-large"
+        large_snapshot["lots"] = [
+            {**lot, "id": f"{lot['id']}-{i}"}
+            for i in range(20)
+            for lot in large_snapshot["lots"]
+        ]
+
+        self.assertEqual(_num_queries(small_snapshot), _num_queries(large_snapshot))
+
+    def test_store_copy(self):
+        store_snapshot(self.load_data("dresden-01.json"), method=StoreMethod.copy)
+
+        data_model = ParkingData.objects.get(lot__lot_id="dresdenaltmarkt")
+        self.assertEqual(400, data_model.capacity)
+        self.assertEqual(154, data_model.num_free)
+        self.assertEqual(246, data_model.num_occupied)
+        self.assertAlmostEqual(154 / 400 * 100., data_model.percent_free, places=2)
+        self.assertEqual(datetime.datetime(2022, 3, 1, 17, 23, 36), data_model.lot_timestamp)
+
+        data_model = ParkingData.objects.get(lot__lot_id="dresdenanderfrauenkirche")
+        self.assertEqual(None, data_model.num_free)
+        self.assertEqual(None, data_model.percent_free)
+
+    def test_store_changes_only(self):
+        def _test(method: str, snapshot: dict):
+            store_snapshot(snapshot, method=method, changes_only=True)
+            self.assertEqual(2, ParkingData.objects.count())
+
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = "2022-03-01T17:28:52"
+            self.assertEqual([], store_snapshot(snapshot, method=method, changes_only=True))
+            self.assertEqual(2, ParkingData.objects.count())
+
+            snapshot["lots"][0].update({"timestamp": "2022-03-01T17:33:52", "num_free": 150})
+            snapshot["lots"][0].pop("num_occupied")
+            snapshot["lots"][1]["timestamp"] = "2022-03-01T17:33:52"
+            store_snapshot(snapshot, method=method, changes_only=True)
+            self.assertEqual(3, ParkingData.objects.count())
+
+            data_models = ParkingData.objects.filter(lot__lot_id="dresdenaltmarkt").order_by("timestamp")
+            self.assertEqual(
+                [
+                    (datetime.datetime(2022, 3, 1, 17, 23, 52), datetime.datetime(2022, 3, 1, 17, 28, 52), 154),
+                    (datetime.datetime(2022, 3, 1, 17, 33, 52), None, 150),
+                ],
+                [(d.timestamp, d.last_seen, d.num_free) for d in data_models],
+            )
+            data_model = ParkingData.objects.get(lot__lot_id="dresdenanderfrauenkirche")
+            self.assertEqual(datetime.datetime(2022, 3, 1, 17, 33, 52), data_model.last_seen)
+
+            lot_model = ParkingLot.objects.get(lot_id="dresdenanderfrauenkirche")
+            self.assertEqual(datetime.datetime(2022, 3, 1, 17, 33, 52), lot_model.latest_data.timestamp)
+
+        self.for_each_store_method(_test)
+
+    def test_store_skip_unchanged(self):
+        def _test(method: str, snapshot: dict):
+            self.assertEqual(2, len(store_snapshot(snapshot, method=method, skip_unchanged=True)))
+
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = "2022-03-01T17:28:52"
+            with CaptureQueriesContext(connection) as context:
+                self.assertIsNone(store_snapshot(snapshot, method=method, skip_unchanged=True))
+            self.assertFalse(
+                [q for q in context.captured_queries if "park_data_parkinglot" in q["sql"].split("WHERE")[0]],
+            )
+            self.assertEqual(2, ParkingData.objects.count())
+            self.assertEqual(
+                {datetime.datetime(2022, 3, 1, 17, 28, 52)},
+                set(ParkingData.objects.values_list("last_seen", flat=True)),
+            )
+            self.assertEqual(
+                {datetime.datetime(2022, 3, 1, 17, 28, 52)},
+                set(LatestParkingData.objects.values_list("timestamp", flat=True)),
+            )
+
+            # a changed lot stores the whole snapshot
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = "2022-03-01T17:33:52"
+            snapshot["lots"][0].update({"num_free": 150})
+            snapshot["lots"][0].pop("num_occupied")
+            self.assertEqual(2, len(store_snapshot(snapshot, method=method, skip_unchanged=True)))
+            self.assertEqual(4, ParkingData.objects.count())
+
+            # the lots have been stored without skip_unchanged in between
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = "2022-03-01T17:38:52"
+            store_snapshot(snapshot, method=method)
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = "2022-03-01T17:43:52"
+            self.assertIsNotNone(store_snapshot(snapshot, method=method, skip_unchanged=True))
+            self.assertEqual(8, ParkingData.objects.count())
+
+        self.for_each_store_method(_test)
+
+    def test_snapshot_hash(self):
+        snapshot = self.load_data("dresden-01.json")
+        content_hash = snapshot_hash(snapshot)
+        for lot in snapshot["lots"]:
+            lot["timestamp"] = "2022-03-01T17:28:52"
+        self.assertEqual(content_hash, snapshot_hash(snapshot))
+        snapshot["lots"][0]["num_free"] += 1
+        self.assertNotEqual(content_hash, snapshot_hash(snapshot))
+
+    def test_benchmark(self):
+        from park_api.management.commands.pa_benchmark import benchmark_store_method
+
+        result = benchmark_store_method(
+            StoreMethod.bulk, num_pools=2, num_lots=10, num_cycles=3, change_rate=0., changes_only=True,
+        )
+        self.assertEqual(6, result["snapshots"])
+        self.assertEqual(60, result["lots"])
+        self.assertEqual(0, result["errors"])
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        # nothing changed after the first cycle
+        self.assertEqual(20, result["rows"])
+        self.assertEqual(20, ParkingData.objects.count())
+
+    def test_store_bulk_identity_cache(self):
+        def _store(timestamp: str) -> List[str]:
+            snapshot = self.load_data("dresden-01.json")
+            for lot in snapshot["lots"]:
+                lot["timestamp"] = timestamp
+            with CaptureQueriesContext(connection) as context:
+                store_snapshot(snapshot, method=StoreMethod.bulk)
+            return [q["sql"] for q in context.captured_queries]
+
+        _store("2022-03-01T17:23:52")
+        _store("2022-03-01T17:28:52")
+        self.assertEqual(1, len(identity_cache))
+
+        # only the validation query reads the lots
+        queries = _store("2022-03-01T17:33:52")
+        self.assertEqual(1, len([q for q in queries if q.startswith("SELECT") and "park_data_parkinglot" in q]))
+
+        # a change in another process
+        ParkingLot.objects.filter(lot_id="dresdenaltmarkt").update(
+            name="Altmarkt 2", date_updated=datetime.datetime.utcnow(),
+        )
+        self.assertIsNone(identity_cache.get("dresden"))
+
+        # the name is changed back and the lots are loaded again with the next snapshot
+        _store("2022-03-01T17:38:52")
+        _store("2022-03-01T17:43:52")
+        self.assertEqual(1, len(identity_cache))
+        # a change in this process
+        ParkingLot.objects.get(lot_id="dresdenaltmarkt").save()
+        self.assertEqual(0, len(identity_cache))
+
+    def test_store_on_conflict(self):
+        def _test(method: str, snapshot: dict):
+            store_snapshot(snapshot, method=method, on_conflict=OnConflict.nothing)
+            store_snapshot(self.load_data("dresden-01.json"), method=method, on_conflict=OnConflict.nothing)
+            self.assertEqual(2, ParkingData.objects.count())
+
+            snapshot = self.load_data("dresden-01.json")
+            snapshot["lots"][0]["num_free"] = 150
+            snapshot["lots"][0].pop("num_occupied")
+            store_snapshot(snapshot, method=method, on_conflict=OnConflict.update)
+            self.assertEqual(2, ParkingData.objects.count())
+            data_model = ParkingData.objects.get(lot__lot_id="dresdenaltmarkt")
+            self.assertEqual(150, data_model.num_free)
+            self.assertEqual(250, data_model.num_occupied)
+
+            # replaying an older snapshot does not change the latest data
+            snapshot = self.load_data("dresden-01.json")
+            snapshot["lots"][0]["timestamp"] = "2022-03-01T17:00:00"
+            store_snapshot(snapshot, method=method, on_conflict=OnConflict.nothing)
+            self.assertEqual(3, ParkingData.objects.count())
+            lot_model = ParkingLot.objects.get(lot_id="dresdenaltmarkt")
+            self.assertEqual(datetime.datetime(2022, 3, 1, 17, 23, 52), lot_model.latest_data.timestamp)
+
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    store_snapshot(self.load_data("dresden-01.json"), method=method)
+
+        self.for_each_store_method(_test)
+
+    def test_store_transaction(self):
+        from park_api.management.commands.pa_scrape import store_snapshots
+
+        bad_snapshot = self.load_data("dresden-01.json")
+        bad_snapshot["pool"]["id"] = "dresden-bad"
+        for lot in bad_snapshot["lots"]:
+            lot["id"] += "-bad"
+        # exceeds the column length
+        bad_snapshot["lots"][1]["status"] = "x" * 100
+
+        with StoreTransaction(TransactionMode.rows, max_rows=100) as store_transaction:
+            store_snapshots(
+                "dresden", [self.load_data("dresden-01.json"), bad_snapshot],
+                store_transaction=store_transaction, method=StoreMethod.bulk,
+            )
+            self.assertEqual(0, store_transaction.num_commits)
+
+        self.assertEqual(1, store_transaction.num_commits)
+        self.assertEqual(2, ParkingData.objects.count())
+        self.assertEqual(1, ErrorLog.objects.filter(pool_id="dresden-bad").count())
+        # the bad snapshot is rolled back completely
+        self.assertFalse(ParkingPool.objects.filter(pool_id="dresden-bad").exists())
+
+    def test_store_invalid_lots(self):
+        def _test(method: str, snapshot: dict):
+            # inconsistent with capacity and num_free
+            snapshot["lots"][0]["num_occupied"] = 1
+
+            with self.assertRaises(ValueError):
+                store_snapshot(snapshot, method=method)
+
+            invalid_lots = []
+            data_models = store_snapshot(
+                snapshot, method=method, on_invalid=lambda lot, error: invalid_lots.append(lot["id"]),
+            )
+            self.assertEqual(["dresdenaltmarkt"], invalid_lots)
+            self.assertEqual(["dresdenanderfrauenkirche"], [d.lot.lot_id for d in data_models])
+            self.assertEqual(1, ParkingData.objects.count())
+
+        self.for_each_store_method(_test)
+
+    def test_calculate_derived_fields(self):
+        num_free, num_occupied, percent_free, errors = calculate_derived_fields(
+            capacity=[400, 120, None, 100],
+            num_free=[154, None, 3, 1],
+            num_occupied=[None, 20, None, 5],
+        )
+        self.assertEqual([154, 100, 3, 1], num_free)
+        self.assertEqual([246, 20, None, 5], num_occupied)
+        self.assertEqual([38.5, 83.33, None, None], percent_free)
+        self.assertEqual([None, None, None], errors[:3])
+        self.assertIn("invalid 'num_occupied'", errors[3])
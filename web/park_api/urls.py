@@ -19,10 +19,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic.base import RedirectView
 
-from .views import stats
+from .views import stats, scrape_stats
 
 urlpatterns = [
     path("stats/", stats.StatsView.as_view(), name="stats"),
+    path("stats/scrape/", scrape_stats.ScrapeStatsView.as_view(), name="scrape_stats"),
     path("admin/", admin.site.urls),
     path("api/", include('park_api.api_urls')),
     # Maintain API v1 compatibility by redirecting former URLs to new locations
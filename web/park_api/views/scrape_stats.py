@@ -0,0 +1,50 @@
+import datetime
+
+from django import views
+from django.shortcuts import render
+from django.db.models import Count, Sum, Avg, Max, F
+
+from park_data.models import *
+
+
+class ScrapeStatsView(views.View):
+    """
+    Summary of the recent scrape runs and the timing of each module
+    """
+
+    def get(self, request):
+        param_hours = max(1, int(request.GET.get("hours") or 24))
+        start_time = datetime.datetime.utcnow() - datetime.timedelta(hours=param_hours)
+
+        runs = ScrapeRun.objects.filter(date_started__gte=start_time).order_by("-date_started")[:20]
+
+        modules = (
+            ScrapeTask.objects
+            .filter(date_started__gte=start_time)
+            .values("module_name")
+            .annotate(
+                num_tasks=Count("id"),
+                spawn=Avg("spawn_seconds"),
+                scrape=Avg("scrape_seconds"),
+                parse=Avg("parse_seconds"),
+                store=Avg("store_seconds"),
+                max_seconds=Max(F("spawn_seconds") + F("scrape_seconds") + F("parse_seconds") + F("store_seconds")),
+                num_bytes=Avg("num_bytes"),
+                num_lots=Avg("num_lots"),
+                num_skipped=Sum("num_skipped"),
+                num_errors=Sum("num_errors"),
+                num_queries=Avg("num_queries"),
+            )
+        )
+        modules = list(modules)
+        for module in modules:
+            module["seconds"] = module["spawn"] + module["scrape"] + module["parse"] + module["store"]
+        # slowest first
+        modules.sort(key=lambda m: -m["seconds"])
+
+        context = {
+            "param_hours": param_hours,
+            "runs": runs,
+            "modules": modules,
+        }
+        return render(request, "park_api/scrape_stats.html", context)
@@ -3,6 +3,7 @@ import math
 
 from django import views
 from django.shortcuts import render
+from django.db.models import Q, Max
 
 from park_data.models import *
 
@@ -60,20 +61,68 @@ class StatsView(views.View):
 
         context["plot_width"] = int(math.pow(num_buckets, .5) * 3)
 
-        start_time = datetime.datetime.utcnow() - time_back
-        all_lot_data = (
-            ParkingData.objects.filter(timestamp__gte=start_time)
-            .exclude(**{param_field: None})
-            .values_list("lot__lot_id", "timestamp", param_field)
-        )
+        now = datetime.datetime.utcnow()
+        start_time = now - time_back
         lot_data_map = dict()
-        for lot_id, timestamp, num_free in all_lot_data:
+
+        def _add_to_bucket(buckets: list, bucket: int, count: int, value_sum: int):
+            buckets[bucket][0] = max(buckets[bucket][0], 0) + count
+            buckets[bucket][1] += value_sum
+
+        def _lot_buckets(lot_id: str) -> list:
             if lot_id not in lot_data_map:
                 lot_data_map[lot_id] = [[-1, 0] for i in range(num_buckets)]
-            bucket = int((timestamp - start_time).total_seconds() // bucket_width)
-            if 0 <= bucket < num_buckets:
-                lot_data_map[lot_id][bucket][0] = max(lot_data_map[lot_id][bucket][0], 0) + 1
-                lot_data_map[lot_id][bucket][1] += num_free
+            return lot_data_map[lot_id]
+
+        # hourly and daily buckets read the completed hours from the rollup tables
+        data_start_time = start_time
+        if param_field in ("num_free", "num_occupied") and bucket_width % 3600 == 0:
+            if bucket_width % 86400 == 0:
+                bucket_end = floor_day(now) + datetime.timedelta(days=1)
+            else:
+                bucket_end = floor_hour(now) + datetime.timedelta(hours=1)
+            start_time = bucket_end - num_buckets * datetime.timedelta(seconds=bucket_width)
+
+            hourly_end = max(start_time, min(now, rollup_end() or start_time))
+            daily_end = start_time
+            if bucket_width % 86400 == 0:
+                last_day = ParkingDataDaily.objects.aggregate(last=Max("timestamp"))["last"]
+                if last_day:
+                    daily_end = max(start_time, min(hourly_end, last_day + datetime.timedelta(days=1)))
+
+            for model, rollup_start, rollup_stop in (
+                    (ParkingDataDaily, start_time, daily_end),
+                    (ParkingDataHourly, daily_end, hourly_end),
+            ):
+                if rollup_start >= rollup_stop:
+                    continue
+                rollup_data = (
+                    model.objects.filter(
+                        timestamp__gte=rollup_start, timestamp__lt=rollup_stop, **{f"{param_field}_count__gt": 0}
+                    )
+                    .values_list("lot__lot_id", "timestamp", f"{param_field}_count", f"{param_field}_sum")
+                )
+                for lot_id, timestamp, count, value_sum in rollup_data:
+                    bucket = int((timestamp - start_time).total_seconds() // bucket_width)
+                    _add_to_bucket(_lot_buckets(lot_id), bucket, count, value_sum)
+
+            data_start_time = hourly_end
+
+        all_lot_data = (
+            ParkingData.objects.filter(
+                Q(timestamp__gte=data_start_time)
+                | Q(timestamp__gte=partition_start(data_start_time), last_seen__gte=data_start_time)
+            )
+            .exclude(**{param_field: None})
+            .values_list("lot__lot_id", "timestamp", "last_seen", param_field)
+        )
+        for lot_id, timestamp, last_seen, num_free in all_lot_data:
+            buckets = _lot_buckets(lot_id)
+            # rows stored with changes only count in each bucket until last_seen
+            first_bucket = int((max(timestamp, data_start_time) - start_time).total_seconds() // bucket_width)
+            last_bucket = int(((last_seen or timestamp) - start_time).total_seconds() // bucket_width)
+            for bucket in range(max(0, first_bucket), min(num_buckets, last_bucket + 1)):
+                _add_to_bucket(buckets, bucket, 1, num_free)
 
         # --- calc mean ---
 
@@ -79,8 +79,8 @@ class ParkingPoolAdmin(admin.ModelAdmin):
         # TODO: would rather move this to .annotate like with 'num_lots'
         #   but have to probably join ParkingPool and ErrorLog "by hand"
         date_boundary = datetime.datetime.utcnow() - datetime.timedelta(days=7)
-        qset = ErrorLog.objects.filter(pool_id=model.pool_id, timestamp__gte=date_boundary)
-        return qset.count()
+        qset = ErrorLog.objects.filter(pool_id=model.pool_id, last_seen__gte=date_boundary)
+        return qset.aggregate(num_errors=models.Sum("count"))["num_errors"] or 0
     num_errors_decorator.short_description = _("Errors (7 days)")
 
     def get_queryset(self, request):
@@ -173,6 +173,7 @@ class ParkingDataAdmin(admin.ModelAdmin):
     save_on_top = True
     list_display = (
         "timestamp",
+        "last_seen",
         "lot_decorator",
         "status",
         "capacity",
@@ -198,13 +199,100 @@ class ParkingDataAdmin(admin.ModelAdmin):
 class ErrorLogAdmin(admin.ModelAdmin):
     list_display = (
         "timestamp",
+        "last_seen",
+        "count",
         "source",
         "module_name",
         "pool_id",
         "text_decorator",
     )
-    list_filter = ("module_name", "pool_id",)
-    ordering = ("-timestamp", )
+    list_filter = ("source", "module_name", "pool_id",)
+    ordering = ("-last_seen", )
 
     def text_decorator(self, model: ErrorLog):
         return mark_safe(format_html("<pre>{}</pre>", model.text))
+
+
+class ScrapeTaskInline(admin.TabularInline):
+    model = ScrapeTask
+    extra = 0
+    readonly_fields = (
+        "date_started", "module_name", "pool_id",
+        "spawn_seconds", "scrape_seconds", "parse_seconds", "store_seconds",
+        "num_bytes", "num_snapshots", "num_skipped", "num_lots", "num_errors", "num_queries",
+    )
+    fields = readonly_fields
+    can_delete = False
+
+
+@register(ScrapeRun)
+class ScrapeRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "date_started",
+        "command",
+        "seconds_decorator",
+        "processes",
+        "num_tasks",
+        "num_snapshots",
+        "num_skipped",
+        "num_lots",
+        "num_errors",
+        "num_queries",
+    )
+    list_filter = ("command", )
+    ordering = ("-date_started", )
+    inlines = [ScrapeTaskInline]
+
+    def seconds_decorator(self, model: ScrapeRun):
+        return round(model.seconds, 1)
+    seconds_decorator.short_description = _("Seconds")
+
+
+@register(ScrapeTask)
+class ScrapeTaskAdmin(admin.ModelAdmin):
+    list_display = (
+        "date_started",
+        "module_name",
+        "pool_id",
+        "spawn_seconds",
+        "scrape_seconds",
+        "parse_seconds",
+        "store_seconds",
+        "num_bytes",
+        "num_lots",
+        "num_errors",
+        "num_queries",
+    )
+    list_filter = ("module_name", )
+    ordering = ("-date_started", )
+
+
+class ParkingDataRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "timestamp",
+        "lot",
+        "num_rows",
+        "num_free_min",
+        "num_free_mean_decorator",
+        "num_free_max",
+        "capacity_max",
+        "num_open",
+    )
+    list_filter = ("lot", )
+    list_select_related = ("lot", )
+    ordering = ("-timestamp", "lot__lot_id")
+
+    def num_free_mean_decorator(self, model: ParkingDataHourly):
+        mean = model.num_free_mean
+        return "-" if mean is None else round(mean, 1)
+    num_free_mean_decorator.short_description = _("Mean free")
+
+
+@register(ParkingDataHourly)
+class ParkingDataHourlyAdmin(ParkingDataRollupAdmin):
+    pass
+
+
+@register(ParkingDataDaily)
+class ParkingDataDailyAdmin(ParkingDataRollupAdmin):
+    pass
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class ParkDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'park_data'
+
+    def ready(self):
+        from .models import ParkingPool, ParkingLot, LatestParkingData
+
+        for model in (ParkingPool, ParkingLot, LatestParkingData):
+            post_save.connect(invalidate_identity_cache, sender=model)
+            post_delete.connect(invalidate_identity_cache, sender=model)
+
+
+def invalidate_identity_cache(sender, **kwargs):
+    from .models._identity_cache import identity_cache
+
+    identity_cache.invalidate()
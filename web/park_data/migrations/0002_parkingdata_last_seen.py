@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkingdata',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Datetime of the last snapshot with the same values (UTC), if stored with changes only', null=True, verbose_name='Last seen'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Converts park_data_parkingdata to a table that is range-partitioned by "timestamp"
+#   with one partition per month and a default partition.
+#   See park_data.models._partitions and the `pa_partitions` command.
+
+from django.db import migrations
+
+
+TABLE = "park_data_parkingdata"
+
+INDEXED_COLUMNS = [
+    "timestamp", "lot_timestamp", "status", "num_free", "capacity", "num_occupied", "percent_free",
+    "lot_id", "last_seen",
+]
+
+
+def create_constraints_sql(table: str, primary_key: str) -> str:
+    return "\n".join([
+        f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ({primary_key});',
+        f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_timestamp_lot_id_uniq" UNIQUE ("timestamp", "lot_id");',
+        f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_lot_id_fk_park_data_parkinglot_id"'
+        f' FOREIGN KEY ("lot_id") REFERENCES "park_data_parkinglot" ("id") DEFERRABLE INITIALLY DEFERRED;',
+    ] + [
+        f'CREATE INDEX "{table}_{column}_idx" ON "{table}" ("{column}");'
+        for column in INDEXED_COLUMNS
+    ])
+
+
+FORWARD_CREATE_SQL = f"""
+ALTER TABLE "{TABLE}" RENAME TO "{TABLE}_unpartitioned";
+CREATE TABLE "{TABLE}" (LIKE "{TABLE}_unpartitioned" INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp");
+ALTER SEQUENCE "{TABLE}_id_seq" OWNED BY "{TABLE}"."id";
+CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT;
+"""
+
+FORWARD_COPY_SQL = f"""
+INSERT INTO "{TABLE}" SELECT * FROM "{TABLE}_unpartitioned";
+DROP TABLE "{TABLE}_unpartitioned";
+""" + create_constraints_sql(TABLE, '"id", "timestamp"')
+
+REVERSE_SQL = f"""
+CREATE TABLE "{TABLE}_unpartitioned" (LIKE "{TABLE}" INCLUDING DEFAULTS);
+INSERT INTO "{TABLE}_unpartitioned" SELECT * FROM "{TABLE}";
+ALTER SEQUENCE "{TABLE}_id_seq" OWNED BY "{TABLE}_unpartitioned"."id";
+DROP TABLE "{TABLE}";
+ALTER TABLE "{TABLE}_unpartitioned" RENAME TO "{TABLE}";
+""" + create_constraints_sql(TABLE, '"id"')
+
+
+def create_monthly_partitions(apps, schema_editor):
+    """
+    Create the partitions for the existing rows and the next months
+    before the rows are copied.
+    """
+    import datetime
+
+    def _month(dt: datetime.datetime, offset: int = 0) -> datetime.datetime:
+        month = dt.year * 12 + dt.month - 1 + offset
+        return datetime.datetime(month // 12, month % 12 + 1, 1)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN("timestamp"), MAX("timestamp") FROM "{TABLE}_unpartitioned"')
+        min_timestamp, max_timestamp = cursor.fetchone()
+
+        now = datetime.datetime.utcnow()
+        start = _month(min(min_timestamp or now, now))
+        end = _month(max(max_timestamp or now, now), 2)
+        while start <= end:
+            cursor.execute(
+                f'CREATE TABLE "{TABLE}_{start:%Y%m}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+                [start, _month(start, 1)],
+            )
+            start = _month(start, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0002_parkingdata_last_seen'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD_CREATE_SQL, reverse_sql=REVERSE_SQL),
+        migrations.RunPython(create_monthly_partitions, reverse_code=migrations.RunPython.noop),
+        migrations.RunSQL(FORWARD_COPY_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
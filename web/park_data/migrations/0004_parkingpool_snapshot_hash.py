@@ -0,0 +1,23 @@
+# Generated by Django 3.2.9 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0003_partition_parkingdata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkingpool',
+            name='snapshot_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the last stored snapshot, if stored with skip_unchanged', max_length=40, null=True, verbose_name='Snapshot hash'),
+        ),
+        migrations.AddField(
+            model_name='parkingpool',
+            name='snapshot_timestamp',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Datetime of the last snapshot with the same hash (UTC)', null=True, verbose_name='Snapshot timestamp'),
+        ),
+    ]
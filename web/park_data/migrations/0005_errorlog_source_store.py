@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-17 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0004_parkingpool_snapshot_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='errorlog',
+            name='source',
+            field=models.CharField(choices=[('module', 'module'), ('pool', 'pool'), ('store', 'store')], db_index=True, max_length=16, verbose_name='Source of error'),
+        ),
+    ]
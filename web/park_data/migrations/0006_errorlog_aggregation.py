@@ -0,0 +1,44 @@
+# Generated by Django 3.2.9 on 2026-10-17 13:05
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0005_errorlog_source_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='errorlog',
+            name='count',
+            field=models.IntegerField(default=1, help_text='Number of occurrences', verbose_name='Count'),
+        ),
+        migrations.AddField(
+            model_name='errorlog',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Hash of source, module, pool and normalized message', max_length=40, null=True, verbose_name='Fingerprint'),
+        ),
+        migrations.AddField(
+            model_name='errorlog',
+            name='last_seen',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime.utcnow, help_text='Datetime of the last occurrence (UTC)', verbose_name='Last seen'),
+        ),
+        migrations.AlterField(
+            model_name='errorlog',
+            name='stacktrace',
+            field=models.TextField(blank=True, help_text='Complete output of the first occurrence', null=True, verbose_name='Stacktrace'),
+        ),
+        migrations.AlterField(
+            model_name='errorlog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime.utcnow, help_text='Datetime of the first occurrence (UTC)', verbose_name='Timestamp'),
+        ),
+        # existing rows are single occurrences
+        migrations.RunSQL(
+            'UPDATE "park_data_errorlog" SET "last_seen" = "timestamp"',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.9 on 2026-10-17 13:50
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0006_errorlog_aggregation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_started', models.DateTimeField(db_index=True, default=datetime.datetime.utcnow, verbose_name='Started')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('command', models.CharField(max_length=16, verbose_name='Command')),
+                ('processes', models.IntegerField(default=1, verbose_name='Processes')),
+                ('options', models.JSONField(blank=True, help_text='Store method, output format and other options', null=True, verbose_name='Options')),
+                ('num_tasks', models.IntegerField(default=0, verbose_name='Tasks')),
+                ('num_snapshots', models.IntegerField(default=0, verbose_name='Snapshots')),
+                ('num_skipped', models.IntegerField(default=0, help_text='Number of unchanged snapshots that have been skipped', verbose_name='Skipped')),
+                ('num_lots', models.IntegerField(default=0, verbose_name='Lots')),
+                ('num_errors', models.IntegerField(default=0, verbose_name='Errors')),
+                ('num_queries', models.IntegerField(default=0, verbose_name='Queries')),
+            ],
+            options={
+                'verbose_name': 'Scrape run',
+                'verbose_name_plural': 'Scrape runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='ScrapeTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_started', models.DateTimeField(db_index=True, verbose_name='Started')),
+                ('module_name', models.CharField(db_index=True, max_length=64, verbose_name='Module name')),
+                ('pool_id', models.CharField(blank=True, db_index=True, help_text='Empty if all pools of the module were scraped in one call', max_length=64, null=True, verbose_name='Pool ID')),
+                ('spawn_seconds', models.FloatField(default=0.0, help_text='Seconds to start the scraper process', verbose_name='Spawn')),
+                ('scrape_seconds', models.FloatField(default=0.0, help_text='Seconds waiting for the scraper output', verbose_name='Scrape')),
+                ('parse_seconds', models.FloatField(default=0.0, help_text='Seconds decoding the scraper output', verbose_name='Parse')),
+                ('store_seconds', models.FloatField(default=0.0, help_text='Seconds storing the snapshots', verbose_name='Store')),
+                ('num_bytes', models.IntegerField(default=0, help_text='Size of the scraper output', verbose_name='Bytes')),
+                ('num_snapshots', models.IntegerField(default=0, verbose_name='Snapshots')),
+                ('num_skipped', models.IntegerField(default=0, verbose_name='Skipped')),
+                ('num_lots', models.IntegerField(default=0, verbose_name='Lots')),
+                ('num_errors', models.IntegerField(default=0, verbose_name='Errors')),
+                ('num_queries', models.IntegerField(default=0, verbose_name='Queries')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='park_data.scraperun', verbose_name='Run')),
+            ],
+            options={
+                'verbose_name': 'Scrape task',
+                'verbose_name_plural': 'Scrape tasks',
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.9 on 2026-10-17 16:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park_data', '0007_scraperun_scrapetask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParkingDataHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True, help_text='Start of the time bucket (UTC)', verbose_name='Timestamp')),
+                ('num_rows', models.IntegerField(default=0, verbose_name='Rows')),
+                ('num_free_count', models.IntegerField(default=0, verbose_name='Rows with free')),
+                ('num_free_sum', models.BigIntegerField(default=0, verbose_name='Sum of free')),
+                ('num_free_min', models.IntegerField(blank=True, null=True, verbose_name='Min free')),
+                ('num_free_max', models.IntegerField(blank=True, null=True, verbose_name='Max free')),
+                ('num_occupied_count', models.IntegerField(default=0, verbose_name='Rows with occupied')),
+                ('num_occupied_sum', models.BigIntegerField(default=0, verbose_name='Sum of occupied')),
+                ('num_occupied_min', models.IntegerField(blank=True, null=True, verbose_name='Min occupied')),
+                ('num_occupied_max', models.IntegerField(blank=True, null=True, verbose_name='Max occupied')),
+                ('capacity_max', models.IntegerField(blank=True, null=True, verbose_name='Max capacity')),
+                ('num_open', models.IntegerField(default=0, verbose_name='Open')),
+                ('num_closed', models.IntegerField(default=0, verbose_name='Closed')),
+                ('num_unknown', models.IntegerField(default=0, verbose_name='Unknown')),
+                ('num_nodata', models.IntegerField(default=0, verbose_name='No data')),
+                ('num_error', models.IntegerField(default=0, verbose_name='Error')),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='park_data.parkinglot', verbose_name='Parking lot')),
+            ],
+            options={
+                'verbose_name': 'Hourly parking data',
+                'verbose_name_plural': 'Hourly parking data',
+                'abstract': False,
+                'unique_together': {('lot', 'timestamp')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ParkingDataDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True, help_text='Start of the time bucket (UTC)', verbose_name='Timestamp')),
+                ('num_rows', models.IntegerField(default=0, verbose_name='Rows')),
+                ('num_free_count', models.IntegerField(default=0, verbose_name='Rows with free')),
+                ('num_free_sum', models.BigIntegerField(default=0, verbose_name='Sum of free')),
+                ('num_free_min', models.IntegerField(blank=True, null=True, verbose_name='Min free')),
+                ('num_free_max', models.IntegerField(blank=True, null=True, verbose_name='Max free')),
+                ('num_occupied_count', models.IntegerField(default=0, verbose_name='Rows with occupied')),
+                ('num_occupied_sum', models.BigIntegerField(default=0, verbose_name='Sum of occupied')),
+                ('num_occupied_min', models.IntegerField(blank=True, null=True, verbose_name='Min occupied')),
+                ('num_occupied_max', models.IntegerField(blank=True, null=True, verbose_name='Max occupied')),
+                ('capacity_max', models.IntegerField(blank=True, null=True, verbose_name='Max capacity')),
+                ('num_open', models.IntegerField(default=0, verbose_name='Open')),
+                ('num_closed', models.IntegerField(default=0, verbose_name='Closed')),
+                ('num_unknown', models.IntegerField(default=0, verbose_name='Unknown')),
+                ('num_nodata', models.IntegerField(default=0, verbose_name='No data')),
+                ('num_error', models.IntegerField(default=0, verbose_name='Error')),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='park_data.parkinglot', verbose_name='Parking lot')),
+            ],
+            options={
+                'verbose_name': 'Daily parking data',
+                'verbose_name_plural': 'Daily parking data',
+                'abstract': False,
+                'unique_together': {('lot', 'timestamp')},
+            },
+        ),
+    ]
@@ -1,6 +1,19 @@
-from ._store import store_snapshot
-from .error_log import ErrorLog, ErrorLogSources
-from .parking_data import ParkingData, ParkingLotState, LatestParkingData
+from ._copy import copy_parking_data, insert_parking_data, OnConflict
+from ._identity_cache import IdentityCache, identity_cache
+from ._partitions import (
+    partition_start, get_partitions, create_partitions, ensure_partitions, remove_partitions,
+)
+from ._rollups import (
+    aggregate_parking_data, merge_rollup_values, rollup_end, update_rollups, rebuild_rollups,
+    next_rollup_update, floor_hour, floor_day, ROLLUP_COLUMNS, ROLLUP_DELAY,
+)
+from ._snapshot_hash import snapshot_hash
+from ._store import store_snapshot, StoreMethod
+from ._transaction import StoreTransaction, TransactionMode
+from .error_log import ErrorLog, ErrorLogSources, log_error
+from .parking_data import ParkingData, ParkingLotState, LatestParkingData, calculate_derived_fields
+from .parking_data_rollup import ParkingDataHourly, ParkingDataDaily
 from .parking_lot import ParkingLot
 from .parking_pool import ParkingPool
+from .scrape_run import ScrapeRun, ScrapeTask
 from .timestamped import TimestampedModel, TimestampedGeoModel
@@ -0,0 +1,166 @@
+import csv
+import io
+from typing import Iterable, List, Optional
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from .parking_data import ParkingData, calculate_derived_fields
+
+
+# the ParkingData fields that are written by `copy_parking_data`
+COPY_FIELDS = [
+    "timestamp", "lot_timestamp", "status", "num_free", "capacity", "num_occupied", "percent_free", "lot",
+    "last_seen",
+]
+
+# the fields that are updated by `insert_parking_data` with `OnConflict.update`
+UPDATE_FIELDS = [
+    "lot_timestamp", "status", "num_free", "capacity", "num_occupied", "percent_free",
+]
+
+
+class OnConflict:
+    error = "error"         # raise IntegrityError if a (timestamp, lot) row exists
+    nothing = "nothing"     # keep the existing row
+    update = "update"       # overwrite the values of the existing row
+
+    choices = (error, nothing, update)
+
+
+def copy_parking_data(
+        data_models: Iterable[ParkingData],
+        using: str = DEFAULT_DB_ALIAS,
+        table: Optional[str] = None,
+) -> int:
+    """
+    Write ParkingData rows with PostgreSQL's `COPY FROM STDIN`.
+
+    This is considerably faster than INSERT for large numbers of rows,
+    e.g. when back-filling history.
+
+    The derived fields are calculated like in `ParkingData.save`.
+    The `lot` of each instance must already be stored.
+
+    Note that the primary keys of the instances will not be set.
+
+    :param table: optional str, copy to this table instead of the ParkingData table
+
+    :returns int, number of written rows
+    """
+    connection = connections[using]
+    fields = [ParkingData._meta.get_field(name) for name in COPY_FIELDS]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    num_rows = 0
+    for row in _prepare_rows(data_models, fields, connection):
+        writer.writerow([_csv_value(value) for value in row])
+        num_rows += 1
+
+    if not num_rows:
+        return 0
+
+    buffer.seek(0)
+    sql = "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)".format(
+        table=connection.ops.quote_name(table or ParkingData._meta.db_table),
+        columns=", ".join(connection.ops.quote_name(field.column) for field in fields),
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+
+    return num_rows
+
+
+def insert_parking_data(
+        data_models: Iterable[ParkingData],
+        on_conflict: str = OnConflict.nothing,
+        use_copy: bool = False,
+        batch_size: int = 1000,
+        using: str = DEFAULT_DB_ALIAS,
+) -> int:
+    """
+    Write ParkingData rows with `INSERT ... ON CONFLICT`
+    so that storing the same snapshot again does not fail.
+
+    With `use_copy`, the rows are copied to a temporary table first
+    and inserted from there with a single statement.
+
+    Like in `copy_parking_data`, the primary keys of the instances
+    will not be set.
+
+    :param on_conflict: str, `OnConflict.nothing` or `OnConflict.update`
+
+    :returns int, number of passed rows
+    """
+    if on_conflict not in (OnConflict.nothing, OnConflict.update):
+        raise ValueError(f"Invalid on_conflict '{on_conflict}' for insert_parking_data")
+
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = ParkingData._meta.db_table
+    fields = [ParkingData._meta.get_field(name) for name in COPY_FIELDS]
+    columns = ", ".join(qn(field.column) for field in fields)
+
+    conflict_sql = 'ON CONFLICT ("timestamp", "lot_id") DO NOTHING'
+    if on_conflict == OnConflict.update:
+        conflict_sql = 'ON CONFLICT ("timestamp", "lot_id") DO UPDATE SET {}'.format(", ".join(
+            "{column} = EXCLUDED.{column}".format(column=qn(ParkingData._meta.get_field(name).column))
+            for name in UPDATE_FIELDS
+        ))
+
+    if use_copy:
+        temp_table = f"{table}_insert"
+        # on errors, the rollback also removes the temporary table
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            # only the copied columns, without defaults (e.g. the id sequence) and constraints
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {qn(temp_table)} AS SELECT {columns} FROM {qn(table)} WITH NO DATA"
+            )
+            num_rows = copy_parking_data(data_models, using=using, table=temp_table)
+            cursor.execute(
+                f"INSERT INTO {qn(table)} ({columns}) SELECT {columns} FROM {qn(temp_table)} {conflict_sql}"
+            )
+            cursor.execute(f"DROP TABLE {qn(temp_table)}")
+        return num_rows
+
+    rows = list(_prepare_rows(data_models, fields, connection))
+    row_sql = "({})".format(", ".join(["%s"] * len(fields)))
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            cursor.execute(
+                f"INSERT INTO {qn(table)} ({columns}) VALUES {', '.join([row_sql] * len(batch))} {conflict_sql}",
+                [value for row in batch for value in row],
+            )
+
+    return len(rows)
+
+
+def _prepare_rows(data_models: Iterable[ParkingData], fields: list, connection) -> Iterable[List]:
+    data_models = list(data_models)
+    num_free, num_occupied, percent_free, errors = calculate_derived_fields(
+        capacity=[data_model.capacity for data_model in data_models],
+        num_free=[data_model.num_free for data_model in data_models],
+        num_occupied=[data_model.num_occupied for data_model in data_models],
+        percent_free=[data_model.percent_free for data_model in data_models],
+    )
+    for i, data_model in enumerate(data_models):
+        if errors[i]:
+            raise ValueError(f"Data '{data_model}' {errors[i]}")
+        data_model.num_free, data_model.num_occupied, data_model.percent_free = \
+            num_free[i], num_occupied[i], percent_free[i]
+
+        # lots might have been saved after assignment
+        if data_model.lot_id is None:
+            data_model.lot_id = data_model.lot.pk
+        yield [
+            field.get_db_prep_save(getattr(data_model, field.attname), connection)
+            for field in fields
+        ]
+
+
+def _csv_value(value):
+    # an unquoted empty value is NULL in postgres' csv format
+    if value is None:
+        return ""
+    return value
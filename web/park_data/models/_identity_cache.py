@@ -0,0 +1,81 @@
+from typing import Dict, Optional, Tuple
+
+from django.db.models import Count, Max
+
+from .parking_pool import ParkingPool
+from .parking_lot import ParkingLot
+
+
+class IdentityCache:
+    """
+    In-process cache of the ParkingPool and ParkingLot instances
+    (including their LatestParkingData) of each pool for the bulk store methods.
+
+    An entry is validated before each use with a single query that
+    compares the pool's primary key, last update and the number of lots
+    and their last update. Changes in other processes, e.g. the admin,
+    therefore invalidate the entry.
+
+    Saving or deleting models in this process invalidates the cache
+    through the signals connected in `park_data.apps`.
+    """
+
+    def __init__(self):
+        # pool_id -> (fingerprint, pool_model, {lot_id: lot_model})
+        self._entries: Dict[str, Tuple[tuple, ParkingPool, Dict[str, ParkingLot]]] = dict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, pool_id: str) -> Optional[Tuple[ParkingPool, Dict[str, ParkingLot]]]:
+        """
+        Returns the cached pool model and a copy of it's lot model map
+        if they are still up-to-date.
+        """
+        entry = self._entries.get(pool_id)
+        if entry is None:
+            return None
+
+        fingerprint, pool_model, lot_model_map = entry
+        if self.fingerprint(pool_id) != fingerprint:
+            del self._entries[pool_id]
+            return None
+
+        return pool_model, dict(lot_model_map)
+
+    def load(self, pool_model: ParkingPool) -> Dict[str, ParkingLot]:
+        """
+        Query all lots of the pool and store them in the cache.
+
+        :returns dict of lot_id -> ParkingLot
+        """
+        fingerprint = self.fingerprint(pool_model.pool_id)
+        lot_model_map = {
+            lot_model.lot_id: lot_model
+            for lot_model in ParkingLot.objects.filter(pool_id=pool_model.pk).select_related("latest_data")
+        }
+        self._entries[pool_model.pool_id] = (fingerprint, pool_model, dict(lot_model_map))
+        return lot_model_map
+
+    def invalidate(self, pool_id: Optional[str] = None):
+        """
+        Remove the entry of the pool or all entries
+        """
+        if pool_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(pool_id, None)
+
+    def fingerprint(self, pool_id: str) -> tuple:
+        """
+        Returns a tuple that changes when the pool or one of it's lots are changed
+        """
+        return tuple(
+            ParkingPool.objects
+            .filter(pool_id=pool_id)
+            .annotate(num_lots=Count("parkinglot"), lots_updated=Max("parkinglot__date_updated"))
+            .values_list("pk", "date_updated", "num_lots", "lots_updated")
+        )
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,167 @@
+"""
+Management of the monthly range partitions of the ParkingData table.
+
+The table is partitioned by `timestamp` (see migration 0003).
+Rows outside of all monthly partitions are stored in the default partition.
+"""
+import datetime
+import re
+from typing import List, Tuple, Optional
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from .parking_data import ParkingData
+
+
+def partition_start(timestamp: datetime.datetime) -> datetime.datetime:
+    """
+    Start of the partition (the month) that contains the timestamp
+    """
+    return datetime.datetime(timestamp.year, timestamp.month, 1)
+
+
+def next_partition_start(timestamp: datetime.datetime) -> datetime.datetime:
+    start = partition_start(timestamp)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(timestamp: datetime.datetime) -> str:
+    return "{}_{:%Y%m}".format(ParkingData._meta.db_table, partition_start(timestamp))
+
+
+def default_partition_name() -> str:
+    return f"{ParkingData._meta.db_table}_default"
+
+
+def get_partitions(using: str = DEFAULT_DB_ALIAS) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+    """
+    Return the (name, start, end) of each monthly partition, sorted by start.
+
+    The default partition is not included.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s""",
+            [ParkingData._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = re.match(r"^{}_(\d\d\d\d)(\d\d)$".format(ParkingData._meta.db_table), name)
+        if match:
+            start = datetime.datetime(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((name, start, next_partition_start(start)))
+
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partitions(
+        start: datetime.datetime,
+        end: datetime.datetime,
+        using: str = DEFAULT_DB_ALIAS,
+) -> List[str]:
+    """
+    Create the monthly partitions for all timestamps between start and end (inclusive).
+
+    Rows of the new partitions' months that were stored in the default
+    partition are moved to the new partitions.
+
+    :returns list of created partition names
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = ParkingData._meta.db_table
+    existing = {p[0] for p in get_partitions(using=using)}
+
+    created = []
+    start = partition_start(start)
+    while start <= end:
+        end_of_partition = next_partition_start(start)
+        name = partition_name(start)
+
+        if name not in existing:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute(
+                    f"""SELECT EXISTS(SELECT 1 FROM {qn(default_partition_name())}
+                    WHERE "timestamp" >= %s AND "timestamp" < %s)""",
+                    [start, end_of_partition],
+                )
+                if not cursor.fetchone()[0]:
+                    cursor.execute(
+                        f"""CREATE TABLE {qn(name)} PARTITION OF {qn(table)}
+                        FOR VALUES FROM (%s) TO (%s)""",
+                        [start, end_of_partition],
+                    )
+                else:
+                    # a partition can not be created while the default partition
+                    #   contains rows of it's range
+                    cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS)")
+                    cursor.execute(
+                        f"""WITH moved AS (
+                            DELETE FROM {qn(default_partition_name())}
+                            WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+                        ) INSERT INTO {qn(name)} SELECT * FROM moved""",
+                        [start, end_of_partition],
+                    )
+                    cursor.execute(
+                        f"""ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)}
+                        FOR VALUES FROM (%s) TO (%s)""",
+                        [start, end_of_partition],
+                    )
+            created.append(name)
+
+        start = end_of_partition
+
+    return created
+
+
+def ensure_partitions(
+        now: Optional[datetime.datetime] = None,
+        months_ahead: int = 2,
+        using: str = DEFAULT_DB_ALIAS,
+) -> List[str]:
+    """
+    Create the partitions of the current and the next `months_ahead` months.
+
+    :returns list of created partition names
+    """
+    now = now or datetime.datetime.utcnow()
+    end = partition_start(now)
+    for i in range(months_ahead):
+        end = next_partition_start(end)
+    return create_partitions(now, end, using=using)
+
+
+def remove_partitions(
+        before: datetime.datetime,
+        detach_only: bool = False,
+        using: str = DEFAULT_DB_ALIAS,
+) -> List[str]:
+    """
+    Detach and drop all partitions that only contain timestamps before `before`.
+
+    :param detach_only: bool, If True, the partitions are only detached
+        and stay in the database as separate tables, e.g. for archiving.
+
+    :returns list of removed partition names
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+
+    removed = []
+    for name, start, end in get_partitions(using=using):
+        if end <= before:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {qn(ParkingData._meta.db_table)} DETACH PARTITION {qn(name)}")
+                if not detach_only:
+                    cursor.execute(f"DROP TABLE {qn(name)}")
+            removed.append(name)
+
+    return removed
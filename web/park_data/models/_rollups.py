@@ -0,0 +1,296 @@
+"""
+Hourly and daily rollups of the ParkingData table.
+
+`update_rollups` aggregates the hours (and days) that have completed
+since the last update, so it only reads the new rows of the data table.
+Rows that are stored later for an already aggregated hour, e.g. when
+replaying an archive, require a `rebuild_rollups`.
+"""
+import datetime
+from typing import Optional, List, Tuple, Sequence
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+from .parking_data import ParkingData
+from .parking_data_rollup import ParkingDataHourly, ParkingDataDaily, ROLLUP_STATES
+from ._partitions import partition_start, next_partition_start
+
+
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+# an hour is aggregated this long after it ended to include the last snapshots
+ROLLUP_DELAY = datetime.timedelta(minutes=10)
+
+# rollup column -> SQL function that combines the column of several buckets
+ROLLUP_COLUMNS = {
+    "num_rows": "SUM",
+    "num_free_count": "SUM",
+    "num_free_sum": "SUM",
+    "num_free_min": "MIN",
+    "num_free_max": "MAX",
+    "num_occupied_count": "SUM",
+    "num_occupied_sum": "SUM",
+    "num_occupied_min": "MIN",
+    "num_occupied_max": "MAX",
+    "capacity_max": "MAX",
+    **{f"num_{status}": "SUM" for status in ROLLUP_STATES},
+}
+
+
+def floor_hour(timestamp: datetime.datetime) -> datetime.datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(timestamp: datetime.datetime) -> datetime.datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate_parking_data(
+        start: datetime.datetime,
+        end: datetime.datetime,
+        seconds: int = 3600,
+        lot_pk: Optional[int] = None,
+        using: str = DEFAULT_DB_ALIAS,
+) -> List[tuple]:
+    """
+    Aggregate the ParkingData between start and end (exclusive) in the database
+    into buckets of `seconds`, aligned to the unix epoch.
+
+    Each row is counted once in every bucket that it covers between
+    it's timestamp and `last_seen`, clipped to the time range.
+
+    :returns list of (lot pk, bucket start, *ROLLUP_COLUMNS) tuples,
+        sorted by bucket and lot
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            _aggregate_sql(seconds, lot_filter=lot_pk is not None, using=using),
+            _aggregate_params(start, end, lot_pk),
+        )
+        return cursor.fetchall()
+
+
+def merge_rollup_values(rows: Sequence[Sequence]) -> tuple:
+    """
+    Combine the ROLLUP_COLUMNS values of several buckets like the database does
+    """
+    merged = []
+    for values, function in zip(zip(*rows), ROLLUP_COLUMNS.values()):
+        values = [value for value in values if value is not None]
+        if function == "SUM":
+            merged.append(sum(values))
+        elif not values:
+            merged.append(None)
+        else:
+            merged.append(min(values) if function == "MIN" else max(values))
+    return tuple(merged)
+
+
+def rollup_end(using: str = DEFAULT_DB_ALIAS) -> Optional[datetime.datetime]:
+    """
+    Returns the end of the last aggregated hour
+    """
+    last = ParkingDataHourly.objects.using(using).aggregate(last=Max("timestamp"))["last"]
+    return last + HOUR if last else None
+
+
+def update_hourly_rollups(
+        start: datetime.datetime,
+        end: datetime.datetime,
+        using: str = DEFAULT_DB_ALIAS,
+) -> int:
+    """
+    (Re-)aggregate the full hours between start and end (exclusive)
+
+    :returns number of created ParkingDataHourly rows
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(name) for name in ROLLUP_COLUMNS)
+
+    with transaction.atomic(using=using):
+        ParkingDataHourly.objects.using(using).filter(timestamp__gte=start, timestamp__lt=end).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""INSERT INTO {qn(ParkingDataHourly._meta.db_table)} ("lot_id", "timestamp", {columns})
+                {_aggregate_sql(3600, lot_filter=False, using=using)}""",
+                _aggregate_params(start, end),
+            )
+            return cursor.rowcount
+
+
+def update_daily_rollups(
+        start: datetime.datetime,
+        end: datetime.datetime,
+        using: str = DEFAULT_DB_ALIAS,
+) -> int:
+    """
+    (Re-)aggregate the full days between start and end (exclusive)
+    from the hourly rollups
+
+    :returns number of created ParkingDataDaily rows
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(name) for name in ROLLUP_COLUMNS)
+    merged_columns = ", ".join(f"{function}({qn(name)})" for name, function in ROLLUP_COLUMNS.items())
+
+    with transaction.atomic(using=using):
+        ParkingDataDaily.objects.using(using).filter(timestamp__gte=start, timestamp__lt=end).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""INSERT INTO {qn(ParkingDataDaily._meta.db_table)} ("lot_id", "timestamp", {columns})
+                SELECT "lot_id", date_trunc('day', "timestamp") AS day, {merged_columns}
+                FROM {qn(ParkingDataHourly._meta.db_table)}
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                GROUP BY "lot_id", day""",
+                [start, end],
+            )
+            return cursor.rowcount
+
+
+def update_rollups(
+        now: Optional[datetime.datetime] = None,
+        delay: datetime.timedelta = ROLLUP_DELAY,
+        max_range: Optional[datetime.timedelta] = None,
+        using: str = DEFAULT_DB_ALIAS,
+) -> Tuple[int, int]:
+    """
+    Aggregate all hours and days that completed since the last update.
+
+    The hours are processed one day per transaction, the days
+    one month per transaction.
+
+    :param delay: timedelta, an hour is only aggregated when it
+        ended at least `delay` before `now`
+
+    :param max_range: optional timedelta, aggregate at most this time range
+        after the last update, the remaining hours are aggregated by the next
+        calls. If there are no rollups yet, only the days within `max_range`
+        before `now` are aggregated and older data requires a `rebuild_rollups`.
+
+    :returns tuple of the number of created hourly and daily rows
+    """
+    end = floor_hour((now or datetime.datetime.utcnow()) - delay)
+
+    start = rollup_end(using=using)
+    if start is None:
+        first = ParkingData.objects.using(using).order_by("timestamp").values_list("timestamp", flat=True).first()
+        if first is None:
+            return 0, 0
+        start = floor_hour(first)
+        if max_range is not None:
+            start = max(start, floor_day(end - max_range))
+
+    if max_range is not None:
+        # hours without data have no rollup rows, skip them so that
+        #   a pause longer than max_range is not aggregated again and again
+        start = min(end, _next_data_hour(start, using=using) or end)
+        end = min(end, floor_hour(start + max_range))
+
+    num_hourly = 0
+    while start < end:
+        chunk_end = min(end, floor_day(start) + DAY)
+        num_hourly += update_hourly_rollups(start, chunk_end, using=using)
+        start = chunk_end
+
+    end = floor_day(end)
+    last = ParkingDataDaily.objects.using(using).aggregate(last=Max("timestamp"))["last"]
+    if last is not None:
+        start = last + DAY
+    else:
+        first = ParkingDataHourly.objects.using(using).order_by("timestamp").values_list("timestamp", flat=True).first()
+        if first is None:
+            return num_hourly, 0
+        start = floor_day(first)
+
+    num_daily = 0
+    while start < end:
+        chunk_end = min(end, next_partition_start(start))
+        num_daily += update_daily_rollups(start, chunk_end, using=using)
+        start = chunk_end
+
+    return num_hourly, num_daily
+
+
+def rebuild_rollups(
+        since: datetime.datetime,
+        now: Optional[datetime.datetime] = None,
+        delay: datetime.timedelta = ROLLUP_DELAY,
+        using: str = DEFAULT_DB_ALIAS,
+) -> Tuple[int, int]:
+    """
+    Remove the rollups since the start of the day of `since` and aggregate them again
+
+    :returns tuple of the number of created hourly and daily rows
+    """
+    since = floor_day(since)
+    with transaction.atomic(using=using):
+        ParkingDataHourly.objects.using(using).filter(timestamp__gte=since).delete()
+        ParkingDataDaily.objects.using(using).filter(timestamp__gte=since).delete()
+    return update_rollups(now=now, delay=delay, using=using)
+
+
+def next_rollup_update(now: datetime.datetime, delay: datetime.timedelta = ROLLUP_DELAY) -> datetime.datetime:
+    """
+    Returns the time when the hour that contains `now` can be aggregated
+    """
+    return floor_hour(now) + HOUR + delay
+
+
+def _next_data_hour(start: datetime.datetime, using: str = DEFAULT_DB_ALIAS) -> Optional[datetime.datetime]:
+    """
+    Returns the first hour since `start` that contains data
+    """
+    qset = ParkingData.objects.using(using)
+    # rows stored with changes only never span more than one partition
+    if qset.filter(timestamp__gte=partition_start(start), timestamp__lt=start, last_seen__gte=start).exists():
+        return start
+    first = qset.filter(timestamp__gte=start).order_by("timestamp").values_list("timestamp", flat=True).first()
+    return floor_hour(first) if first is not None else None
+
+
+def _bucket_sql(expression: str, seconds: int) -> str:
+    # like postgres 14's date_bin(), for timestamps without time zone
+    return (
+        f"(TIMESTAMP '1970-01-01' + FLOOR(EXTRACT(EPOCH FROM {expression}) / {seconds})"
+        f" * {seconds} * INTERVAL '1 second')"
+    )
+
+
+def _aggregate_sql(seconds: int, lot_filter: bool, using: str) -> str:
+    seconds = int(seconds)
+    qn = connections[using].ops.quote_name
+    status_columns = ", ".join(
+        f"""COUNT(*) FILTER (WHERE d."status" = '{status}')"""
+        for status in ROLLUP_STATES
+    )
+    return f"""SELECT d."lot_id", b.bucket,
+        COUNT(*), COUNT(d."num_free"), COALESCE(SUM(d."num_free"), 0), MIN(d."num_free"), MAX(d."num_free"),
+        COUNT(d."num_occupied"), COALESCE(SUM(d."num_occupied"), 0), MIN(d."num_occupied"), MAX(d."num_occupied"),
+        MAX(d."capacity"), {status_columns}
+    FROM {qn(ParkingData._meta.db_table)} d
+    CROSS JOIN LATERAL generate_series(
+        {_bucket_sql('GREATEST(d."timestamp", %(start)s)', seconds)},
+        {_bucket_sql('LEAST(COALESCE(d."last_seen", d."timestamp"), %(last)s)', seconds)},
+        INTERVAL '{seconds} seconds'
+    ) AS b(bucket)
+    WHERE d."timestamp" >= %(partition_start)s AND d."timestamp" < %(end)s
+        AND COALESCE(d."last_seen", d."timestamp") >= %(start)s
+        {'AND d."lot_id" = %(lot_pk)s' if lot_filter else ''}
+    GROUP BY d."lot_id", b.bucket
+    ORDER BY b.bucket, d."lot_id"
+    """
+
+
+def _aggregate_params(start: datetime.datetime, end: datetime.datetime, lot_pk: Optional[int] = None) -> dict:
+    return {
+        "start": start,
+        "end": end,
+        "last": end - datetime.timedelta(microseconds=1),
+        # rows never span more than one partition
+        "partition_start": partition_start(start),
+        "lot_pk": lot_pk,
+    }
@@ -0,0 +1,121 @@
+import datetime
+import hashlib
+import json
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Q
+
+from .parking_pool import ParkingPool
+from .parking_data import ParkingData, LatestParkingData
+from ._partitions import partition_start
+from ._identity_cache import identity_cache
+
+
+def snapshot_hash(snapshot: dict) -> str:
+    """
+    Returns a hash of the pool and lots of a snapshot.
+
+    The `timestamp` of the lots is ignored so that two scrapes
+    of unchanged data have the same hash.
+    """
+    content = {
+        "pool": snapshot["pool"],
+        "lots": [
+            {key: value for key, value in lot.items() if key != "timestamp"}
+            for lot in snapshot["lots"]
+        ],
+    }
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def snapshot_timestamp(snapshot: dict) -> Optional[datetime.datetime]:
+    """
+    Returns the timestamp of the snapshot if all lots have the same timestamp
+    """
+    field = ParkingData._meta.get_field("timestamp")
+    timestamps = {field.to_python(lot.get("timestamp")) for lot in snapshot["lots"]}
+    if len(timestamps) != 1:
+        return None
+    return timestamps.pop()
+
+
+def extend_unchanged_snapshot(snapshot: dict, content_hash: str, lot_ids: list) -> bool:
+    """
+    If the hash of the snapshot is equal to the hash of the previously
+    stored snapshot of the pool, extend the `last_seen` timestamp of
+    the previous ParkingData rows and the timestamp of the LatestParkingData
+    of all lots instead of storing the snapshot.
+
+    Only the pool is queried and no lots are compared, so this takes
+    a constant number of queries.
+
+    :param content_hash: str, the result of `snapshot_hash`
+
+    :param lot_ids: list of the lot IDs that would be stored
+
+    :returns True if the snapshot has been extended,
+        False if it needs to be stored
+    """
+    timestamp = snapshot_timestamp(snapshot)
+    if timestamp is None or not lot_ids:
+        return False
+
+    previous = (
+        ParkingPool.objects
+        .filter(pool_id=snapshot["pool"]["id"])
+        .values_list("snapshot_hash", "snapshot_timestamp")
+        .first()
+    )
+    if not previous or previous[0] != content_hash or previous[1] is None:
+        return False
+
+    previous_timestamp = previous[1]
+    # rows are never extended into the next partition, see `_store._is_unchanged`
+    if timestamp <= previous_timestamp or partition_start(timestamp) != partition_start(previous_timestamp):
+        return False
+
+    try:
+        with transaction.atomic():
+            num_extended = (
+                ParkingData.objects
+                .filter(
+                    Q(last_seen=previous_timestamp) | Q(last_seen=None, timestamp=previous_timestamp),
+                    lot__lot_id__in=lot_ids,
+                    timestamp__gte=partition_start(previous_timestamp),
+                )
+                .update(last_seen=timestamp)
+            )
+            num_latest = (
+                LatestParkingData.objects
+                .filter(parkinglot__lot_id__in=lot_ids, timestamp=previous_timestamp)
+                .update(timestamp=timestamp)
+            )
+            # the lots have been changed since the previous snapshot, e.g. by another process
+            if num_extended != len(lot_ids) or num_latest != len(lot_ids):
+                raise _NotExtended()
+
+            ParkingPool.objects.filter(pool_id=snapshot["pool"]["id"]).update(snapshot_timestamp=timestamp)
+
+    except _NotExtended:
+        return False
+
+    # the cached LatestParkingData instances are outdated
+    identity_cache.invalidate(snapshot["pool"]["id"])
+    return True
+
+
+def set_snapshot_hash(snapshot: dict, content_hash: str):
+    """
+    Remember the hash of a stored snapshot for `extend_unchanged_snapshot`
+    """
+    ParkingPool.objects.filter(pool_id=snapshot["pool"]["id"]).update(
+        snapshot_hash=content_hash,
+        snapshot_timestamp=snapshot_timestamp(snapshot),
+    )
+
+
+class _NotExtended(Exception):
+    pass
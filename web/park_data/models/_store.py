@@ -1,82 +1,165 @@
-from typing import List, Optional
+from typing import List, Optional, Set, Callable
 
 from django.db import transaction
+from django.db.models import Q, Case, When, Value, DateTimeField
 from django.contrib.gis.geos import Point
+from django.utils import timezone
 
 from .parking_pool import ParkingPool
 from .parking_lot import ParkingLot
-from .parking_data import ParkingData, LatestParkingData
+from .parking_data import ParkingData, LatestParkingData, calculate_derived_fields
+from ._copy import copy_parking_data, insert_parking_data, OnConflict
+from ._partitions import partition_start
+from ._identity_cache import identity_cache
+from ._snapshot_hash import snapshot_hash, extend_unchanged_snapshot, set_snapshot_hash
+from ..signals import snapshot_stored
+
+
+class StoreMethod:
+    orm = "orm"         # one model.save() per row
+    bulk = "bulk"       # preload all lots and use bulk_create/bulk_update
+    copy = "copy"       # like bulk but write ParkingData with postgres COPY
+
+    choices = (orm, bulk, copy)
+
+
+# the fields of ParkingDataBase that are copied from a snapshot lot
+DATA_FIELDS = [
+    "timestamp", "lot_timestamp", "status", "num_free", "capacity", "num_occupied", "percent_free",
+]
+
+# a new ParkingData row is only stored if one of these fields changed
+#   when storing with `changes_only`
+CHANGE_FIELDS = ["status", "num_free", "capacity", "num_occupied"]
 
 
 def store_snapshot(
         snapshot: dict,
         update_infos: bool = True,
-) -> List[ParkingData]:
+        method: str = StoreMethod.orm,
+        changes_only: bool = False,
+        on_conflict: str = OnConflict.error,
+        on_invalid: Optional[Callable[[dict, str], None]] = None,
+        skip_unchanged: bool = False,
+) -> Optional[List[ParkingData]]:
     """
     Store a snapshot.
 
     :param update_infos: bool, Update any fields of ParkingPool and ParkingLot
         if meta-information changed
 
-    :returns List of park_data.models.ParkingData instances
+    :param method: str, one of the `StoreMethod` values.
+        The `bulk` method uses a constant number of queries per snapshot,
+        independent of the number of lots, and runs in a single transaction.
+        It keeps the pool and lot instances in the `IdentityCache` so that
+        unchanged meta-infos do not need any queries.
+        The `copy` method is like `bulk` but streams the ParkingData rows
+        to postgres via `COPY FROM STDIN`. The returned instances do not have
+        a primary key in this case.
+
+    :param changes_only: bool, If the `CHANGE_FIELDS` of a lot are equal
+        to the previous ParkingData row of the lot, no new row is stored.
+        Instead, the `last_seen` timestamp of the previous row is extended.
+
+    :param on_conflict: str, one of the `OnConflict` values.
+        Defines what happens if a ParkingData row with the same timestamp
+        and lot already exists, e.g. when a snapshot is stored again.
+        With `nothing` or `update`, the returned instances do not have
+        a primary key.
+
+    :param on_invalid: optional callable, called with the lot dict and an error
+        message for each lot with inconsistent numbers. These lots are skipped.
+        If not defined, a ValueError is raised and nothing is stored.
+
+    :param skip_unchanged: bool, If the hash of the snapshot (without the
+        timestamps) is equal to the previously stored snapshot of the pool,
+        the lots are not compared at all. Like with `changes_only`, the
+        previous rows are extended instead.
+
+    :returns List of park_data.models.ParkingData instances,
+        extended rows are not included, or None if the snapshot
+        was skipped because of `skip_unchanged`
     """
-    pool = snapshot["pool"]
-    lots = snapshot["lots"]
-    data_models = []
+    if on_conflict not in OnConflict.choices:
+        raise ValueError(f"Invalid on_conflict '{on_conflict}', expected one of {OnConflict.choices}")
 
-    kwargs = {key: value for key, value in pool.items() if hasattr(ParkingPool, key)}
-    kwargs["pool_id"] = kwargs.pop("id")
-    try:
-        pool_model = ParkingPool.objects.get(pool_id=pool["id"])
+    if method not in StoreMethod.choices:
+        raise ValueError(f"Invalid store method '{method}', expected one of {StoreMethod.choices}")
 
-        if update_infos:
-            updated = False
-            for key, value in kwargs.items():
-                if value is not None and hasattr(pool_model, key) and getattr(pool_model, key) != value:
-                    setattr(pool_model, key, value)
-                    updated = True
-            if updated:
-                pool_model.save()
+    snapshot = {**snapshot, "lots": _validate_lots(snapshot["lots"], on_invalid)}
+
+    content_hash = None
+    if skip_unchanged:
+        content_hash = snapshot_hash(snapshot)
+        if extend_unchanged_snapshot(snapshot, content_hash, [lot["id"] for lot in snapshot["lots"]]):
+            _send_snapshot_stored(snapshot)
+            return None
+
+    if method == StoreMethod.orm:
+        data_models = _store_snapshot_orm(
+            snapshot, update_infos=update_infos, changes_only=changes_only, on_conflict=on_conflict,
+        )
+    else:
+        data_models = _store_snapshot_bulk(
+            snapshot, update_infos=update_infos, changes_only=changes_only, on_conflict=on_conflict,
+            use_copy=method == StoreMethod.copy,
+        )
+
+    if content_hash is not None:
+        set_snapshot_hash(snapshot, content_hash)
+
+    _send_snapshot_stored(snapshot)
+    return data_models
+
+
+def _send_snapshot_stored(snapshot: dict):
+    snapshot_stored.send(
+        sender=ParkingPool,
+        pool_id=snapshot["pool"]["id"],
+        lot_ids=[lot["id"] for lot in snapshot["lots"]],
+    )
 
-    except ParkingPool.DoesNotExist:
-        pool_model = ParkingPool.objects.create(**kwargs)
+
+def _store_snapshot_orm(
+        snapshot: dict,
+        update_infos: bool,
+        changes_only: bool,
+        on_conflict: str,
+) -> List[ParkingData]:
+    lots = snapshot["lots"]
+    data_models = []
+
+    pool_model = _get_pool_model(snapshot["pool"], update_infos=update_infos)
 
     for lot in lots:
 
-        kwargs = {key: value for key, value in lot.items() if hasattr(ParkingLot, key)}
-        kwargs["lot_id"] = kwargs.pop("id")
-        kwargs["pool"] = pool_model
-        kwargs["max_capacity"] = max_or_none(lot.get("capacity"), lot.get("num_free"))
-        kwargs["has_live_capacity"] = lot.get("has_live_capacity") or False
-        if not (lot.get("latitude") is None or lot.get("longitude") is None):
-            kwargs["geo_point"] = Point(lot["longitude"], lot["latitude"])
+        kwargs = _get_lot_kwargs(lot, pool_model)
 
         try:
             lot_model = ParkingLot.objects.get(lot_id=lot["id"])
 
-            updated = False
-            max_capacity = max_or_none(kwargs["max_capacity"], lot_model.max_capacity)
-            if max_capacity != lot_model.max_capacity:
-                lot_model.max_capacity = max_capacity
-                updated = True
-
-            if update_infos:
-                kwargs.pop("max_capacity")
-                for key, value in kwargs.items():
-                    if value is not None and hasattr(lot_model, key) and getattr(lot_model, key) != value:
-                        setattr(lot_model, key, value)
-                        updated = True
-
-            if updated:
+            if _update_lot_model(lot_model, kwargs, update_infos=update_infos):
                 lot_model.save()
 
         except ParkingLot.DoesNotExist:
             lot_model = ParkingLot.objects.create(**kwargs)
 
-        kwargs = {key: value for key, value in lot.items() if hasattr(ParkingData, key)}
-        kwargs.pop("id")
+        kwargs = _get_data_kwargs(lot)
         kwargs["lot"] = lot_model
-        data_models.append(ParkingData.objects.create(**kwargs))
+
+        if changes_only and _is_unchanged(lot_model, ParkingData(**kwargs)):
+            previous_q = _previous_data_q(lot_model.pk, lot_model.latest_data.timestamp)
+            extended = ParkingData.objects.filter(previous_q).update(last_seen=kwargs["timestamp"])
+        else:
+            extended = False
+
+        if not extended:
+            if on_conflict == OnConflict.error:
+                data_models.append(ParkingData.objects.create(**kwargs))
+            else:
+                data_model = ParkingData(**kwargs)
+                insert_parking_data([data_model], on_conflict=on_conflict)
+                data_models.append(data_model)
 
         # --- update LatestParkingData ---
 
@@ -84,7 +167,7 @@ def store_snapshot(
         if not lot_model.latest_data:
             lot_model.latest_data = LatestParkingData.objects.create(**kwargs)
             lot_model.save()
-        else:
+        elif kwargs["timestamp"] >= lot_model.latest_data.timestamp:
             updated = False
             for key, value in kwargs.items():
                 if value != getattr(lot_model.latest_data, key):
@@ -96,6 +179,311 @@ def store_snapshot(
     return data_models
 
 
+def _store_snapshot_bulk(
+        snapshot: dict,
+        update_infos: bool,
+        changes_only: bool = False,
+        on_conflict: str = OnConflict.error,
+        use_copy: bool = False,
+) -> List[ParkingData]:
+    try:
+        return _store_snapshot_bulk_cached(
+            snapshot, update_infos=update_infos, changes_only=changes_only, on_conflict=on_conflict,
+            use_copy=use_copy,
+        )
+    except Exception:
+        # the cached instances might have been changed without being stored
+        identity_cache.invalidate(snapshot["pool"]["id"])
+        raise
+
+
+def _store_snapshot_bulk_cached(
+        snapshot: dict,
+        update_infos: bool,
+        changes_only: bool,
+        on_conflict: str,
+        use_copy: bool,
+) -> List[ParkingData]:
+    lots = snapshot["lots"]
+
+    with transaction.atomic():
+        cached = identity_cache.get(snapshot["pool"]["id"])
+        if cached is not None:
+            pool_model, lot_model_map = cached
+            if update_infos and _update_pool_model(pool_model, _get_pool_kwargs(snapshot["pool"])):
+                pool_model.save()
+        else:
+            pool_model = _get_pool_model(snapshot["pool"], update_infos=update_infos)
+            lot_model_map = identity_cache.load(pool_model)
+
+        # lots that are new or belong to another pool
+        missing_lot_ids = [lot["id"] for lot in lots if lot["id"] not in lot_model_map]
+        if missing_lot_ids:
+            lot_model_map.update({
+                lot_model.lot_id: lot_model
+                for lot_model in (
+                    ParkingLot.objects
+                    .filter(lot_id__in=missing_lot_ids)
+                    .select_related("latest_data")
+                )
+            })
+
+        # --- compare meta-infos of lots ---
+
+        new_lot_models = dict()
+        updated_lot_models = dict()
+        updated_lot_fields = set()
+        for lot in lots:
+            kwargs = _get_lot_kwargs(lot, pool_model)
+
+            lot_model = lot_model_map.get(lot["id"])
+            if lot_model is None:
+                lot_model = ParkingLot(**kwargs)
+                lot_model_map[lot["id"]] = lot_model
+                new_lot_models[lot["id"]] = lot_model
+            else:
+                changed_fields = _update_lot_model(lot_model, kwargs, update_infos=update_infos)
+                if changed_fields:
+                    updated_lot_fields |= changed_fields
+                    updated_lot_models[lot["id"]] = lot_model
+
+        # --- create ParkingData and create or update LatestParkingData ---
+
+        data_models = []
+        unchanged_data_models = dict()
+        new_latest_models = dict()
+        updated_latest_models = dict()
+        for lot in lots:
+            lot_model = lot_model_map[lot["id"]]
+            kwargs = _get_data_kwargs(lot)
+
+            # the derived fields have been calculated by _validate_lots
+            data_model = ParkingData(lot=lot_model, **kwargs)
+            if changes_only and _is_unchanged(lot_model, data_model):
+                # lot_id -> (previous timestamp, unsaved data model)
+                unchanged_data_models[lot_model.pk] = (lot_model.latest_data.timestamp, data_model)
+            else:
+                data_models.append(data_model)
+
+            if not lot_model.latest_data:
+                latest_model = LatestParkingData(**kwargs)
+                lot_model.latest_data = latest_model
+                new_latest_models[lot["id"]] = latest_model
+            # never move the latest data back in time, e.g. when replaying snapshots
+            elif data_model.timestamp >= lot_model.latest_data.timestamp:
+                latest_model = lot_model.latest_data
+                updated = False
+                for key, value in kwargs.items():
+                    if value != getattr(latest_model, key):
+                        setattr(latest_model, key, value)
+                        updated = True
+                if updated:
+                    updated_latest_models[lot["id"]] = latest_model
+
+        # --- extend the previous rows of unchanged lots ---
+
+        if unchanged_data_models:
+            previous_q = Q()
+            for lot_pk, (previous_timestamp, data_model) in unchanged_data_models.items():
+                previous_q |= _previous_data_q(lot_pk, previous_timestamp)
+
+            previous_pks = dict(ParkingData.objects.filter(previous_q).values_list("lot_id", "pk"))
+            if previous_pks:
+                ParkingData.objects.filter(pk__in=previous_pks.values()).update(last_seen=Case(
+                    *(
+                        When(pk=pk, then=Value(unchanged_data_models[lot_pk][1].timestamp))
+                        for lot_pk, pk in previous_pks.items()
+                    ),
+                    output_field=DateTimeField(),
+                ))
+
+            # store a new row if the previous row was not found
+            for lot_pk, (previous_timestamp, data_model) in unchanged_data_models.items():
+                if lot_pk not in previous_pks:
+                    data_models.append(data_model)
+
+        # --- write everything ---
+
+        if new_latest_models:
+            LatestParkingData.objects.bulk_create(new_latest_models.values())
+            for lot_id, latest_model in new_latest_models.items():
+                lot_model = lot_model_map[lot_id]
+                lot_model.latest_data_id = latest_model.pk
+                if lot_model.pk and lot_id not in updated_lot_models:
+                    updated_lot_models[lot_id] = lot_model
+            updated_lot_fields.add("latest_data")
+
+        if updated_latest_models:
+            LatestParkingData.objects.bulk_update(updated_latest_models.values(), fields=DATA_FIELDS)
+
+        if new_lot_models:
+            ParkingLot.objects.bulk_create(new_lot_models.values())
+
+        if updated_lot_models:
+            now = timezone.now()
+            for lot_model in updated_lot_models.values():
+                lot_model.date_updated = now
+            ParkingLot.objects.bulk_update(
+                updated_lot_models.values(), fields=sorted(updated_lot_fields | {"date_updated"})
+            )
+
+        if on_conflict != OnConflict.error:
+            insert_parking_data(data_models, on_conflict=on_conflict, use_copy=use_copy)
+        elif use_copy:
+            copy_parking_data(data_models)
+        else:
+            ParkingData.objects.bulk_create(data_models)
+
+    # changed lots are loaded again with the next snapshot
+    if new_lot_models or updated_lot_models:
+        identity_cache.invalidate(pool_model.pool_id)
+
+    return data_models
+
+
+def _validate_lots(lots: List[dict], on_invalid: Optional[Callable[[dict, str], None]]) -> List[dict]:
+    """
+    Calculate the derived fields of all lots at once.
+
+    :returns list of copies of the valid lots, including the derived fields
+    """
+    num_free, num_occupied, percent_free, errors = calculate_derived_fields(
+        capacity=[lot.get("capacity") for lot in lots],
+        num_free=[lot.get("num_free") for lot in lots],
+        num_occupied=[lot.get("num_occupied") for lot in lots],
+        percent_free=[lot.get("percent_free") for lot in lots],
+    )
+    valid_lots = []
+    for i, lot in enumerate(lots):
+        if errors[i]:
+            if on_invalid is None:
+                raise ValueError(f"Lot '{lot['id']}' {errors[i]}")
+            on_invalid(lot, errors[i])
+        else:
+            valid_lots.append({
+                **lot,
+                "num_free": num_free[i],
+                "num_occupied": num_occupied[i],
+                "percent_free": percent_free[i],
+            })
+    return valid_lots
+
+
+def _get_pool_model(pool: dict, update_infos: bool) -> ParkingPool:
+    kwargs = _get_pool_kwargs(pool)
+    try:
+        pool_model = ParkingPool.objects.get(pool_id=pool["id"])
+
+        if update_infos and _update_pool_model(pool_model, kwargs):
+            pool_model.save()
+
+    except ParkingPool.DoesNotExist:
+        pool_model = ParkingPool.objects.create(**kwargs)
+
+    return pool_model
+
+
+def _get_pool_kwargs(pool: dict) -> dict:
+    kwargs = {key: value for key, value in pool.items() if hasattr(ParkingPool, key)}
+    kwargs["pool_id"] = kwargs.pop("id")
+    return kwargs
+
+
+def _update_pool_model(pool_model: ParkingPool, kwargs: dict) -> bool:
+    """
+    Update the pool_model with the values in kwargs
+
+    :returns True if a value changed
+    """
+    updated = False
+    for key, value in kwargs.items():
+        if value is not None and hasattr(pool_model, key) and getattr(pool_model, key) != value:
+            setattr(pool_model, key, value)
+            updated = True
+    return updated
+
+
+def _get_lot_kwargs(lot: dict, pool_model: ParkingPool) -> dict:
+    kwargs = {key: value for key, value in lot.items() if hasattr(ParkingLot, key)}
+    kwargs["lot_id"] = kwargs.pop("id")
+    kwargs["pool"] = pool_model
+    kwargs["max_capacity"] = max_or_none(lot.get("capacity"), lot.get("num_free"))
+    kwargs["has_live_capacity"] = lot.get("has_live_capacity") or False
+    if not (lot.get("latitude") is None or lot.get("longitude") is None):
+        kwargs["geo_point"] = Point(lot["longitude"], lot["latitude"])
+    return kwargs
+
+
+def _get_data_kwargs(lot: dict) -> dict:
+    kwargs = {key: value for key, value in lot.items() if hasattr(ParkingData, key)}
+    kwargs.pop("id")
+    # parse the timestamps so they can be compared to stored values
+    for key in ("timestamp", "lot_timestamp"):
+        if isinstance(kwargs.get(key), str):
+            kwargs[key] = ParkingData._meta.get_field(key).to_python(kwargs[key])
+    return kwargs
+
+
+def _is_unchanged(lot_model: ParkingLot, data_model: ParkingData) -> bool:
+    """
+    Returns True if the `CHANGE_FIELDS` of the unsaved data_model are
+    equal to the lot's latest data and the data_model is newer.
+
+    Rows are never extended into the next partition (month), so all
+    rows that overlap a time range start in the partition of the range
+    or later.
+    """
+    latest_model = lot_model.latest_data
+    if not latest_model or data_model.timestamp <= latest_model.timestamp:
+        return False
+    if partition_start(data_model.timestamp) != partition_start(latest_model.timestamp):
+        return False
+
+    for key in CHANGE_FIELDS:
+        if getattr(data_model, key) != getattr(latest_model, key):
+            return False
+    return True
+
+
+def _previous_data_q(lot_pk: int, previous_timestamp) -> Q:
+    """
+    Filter for the ParkingData row of a lot that ends at `previous_timestamp`,
+    which is the timestamp of the lot's LatestParkingData.
+    """
+    return Q(lot_id=lot_pk) & (
+        Q(last_seen=previous_timestamp) | Q(last_seen=None, timestamp=previous_timestamp)
+    )
+
+
+def _update_lot_model(lot_model: ParkingLot, kwargs: dict, update_infos: bool) -> Set[str]:
+    """
+    Update the lot_model with the values in kwargs
+
+    :returns set of changed field names
+    """
+    changed_fields = set()
+    max_capacity = max_or_none(kwargs["max_capacity"], lot_model.max_capacity)
+    if max_capacity != lot_model.max_capacity:
+        lot_model.max_capacity = max_capacity
+        changed_fields.add("max_capacity")
+
+    if update_infos:
+        for key, value in kwargs.items():
+            if key == "max_capacity":
+                continue
+            if key == "pool":
+                # compare the primary key to not query the related pool
+                if lot_model.pool_id != value.pk:
+                    lot_model.pool = value
+                    changed_fields.add(key)
+                continue
+            if value is not None and hasattr(lot_model, key) and getattr(lot_model, key) != value:
+                setattr(lot_model, key, value)
+                changed_fields.add(key)
+
+    return changed_fields
+
+
 def max_or_none(a: Optional[int], b: Optional[int]) -> Optional[int]:
     if a is None:
         if b is None:
@@ -0,0 +1,126 @@
+import contextlib
+
+from django.db import transaction, connections, DEFAULT_DB_ALIAS
+
+from ._identity_cache import identity_cache
+
+
+class TransactionMode:
+    none = "none"           # autocommit, each statement is committed
+    snapshot = "snapshot"   # one transaction per snapshot
+    module = "module"       # one transaction per scraper call
+    rows = "rows"           # commit after a number of rows
+
+    choices = (none, snapshot, module, rows)
+
+
+class StoreTransaction:
+    """
+    Groups the storing of several snapshots into one database transaction.
+
+    Each snapshot is stored within a savepoint, so an error only rolls back
+    that snapshot and not the other snapshots of the transaction.
+
+    Usage:
+
+        with StoreTransaction(TransactionMode.rows, max_rows=10000) as store_transaction:
+            for snapshot in snapshots:
+                with store_transaction.snapshot(len(snapshot["lots"])):
+                    store_snapshot(snapshot)
+            store_transaction.end_module()
+
+    """
+    def __init__(
+            self,
+            mode: str = TransactionMode.snapshot,
+            max_rows: int = 10000,
+            using: str = DEFAULT_DB_ALIAS,
+    ):
+        if mode not in TransactionMode.choices:
+            raise ValueError(f"Invalid transaction mode '{mode}', expected one of {TransactionMode.choices}")
+        self.mode = mode
+        self.max_rows = max_rows
+        self.using = using
+        self.num_commits = 0
+        self._atomic = None
+        self._num_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    @contextlib.contextmanager
+    def snapshot(self, num_rows: int = 0):
+        """
+        Context for storing a single snapshot.
+
+        Exceptions roll back to the savepoint at the start of the context
+        and are re-raised.
+        """
+        if self.mode == TransactionMode.none:
+            yield
+            return
+
+        if self.mode == TransactionMode.snapshot:
+            try:
+                with transaction.atomic(using=self.using):
+                    yield
+            except Exception:
+                identity_cache.invalidate()
+                raise
+            self.num_commits += 1
+            return
+
+        self._begin()
+        with transaction.atomic(using=self.using):
+            yield
+
+        self._num_rows += num_rows
+        if self.mode == TransactionMode.rows and self._num_rows >= self.max_rows:
+            self.commit()
+
+    def end_module(self):
+        """
+        Call after all outputs of a scraper call are stored
+        """
+        if self.mode == TransactionMode.module:
+            self.commit()
+
+    def commit(self):
+        """
+        Commit the open transaction, if any
+        """
+        if self._atomic is not None:
+            atomic, self._atomic = self._atomic, None
+            self._num_rows = 0
+            try:
+                atomic.__exit__(None, None, None)
+            except Exception:
+                # the cached instances might contain values that are not stored
+                identity_cache.invalidate()
+                raise
+            self.num_commits += 1
+
+    def rollback(self):
+        """
+        Roll back the open transaction, if any
+        """
+        if self._atomic is not None:
+            atomic, self._atomic = self._atomic, None
+            self._num_rows = 0
+            identity_cache.invalidate()
+            # passing an exception rolls back the transaction
+            atomic.__exit__(RuntimeError, RuntimeError("rollback"), None)
+
+    def _begin(self):
+        if self._atomic is None:
+            self._atomic = transaction.atomic(using=self.using)
+            self._atomic.__enter__()
+            # check foreign keys within the savepoint of each snapshot instead of at commit
+            with connections[self.using].cursor() as cursor:
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
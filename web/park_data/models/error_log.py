@@ -1,11 +1,16 @@
 import datetime
+import hashlib
+import re
+from typing import Optional, Tuple
+
 from django.utils.translation import gettext_lazy as _
-from django.db import models
+from django.db import models, transaction
 
 
 class ErrorLogSources:
     module = "module"       # a scraper module
     pool = "pool"
+    store = "store"         # storing the snapshot of a pool, the scraper itself succeeded
 
 
 class ErrorLog(models.Model):
@@ -16,17 +21,39 @@ class ErrorLog(models.Model):
 
     timestamp = models.DateTimeField(
         verbose_name=_("Timestamp"),
-        help_text=_("Datetime of snapshot (UTC)"),
+        help_text=_("Datetime of the first occurrence (UTC)"),
         default=datetime.datetime.utcnow,
         db_index=True,
     )
 
+    last_seen = models.DateTimeField(
+        verbose_name=_("Last seen"),
+        help_text=_("Datetime of the last occurrence (UTC)"),
+        default=datetime.datetime.utcnow,
+        db_index=True,
+    )
+
+    count = models.IntegerField(
+        verbose_name=_("Count"),
+        help_text=_("Number of occurrences"),
+        default=1,
+    )
+
+    fingerprint = models.CharField(
+        verbose_name=_("Fingerprint"),
+        help_text=_("Hash of source, module, pool and normalized message"),
+        max_length=40,
+        null=True, blank=True, editable=False,
+        db_index=True,
+    )
+
     source = models.CharField(
         verbose_name=_("Source of error"),
         max_length=16,
         choices=(
             (ErrorLogSources.module, ErrorLogSources.module),
             (ErrorLogSources.pool, ErrorLogSources.pool),
+            (ErrorLogSources.store, ErrorLogSources.store),
         ),
         db_index=True,
     )
@@ -52,6 +79,7 @@ class ErrorLog(models.Model):
 
     stacktrace = models.TextField(
         verbose_name=_("Stacktrace"),
+        help_text=_("Complete output of the first occurrence"),
         null=True, blank=True,
     )
 
@@ -61,3 +89,95 @@ class ErrorLog(models.Model):
             n = f"{n}/{self.pool_id}"
         return n
 
+
+# repeated errors are aggregated if the previous occurrence is not older than this
+ERROR_AGGREGATION_WINDOW = datetime.timedelta(hours=1)
+
+_RE_HEX = re.compile(r"0x[0-9a-fA-F]+")
+_RE_NUMBER = re.compile(r"\d+")
+_RE_SPACE = re.compile(r"\s+")
+
+
+def split_error_text(text: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Split an error output into the message and the complete text if it has more lines.
+
+    If the output contains a python traceback, the message is the last line
+    (the exception), also when warnings or log lines of the scraper precede
+    the traceback. Otherwise it's the first non-empty line.
+    """
+    lines = [line.strip() for line in (text or "").splitlines() if line.strip()]
+    if not lines:
+        return "", None
+    if len(lines) == 1:
+        return lines[0], None
+    if any(line.startswith("Traceback (most recent call last)") for line in lines[:-1]):
+        return lines[-1], text
+    return lines[0], text
+
+
+def normalize_error_message(message: str) -> str:
+    """
+    Replace the parts of an error message that change between
+    occurrences of the same error, like addresses and numbers
+    """
+    message = _RE_HEX.sub("<address>", message)
+    message = _RE_NUMBER.sub("<n>", message)
+    return _RE_SPACE.sub(" ", message).strip()[:1000]
+
+
+def error_fingerprint(source: str, module_name: str, pool_id: Optional[str], message: str) -> str:
+    return hashlib.sha1(
+        "\n".join((source, module_name, pool_id or "", normalize_error_message(message))).encode("utf-8")
+    ).hexdigest()
+
+
+def log_error(
+        source: str,
+        module_name: str,
+        pool_id: Optional[str],
+        text: str,
+        now: Optional[datetime.datetime] = None,
+) -> ErrorLog:
+    """
+    Store an error or count it in the row of the same error.
+
+    Errors are identified by the fingerprint of source, module, pool
+    and the normalized message. If the previous occurrence has been
+    within `ERROR_AGGREGATION_WINDOW`, its `count` and `last_seen` are
+    updated instead of storing a new row. The first occurrence's
+    complete text is kept as sample.
+
+    :param text: str, the error message or the complete output, e.g. a traceback
+
+    :returns ErrorLog instance
+    """
+    if now is None:
+        now = datetime.datetime.utcnow()
+    message, stacktrace = split_error_text(text)
+    fingerprint = error_fingerprint(source, module_name, pool_id, message)
+
+    with transaction.atomic():
+        error_model = (
+            ErrorLog.objects
+            .select_for_update()
+            .filter(fingerprint=fingerprint, last_seen__gte=now - ERROR_AGGREGATION_WINDOW)
+            .order_by("-last_seen")
+            .first()
+        )
+        if error_model is not None:
+            error_model.count += 1
+            error_model.last_seen = max(now, error_model.last_seen)
+            error_model.save(update_fields=["count", "last_seen"])
+            return error_model
+
+        return ErrorLog.objects.create(
+            timestamp=now,
+            last_seen=now,
+            source=source,
+            module_name=module_name,
+            pool_id=pool_id,
+            text=message,
+            stacktrace=stacktrace,
+            fingerprint=fingerprint,
+        )
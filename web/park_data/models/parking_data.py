@@ -1,3 +1,5 @@
+from typing import Optional, Tuple, List, Sequence
+
 from django.utils.translation import gettext_lazy as _
 from django.db import models
 
@@ -71,34 +73,84 @@ class ParkingDataBase(models.Model):
     )
 
     def save(self, **kwargs):
-        if self.capacity is not None:
-            if self.num_free is not None:
-                if self.num_occupied is None:
-                    self.num_occupied = self.capacity - self.num_free
-                else:
-                    if self.num_occupied != self.capacity - self.num_free:
-                        raise ValueError(
-                            f"Data '{self}' has invalid 'num_occupied' {self.num_occupied}"
-                            f", expected {self.capacity - self.num_free}"
-                            f" (free={self.num_free}, capacity={self.capacity})"
-                        )
-
-            elif self.num_occupied is not None:
-                if self.num_free is None:
-                    self.num_free = self.capacity - self.num_occupied
-                else:
-                    if self.num_free != self.capacity - self.num_occupied:
-                        raise ValueError(
-                            f"Data '{self}' has invalid 'num_free' {self.num_free}"
-                            f", expected {self.capacity - self.num_occupied}"
-                            f" (occupied={self.num_occupied}, capacity={self.capacity})"
-                        )
-
-            if self.num_free is not None and self.capacity:
-                self.percent_free = round(self.num_free * 100. / self.capacity, 2)
-
+        self.update_derived_fields()
         super().save(**kwargs)
 
+    def update_derived_fields(self):
+        """
+        Calculate `num_occupied` or `num_free` and `percent_free`
+        from the other values.
+
+        Called by `save` and by bulk operations which skip `save`.
+
+        :raises ValueError if the numbers are inconsistent
+        """
+        num_free, num_occupied, percent_free, error = derived_values(
+            self.capacity, self.num_free, self.num_occupied, self.percent_free,
+        )
+        if error:
+            raise ValueError(f"Data '{self}' {error}")
+        self.num_free, self.num_occupied, self.percent_free = num_free, num_occupied, percent_free
+
+
+def derived_values(
+        capacity: Optional[int],
+        num_free: Optional[int],
+        num_occupied: Optional[int],
+        percent_free: Optional[float] = None,
+) -> Tuple[Optional[int], Optional[int], Optional[float], Optional[str]]:
+    """
+    Calculate `num_occupied` or `num_free` and `percent_free` of a single row.
+
+    :returns tuple of num_free, num_occupied, percent_free and
+        an error message or None if the numbers are consistent
+    """
+    if capacity is not None:
+        if num_free is not None:
+            if num_occupied is None:
+                num_occupied = capacity - num_free
+            elif num_occupied != capacity - num_free:
+                return num_free, num_occupied, percent_free, (
+                    f"has invalid 'num_occupied' {num_occupied}"
+                    f", expected {capacity - num_free}"
+                    f" (free={num_free}, capacity={capacity})"
+                )
+
+        elif num_occupied is not None:
+            num_free = capacity - num_occupied
+
+        if num_free is not None and capacity:
+            percent_free = round(num_free * 100. / capacity, 2)
+
+    return num_free, num_occupied, percent_free, None
+
+
+def calculate_derived_fields(
+        capacity: Sequence[Optional[int]],
+        num_free: Sequence[Optional[int]],
+        num_occupied: Sequence[Optional[int]],
+        percent_free: Optional[Sequence[Optional[float]]] = None,
+) -> Tuple[List[Optional[int]], List[Optional[int]], List[Optional[float]], List[Optional[str]]]:
+    """
+    Calculate the derived fields of whole columns in one pass,
+    like `ParkingDataBase.update_derived_fields` does for a single row.
+
+    The columns can be lists or any other sequences of equal length
+    (e.g. numpy object arrays).
+
+    :returns tuple of the num_free, num_occupied and percent_free columns
+        and a column of error messages, which is None for each consistent row.
+        Invalid rows keep their passed values.
+    """
+    if percent_free is None:
+        percent_free = [None] * len(capacity)
+
+    columns = ([], [], [], [])
+    for values in zip(capacity, num_free, num_occupied, percent_free):
+        for column, value in zip(columns, derived_values(*values)):
+            column.append(value)
+    return columns
+
 
 class ParkingData(ParkingDataBase):
 
@@ -114,9 +166,24 @@ class ParkingData(ParkingDataBase):
         db_index=True,
     )
 
+    last_seen = models.DateTimeField(
+        verbose_name=_("Last seen"),
+        help_text=_("Datetime of the last snapshot with the same values (UTC)"
+                    ", if stored with changes only"),
+        null=True, blank=True,
+        db_index=True,
+    )
+
     def __str__(self):
         return f"{self.timestamp}/{self.lot.lot_id}"
 
+    @property
+    def end_timestamp(self):
+        """
+        The last timestamp at which the values of this row were scraped
+        """
+        return self.last_seen or self.timestamp
+
 
 class LatestParkingData(ParkingDataBase):
     class Meta:
@@ -0,0 +1,99 @@
+from typing import Dict, Optional
+
+from django.utils.translation import gettext_lazy as _
+from django.db import models
+
+from .parking_data import ParkingLotState
+
+
+class ParkingDataRollupBase(models.Model):
+    """
+    Aggregated ParkingData of one lot in one time bucket.
+
+    Each ParkingData row is counted once in every hour that it covers,
+    so rows stored with changes only are counted until their `last_seen`
+    timestamp. All values can be summed up to larger buckets.
+    """
+
+    class Meta:
+        abstract = True
+        unique_together = [("lot", "timestamp")]
+
+    lot = models.ForeignKey(
+        verbose_name=_("Parking lot"),
+        to="park_data.ParkingLot",
+        on_delete=models.CASCADE,
+    )
+
+    timestamp = models.DateTimeField(
+        verbose_name=_("Timestamp"),
+        help_text=_("Start of the time bucket (UTC)"),
+        db_index=True,
+    )
+
+    num_rows = models.IntegerField(verbose_name=_("Rows"), default=0)
+
+    num_free_count = models.IntegerField(verbose_name=_("Rows with free"), default=0)
+    num_free_sum = models.BigIntegerField(verbose_name=_("Sum of free"), default=0)
+    num_free_min = models.IntegerField(verbose_name=_("Min free"), null=True, blank=True)
+    num_free_max = models.IntegerField(verbose_name=_("Max free"), null=True, blank=True)
+
+    num_occupied_count = models.IntegerField(verbose_name=_("Rows with occupied"), default=0)
+    num_occupied_sum = models.BigIntegerField(verbose_name=_("Sum of occupied"), default=0)
+    num_occupied_min = models.IntegerField(verbose_name=_("Min occupied"), null=True, blank=True)
+    num_occupied_max = models.IntegerField(verbose_name=_("Max occupied"), null=True, blank=True)
+
+    capacity_max = models.IntegerField(verbose_name=_("Max capacity"), null=True, blank=True)
+
+    num_open = models.IntegerField(verbose_name=_("Open"), default=0)
+    num_closed = models.IntegerField(verbose_name=_("Closed"), default=0)
+    num_unknown = models.IntegerField(verbose_name=_("Unknown"), default=0)
+    num_nodata = models.IntegerField(verbose_name=_("No data"), default=0)
+    num_error = models.IntegerField(verbose_name=_("Error"), default=0)
+
+    def __str__(self):
+        return f"{self.lot}/{self.timestamp}"
+
+    @property
+    def num_free_mean(self) -> Optional[float]:
+        if not self.num_free_count:
+            return None
+        return self.num_free_sum / self.num_free_count
+
+    @property
+    def num_occupied_mean(self) -> Optional[float]:
+        if not self.num_occupied_count:
+            return None
+        return self.num_occupied_sum / self.num_occupied_count
+
+    def status_shares(self) -> Dict[str, float]:
+        """
+        Returns the share (0 - 1) of the rows for each `ParkingLotState`
+        """
+        return {
+            status: getattr(self, f"num_{status}") / self.num_rows if self.num_rows else 0.
+            for status in ROLLUP_STATES
+        }
+
+
+ROLLUP_STATES = [
+    ParkingLotState.OPEN,
+    ParkingLotState.CLOSED,
+    ParkingLotState.UNKNOWN,
+    ParkingLotState.NODATA,
+    ParkingLotState.ERROR,
+]
+
+
+class ParkingDataHourly(ParkingDataRollupBase):
+
+    class Meta(ParkingDataRollupBase.Meta):
+        verbose_name = _("Hourly parking data")
+        verbose_name_plural = _("Hourly parking data")
+
+
+class ParkingDataDaily(ParkingDataRollupBase):
+
+    class Meta(ParkingDataRollupBase.Meta):
+        verbose_name = _("Daily parking data")
+        verbose_name_plural = _("Daily parking data")
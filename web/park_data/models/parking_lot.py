@@ -91,6 +91,13 @@ class ParkingLot(TimestampedGeoModel):
         related_name="parking_lots",
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the loaded location and pool, compared after saving in `api_v1.apps`
+        instance._loaded_city_fields = (instance.__dict__.get("location_id"), instance.__dict__.get("pool_id"))
+        return instance
+
     def __str__(self):
         s = self.lot_id
         if self.name:
@@ -52,6 +52,19 @@ class ParkingPool(TimestampedModel):
         max_length=4096,
     )
 
+    snapshot_hash = models.CharField(
+        verbose_name=_("Snapshot hash"),
+        help_text=_("Hash of the last stored snapshot, if stored with skip_unchanged"),
+        max_length=40,
+        null=True, blank=True, editable=False,
+    )
+
+    snapshot_timestamp = models.DateTimeField(
+        verbose_name=_("Snapshot timestamp"),
+        help_text=_("Datetime of the last snapshot with the same hash (UTC)"),
+        null=True, blank=True, editable=False,
+    )
+
     def __str__(self):
         s = self.pool_id
         # if self.name:
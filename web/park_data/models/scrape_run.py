@@ -0,0 +1,143 @@
+import datetime
+from django.utils.translation import gettext_lazy as _
+from django.db import models
+
+
+class ScrapeRun(models.Model):
+    """
+    One call of `pa_scrape scrape` or one discovery cycle of `pa_scrape serve`
+    """
+
+    class Meta:
+        verbose_name = _("Scrape run")
+        verbose_name_plural = _("Scrape runs")
+
+    date_started = models.DateTimeField(
+        verbose_name=_("Started"),
+        default=datetime.datetime.utcnow,
+        db_index=True,
+    )
+
+    date_finished = models.DateTimeField(
+        verbose_name=_("Finished"),
+        null=True, blank=True,
+    )
+
+    command = models.CharField(
+        verbose_name=_("Command"),
+        max_length=16,
+    )
+
+    processes = models.IntegerField(
+        verbose_name=_("Processes"),
+        default=1,
+    )
+
+    options = models.JSONField(
+        verbose_name=_("Options"),
+        help_text=_("Store method, output format and other options"),
+        null=True, blank=True,
+    )
+
+    num_tasks = models.IntegerField(verbose_name=_("Tasks"), default=0)
+    num_snapshots = models.IntegerField(verbose_name=_("Snapshots"), default=0)
+    num_skipped = models.IntegerField(
+        verbose_name=_("Skipped"),
+        help_text=_("Number of unchanged snapshots that have been skipped"),
+        default=0,
+    )
+    num_lots = models.IntegerField(verbose_name=_("Lots"), default=0)
+    num_errors = models.IntegerField(verbose_name=_("Errors"), default=0)
+    num_queries = models.IntegerField(verbose_name=_("Queries"), default=0)
+
+    def __str__(self):
+        return f"{self.date_started.replace(microsecond=0)}/{self.command}"
+
+    @property
+    def seconds(self) -> float:
+        if not self.date_finished:
+            return 0.
+        return (self.date_finished - self.date_started).total_seconds()
+
+
+class ScrapeTask(models.Model):
+    """
+    One call of a scraper module, either for a single pool or for all pools
+    of the module, with the time spent in each phase.
+    """
+
+    class Meta:
+        verbose_name = _("Scrape task")
+        verbose_name_plural = _("Scrape tasks")
+
+    run = models.ForeignKey(
+        verbose_name=_("Run"),
+        to=ScrapeRun,
+        on_delete=models.CASCADE,
+        related_name="tasks",
+    )
+
+    date_started = models.DateTimeField(
+        verbose_name=_("Started"),
+        db_index=True,
+    )
+
+    module_name = models.CharField(
+        verbose_name=_("Module name"),
+        max_length=64,
+        db_index=True,
+    )
+
+    pool_id = models.CharField(
+        verbose_name=_("Pool ID"),
+        help_text=_("Empty if all pools of the module were scraped in one call"),
+        max_length=64,
+        null=True, blank=True,
+        db_index=True,
+    )
+
+    spawn_seconds = models.FloatField(
+        verbose_name=_("Spawn"),
+        help_text=_("Seconds to start the scraper process"),
+        default=0.,
+    )
+
+    scrape_seconds = models.FloatField(
+        verbose_name=_("Scrape"),
+        help_text=_("Seconds waiting for the scraper output"),
+        default=0.,
+    )
+
+    parse_seconds = models.FloatField(
+        verbose_name=_("Parse"),
+        help_text=_("Seconds decoding the scraper output"),
+        default=0.,
+    )
+
+    store_seconds = models.FloatField(
+        verbose_name=_("Store"),
+        help_text=_("Seconds storing the snapshots"),
+        default=0.,
+    )
+
+    num_bytes = models.IntegerField(
+        verbose_name=_("Bytes"),
+        help_text=_("Size of the scraper output"),
+        default=0,
+    )
+
+    num_snapshots = models.IntegerField(verbose_name=_("Snapshots"), default=0)
+    num_skipped = models.IntegerField(verbose_name=_("Skipped"), default=0)
+    num_lots = models.IntegerField(verbose_name=_("Lots"), default=0)
+    num_errors = models.IntegerField(verbose_name=_("Errors"), default=0)
+    num_queries = models.IntegerField(verbose_name=_("Queries"), default=0)
+
+    def __str__(self):
+        n = f"{self.date_started.replace(microsecond=0)}/{self.module_name}"
+        if self.pool_id:
+            n = f"{n}/{self.pool_id}"
+        return n
+
+    @property
+    def seconds(self) -> float:
+        return self.spawn_seconds + self.scrape_seconds + self.parse_seconds + self.store_seconds
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+
+# Sent by `store_snapshot` after a snapshot has been stored or extended,
+#   also by the bulk methods which do not send any model signals.
+#   Arguments: pool_id (str), lot_ids (list of str)
+snapshot_stored = Signal()